@@ -1,18 +1,24 @@
+import click
 import json
 import logging
+import metrics
 import os
 import secrets
 
+from contextvars import ContextVar
 from elody.loader import load_apps, load_policies
 from flask import Flask
 from flask_cors import CORS
 from flask_restful import Api
 from flask_swagger_ui import get_swaggerui_blueprint
+from functools import wraps
 from healthcheck import HealthCheck
 from importlib import import_module
+from inuits_policy_based_auth import RequestContext
 from inuits_policy_based_auth.policy_factory import PolicyFactory
 from rabbitmq_pika_flask import RabbitMQ
 from rabbitmq_pika_flask.ExchangeParams import ExchangeParams
+from storage.exceptions import UnsupportedOperationException
 from storage.storagemanager import StorageManager
 
 if os.getenv("SENTRY_ENABLED", False) in ["True", "true", True]:
@@ -68,6 +74,8 @@ rabbit.init_app(app, "basic", json.loads, json.dumps)
 
 app.register_blueprint(swaggerui_blueprint)
 
+StorageManager()
+
 
 def rabbit_available():
     connection = rabbit.get_connection()
@@ -81,13 +89,148 @@ def storage_available():
     return True, StorageManager().get_storage_engine().check_health()
 
 
+def download_cache_stats():
+    return True, StorageManager().get_storage_engine().get_cache_stats()
+
+
+def document_cache_stats():
+    return True, StorageManager().get_storage_engine().get_document_cache_stats()
+
+
+def replication_stats():
+    return True, StorageManager().get_storage_engine().get_replication_stats()
+
+
 health = HealthCheck()
 if os.getenv("HEALTH_CHECK_EXTERNAL_SERVICES", True) in ["True", "true", True]:
     health.add_check(rabbit_available)
     health.add_check(storage_available)
+if os.getenv("DOWNLOAD_CACHE_DIR"):
+    health.add_check(download_cache_stats)
+if os.getenv("STORAGE_ENGINE") == "tiered":
+    health.add_check(replication_stats)
+health.add_check(document_cache_stats)
 app.add_url_rule("/health", "healthcheck", view_func=lambda: health.run())
+if os.getenv("METRICS_ENABLED", True) in ["True", "true", True]:
+    metrics.init_app(app)
+
+
+def storage_command(name):
+    def decorator(command):
+        @wraps(command)
+        def wrapper(*args, **kwargs):
+            try:
+                return command(*args, **kwargs)
+            except UnsupportedOperationException as ex:
+                raise click.ClickException(str(ex))
+
+        return app.cli.command(name)(wrapper)
+
+    return decorator
+
+
+@storage_command("collect-garbage")
+def collect_garbage():
+    collected = StorageManager().get_storage_engine().collect_garbage()
+    logger.info(f"Deleted {len(collected)} unreferenced blobs")
+
+
+@storage_command("expire-upload-sessions")
+@click.argument("bucket", required=False)
+def expire_upload_sessions(bucket):
+    expired = StorageManager().get_storage_engine().expire_upload_sessions(bucket)
+    logger.info(f"Removed {len(expired)} expired upload sessions")
+
+
+@storage_command("rebuild-blob-index")
+@click.argument("buckets", nargs=-1)
+@click.option("--concurrency", type=int, default=16)
+def rebuild_blob_index(buckets, concurrency):
+    count = (
+        StorageManager()
+        .get_storage_engine()
+        .rebuild_blob_index(list(buckets), concurrency)
+    )
+    logger.info(f"Indexed {count} blob references")
+
+
+@storage_command("rebuild-dedup-index")
+@click.argument("bucket", required=False)
+def rebuild_dedup_index(bucket):
+    count = StorageManager().get_storage_engine().rebuild_dedup_index(bucket)
+    logger.info(f"Indexed {count} files for duplicate detection")
+
 
-policy_factory = PolicyFactory()
+@storage_command("scrub")
+@click.argument("bucket", required=False)
+@click.option("--prefix", "prefixes", multiple=True, default=[""])
+@click.option("--concurrency", type=int, default=16)
+@click.option("--rate", type=float, default=100, help="Maximum S3 requests per second")
+def scrub(bucket, prefixes, concurrency, rate):
+    result = (
+        StorageManager().get_storage_engine().scrub(bucket, prefixes, concurrency, rate)
+    )
+    for mismatch in result["mismatched"]:
+        logger.error(
+            f"{mismatch['key']} has ETag {mismatch['etag']}, expected md5 {mismatch['md5']}"
+        )
+    for error in result["errors"]:
+        logger.error(f"Could not check {error['key']}: {error['message']}")
+    logger.info(
+        f"Checked {result['checked']} files: {result['verified']} verified, "
+        f"{result['unverifiable']} unverifiable, {len(result['mismatched'])} mismatched, "
+        f"{len(result['errors'])} errors"
+    )
+    if result["mismatched"]:
+        raise click.ClickException(f"{len(result['mismatched'])} files are corrupted")
+
+
+class BodylessRequestContext(RequestContext):
+    def _serialize(self):
+        return {
+            "http_request": {
+                "method": self.http_request.method,
+                "path": self.http_request.path,
+                "headers": self.http_request.headers,
+            }
+        }
+
+
+class ContextLocalPolicyFactory(PolicyFactory):
+    __previous_request_context_hash = ContextVar(
+        "previous_request_context_hash", default=None
+    )
+    __user_context = ContextVar("user_context", default=None)
+
+    def __without_body(self, request_context):
+        return BodylessRequestContext(
+            request_context.http_request, request_context.resource_scopes
+        )
+
+    def apply_policies(self, request_context):
+        return super().apply_policies(self.__without_body(request_context))
+
+    def authenticate(self, request_context):
+        return super().authenticate(self.__without_body(request_context))
+
+    @property
+    def _previous_request_context_hash(self):
+        return self.__previous_request_context_hash.get()
+
+    @_previous_request_context_hash.setter
+    def _previous_request_context_hash(self, value):
+        self.__previous_request_context_hash.set(value)
+
+    @property
+    def _user_context(self):
+        return self.__user_context.get()
+
+    @_user_context.setter
+    def _user_context(self, value):
+        self.__user_context.set(value)
+
+
+policy_factory = ContextLocalPolicyFactory()
 load_apps(app, logger)
 try:
     module = import_module("apps.permissions")
@@ -95,14 +238,25 @@ try:
 except ModuleNotFoundError:
     load_policies(policy_factory, logger)
 
-from resources.download import Download, DownloadWithTicket
-from resources.unique import Unique
+from resources.download import (
+    Download,
+    DownloadArchive,
+    DownloadArchiveWithTicket,
+    DownloadWithTicket,
+)
+from resources.unique import Unique, UniqueMultiple
 from resources.upload import (
     Upload,
     UploadWithTicket,
     UploadKey,
     UploadKeyWithTicket,
     UploadTranscode,
+    UploadSession,
+    UploadSessionWithTicket,
+    UploadSessionDetail,
+    UploadSessionDetailWithTicket,
+    UploadSessionPart,
+    UploadSessionPartWithTicket,
 )
 from resources.spec import AsyncAPISpec, OpenAPISpec
 import resources.queues
@@ -114,15 +268,32 @@ if os.getenv("ENABLE_DELETE"):
     api.add_resource(DeleteMultiple, "/delete")
 
 api.add_resource(Download, "/download/<string:key>")
+api.add_resource(DownloadArchive, "/download")
 api.add_resource(DownloadWithTicket, "/download-with-ticket/<string:key>")
+api.add_resource(DownloadArchiveWithTicket, "/download-with-ticket")
 
 api.add_resource(Unique, "/unique/<string:md5sum>")
+api.add_resource(UniqueMultiple, "/unique")
 
 api.add_resource(Upload, "/upload")
 api.add_resource(UploadWithTicket, "/upload-with-ticket")
 api.add_resource(UploadKey, "/upload/<string:key>")
 api.add_resource(UploadKeyWithTicket, "/upload-with-ticket/<string:key>")
 api.add_resource(UploadTranscode, "/upload/transcode")
+api.add_resource(UploadSession, "/upload/sessions")
+api.add_resource(UploadSessionWithTicket, "/upload-with-ticket/sessions")
+api.add_resource(UploadSessionDetail, "/upload/sessions/<string:session_id>")
+api.add_resource(
+    UploadSessionDetailWithTicket, "/upload-with-ticket/sessions/<string:session_id>"
+)
+api.add_resource(
+    UploadSessionPart,
+    "/upload/sessions/<string:session_id>/parts/<int:part_number>",
+)
+api.add_resource(
+    UploadSessionPartWithTicket,
+    "/upload-with-ticket/sessions/<string:session_id>/parts/<int:part_number>",
+)
 
 api.add_resource(AsyncAPISpec, "/spec/dams-csv-importer-events.html")
 api.add_resource(OpenAPISpec, "/spec/dams-storage-api.json")
@@ -0,0 +1,50 @@
+import os
+
+from a2wsgi import WSGIMiddleware
+from app import app as flask_app
+from contextlib import asynccontextmanager
+from metrics import AsyncMetricsMiddleware
+from resources.async_download import Download, DownloadWithTicket
+from resources.async_upload import UploadKey, UploadKeyWithTicket
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.responses import Response
+from starlette.routing import Mount, Route
+from storage.asyncstore import AsyncS3StorageManager
+from storage.storagemanager import StorageManager
+from werkzeug.exceptions import HTTPException
+
+wsgi = WSGIMiddleware(flask_app, workers=int(os.getenv("ASGI_WSGI_WORKERS", 10)))
+
+
+@asynccontextmanager
+async def lifespan(app):
+    app.state.storage = AsyncS3StorageManager(StorageManager().get_storage_engine())
+    app.state.wsgi = wsgi
+    yield
+    await app.state.storage.close()
+
+
+async def handle_http_exception(request, ex):
+    return Response(ex.description, status_code=ex.code)
+
+
+app = Starlette(
+    routes=[
+        Route("/download/{key}", Download),
+        Route("/download-with-ticket/{key}", DownloadWithTicket),
+        Route("/upload/sessions", wsgi),
+        Route("/upload/transcode", wsgi),
+        Route("/upload/{key}", UploadKey),
+        Route("/upload-with-ticket/sessions", wsgi),
+        Route("/upload-with-ticket/{key}", UploadKeyWithTicket),
+        Mount("/", wsgi),
+    ],
+    exception_handlers={HTTPException: handle_http_exception},
+    lifespan=lifespan,
+    middleware=(
+        [Middleware(AsyncMetricsMiddleware)]
+        if os.getenv("METRICS_ENABLED", True) in ["True", "true", True]
+        else []
+    ),
+)
@@ -0,0 +1,75 @@
+import argparse
+import hashlib
+import io
+import json
+import os
+import time
+
+from humanfriendly import parse_size
+from storage.hashing import get_digest_algorithms
+from storage.ingest import IngestStream
+
+
+def hash_with_md5_loop(data, chunk_size, algorithms, buffer_size):
+    md5 = hashlib.md5()
+    for start in range(0, len(data), chunk_size):
+        md5.update(data[start : start + chunk_size])
+    return {"md5": md5.hexdigest()}
+
+
+def hash_with_ingest_stream(data, chunk_size, algorithms, buffer_size):
+    ingest = IngestStream(io.BytesIO(data), 0, algorithms, buffer_size)
+    while ingest.read(chunk_size):
+        pass
+    return ingest.get_digests()
+
+
+def measure(function, data, iterations, *args):
+    timings = list()
+    for _ in range(iterations):
+        start = time.perf_counter()
+        function(data, *args)
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    median = timings[len(timings) // 2]
+    return {
+        "median_ms": median * 1000,
+        "min_ms": timings[0] * 1000,
+        "max_ms": timings[-1] * 1000,
+        "throughput_mib_s": len(data) / median / 1048576,
+    }
+
+
+def main():
+    argument_parser = argparse.ArgumentParser(
+        description="Compare the legacy md5 loop with parallel content hashing"
+    )
+    argument_parser.add_argument("--size", default="512 MiB")
+    argument_parser.add_argument("--chunk-sizes", default="8 KiB,1 MiB,8 MiB")
+    argument_parser.add_argument("--buffer-size", default="4 MiB")
+    argument_parser.add_argument("--iterations", type=int, default=5)
+    arguments = argument_parser.parse_args()
+    data = os.urandom(parse_size(arguments.size))
+    buffer_size = parse_size(arguments.buffer_size)
+    results = list()
+    for chunk_size in [parse_size(size) for size in arguments.chunk_sizes.split(",")]:
+        result = {"size": len(data), "chunk_size": chunk_size}
+        for name, function, algorithms in [
+            ("md5_loop", hash_with_md5_loop, ["md5"]),
+            ("md5", hash_with_ingest_stream, ["md5"]),
+            ("md5_blake3", hash_with_ingest_stream, ["md5", "blake3"]),
+        ]:
+            result[name] = measure(
+                function,
+                data,
+                arguments.iterations,
+                chunk_size,
+                get_digest_algorithms(algorithms),
+                buffer_size,
+            )
+        results.append(result)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
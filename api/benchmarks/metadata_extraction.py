@@ -0,0 +1,101 @@
+import argparse
+import io
+import json
+import os
+import tempfile
+import time
+
+from humanfriendly import parse_size
+from PIL import Image
+from storage.exceptions import UnsupportedImageException
+from storage.metadata import get_image_metadata
+
+CORPUS = [
+    ("large.jpg", "JPEG", (12000, 9000), {"quality": 90}),
+    ("large.png", "PNG", (8000, 6000), {"compress_level": 1}),
+    ("large.tif", "TIFF", (10000, 10000), {}),
+    ("multipage.tif", "TIFF", (4000, 4000), {"pages": 20}),
+]
+
+
+def create_corpus(directory):
+    paths = list()
+    for name, image_format, size, options in CORPUS:
+        path = os.path.join(directory, name)
+        paths.append(path)
+        if os.path.exists(path):
+            continue
+        exif = Image.Exif()
+        exif[0x010F] = "Benchmark camera"
+        exif[0x0132] = "2024:01:01 12:00:00"
+        options = dict(options)
+        image = Image.new("RGB", size, (155, 0, 0))
+        if pages := options.pop("pages", None):
+            options["save_all"] = True
+            options["append_images"] = [image] * (pages - 1)
+        image.save(path, image_format, exif=exif, **options)
+    return paths
+
+
+def extract_with_pil(header):
+    image = Image.open(header)
+    return image.getexif()._get_merged_dict(), image.size, image.mode
+
+
+def extract_with_header_parser(header):
+    return get_image_metadata(header.getvalue())
+
+
+def measure(function, header, iterations):
+    timings = list()
+    for _ in range(iterations):
+        header.seek(0)
+        start = time.perf_counter()
+        function(header)
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    return {
+        "median_ms": timings[len(timings) // 2] * 1000,
+        "min_ms": timings[0] * 1000,
+        "max_ms": timings[-1] * 1000,
+    }
+
+
+def main():
+    argument_parser = argparse.ArgumentParser(
+        description="Compare PIL and header based technical metadata extraction"
+    )
+    argument_parser.add_argument("--corpus", help="directory with images to measure")
+    argument_parser.add_argument("--header-size", default="4 MiB")
+    argument_parser.add_argument("--iterations", type=int, default=20)
+    arguments = argument_parser.parse_args()
+    header_size = parse_size(arguments.header_size)
+    corpus = arguments.corpus or os.path.join(
+        tempfile.gettempdir(), "storage-metadata-corpus"
+    )
+    os.makedirs(corpus, exist_ok=True)
+    paths = (
+        [os.path.join(corpus, name) for name in sorted(os.listdir(corpus))]
+        if arguments.corpus
+        else create_corpus(corpus)
+    )
+    results = list()
+    Image.MAX_IMAGE_PIXELS = None
+    for path in paths:
+        with open(path, "rb") as file:
+            header = io.BytesIO(file.read(header_size))
+        result = {"file": os.path.basename(path), "size": os.path.getsize(path)}
+        for name, function in [
+            ("pil", extract_with_pil),
+            ("header_parser", extract_with_header_parser),
+        ]:
+            try:
+                result[name] = measure(function, header, arguments.iterations)
+            except (OSError, SyntaxError, UnsupportedImageException) as ex:
+                result[name] = {"error": str(ex)}
+        results.append(result)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
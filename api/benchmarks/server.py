@@ -0,0 +1,4 @@
+from app import app, rabbit
+from asgi import app as asgi_app
+
+rabbit.send = lambda *args, **kwargs: None
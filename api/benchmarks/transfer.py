@@ -0,0 +1,360 @@
+import argparse
+import boto3
+import json
+import logging
+import os
+import platform
+import random
+import requests
+import shlex
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from humanfriendly import format_size, parse_size
+from moto.server import ThreadedMotoServer
+from uuid import uuid4
+
+API_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BUCKET = "benchmark"
+RANGE_PATTERNS = {
+    "full": lambda size: None,
+    "first_64k": lambda size: "bytes=0-65535",
+    "suffix_64k": lambda size: "bytes=-65536",
+    "random_1m": lambda size: __get_random_range(size, 1048576),
+}
+WORKER_CLASSES = {
+    "sync": "sync",
+    "gthread": "gthread",
+    "asgi": "uvicorn.workers.UvicornWorker",
+}
+
+
+class CollectionApiStub(BaseHTTPRequestHandler):
+    def do_GET(self):
+        _, collection, document_id = self.path.split("?")[0].split("/")[:3]
+        if collection == "tickets":
+            return self.__send_json(
+                {
+                    "_id": document_id,
+                    "bucket": BUCKET,
+                    "location": document_id,
+                    "mediafile_id": "benchmark",
+                    "is_expired": False,
+                    "exp": time.time() + 3600,
+                }
+            )
+        self.__send_json(
+            {
+                "_id": document_id,
+                "identifiers": [],
+                "filename": "benchmark.bin",
+                "metadata": [],
+                "original_file_location": "/download/benchmark.bin",
+            }
+        )
+
+    def do_POST(self):
+        self.__read_body()
+        self.__send_json(dict(), 201)
+
+    def do_PUT(self):
+        self.__send_json(json.loads(self.__read_body()))
+
+    def log_message(self, format, *args):
+        pass
+
+    def __read_body(self):
+        return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+    def __send_json(self, document, status=200):
+        body = json.dumps(document).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class UploadBody:
+    def __init__(self, data):
+        self.parts = [memoryview(os.urandom(16)), memoryview(data)]
+        self.length = len(data) + 16
+
+    def __len__(self):
+        return self.length
+
+    def read(self, size=-1):
+        while self.parts and not self.parts[0]:
+            self.parts.pop(0)
+        if not self.parts:
+            return b""
+        size = len(self.parts[0]) if size is None or size < 0 else size
+        chunk, self.parts[0] = self.parts[0][:size], self.parts[0][size:]
+        return bytes(chunk)
+
+
+class StorageServer:
+    def __init__(self, worker_model, environment, gunicorn_args):
+        worker_class, _, scale = worker_model.partition(":")
+        workers, _, threads = (scale or "1").partition("x")
+        self.worker_model = worker_model
+        self.port = get_free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        self.log = tempfile.NamedTemporaryFile(
+            prefix="storage-benchmark-", delete=False
+        )
+        self.command = [
+            sys.executable,
+            "-m",
+            "gunicorn",
+            "-b",
+            f"127.0.0.1:{self.port}",
+            "--timeout",
+            "0",
+            "-w",
+            workers,
+            "-k",
+            WORKER_CLASSES[worker_class],
+            *(["--threads", threads] if threads else []),
+            *shlex.split(gunicorn_args),
+            (
+                "benchmarks.server:asgi_app"
+                if worker_class == "asgi"
+                else "benchmarks.server:app"
+            ),
+        ]
+        self.environment = environment | {"STORAGE_API_URL": f"{self.url}/storage/v1/"}
+        self.process = None
+
+    def __enter__(self):
+        self.process = subprocess.Popen(
+            self.command,
+            cwd=API_DIRECTORY,
+            env=self.environment,
+            stdout=self.log,
+            stderr=subprocess.STDOUT,
+        )
+        deadline = time.monotonic() + 60
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                break
+            try:
+                requests.get(f"{self.url}/health", timeout=1)
+                return self
+            except requests.RequestException:
+                time.sleep(0.2)
+        self.__exit__()
+        raise Exception(f"Storage API did not start, see {self.log.name}")
+
+    def __exit__(self, *args):
+        if self.process.poll() is None:
+            self.process.terminate()
+            self.process.wait(30)
+
+
+def __get_random_range(size, length):
+    start = random.randrange(max(size - length, 0) + 1)
+    return f"bytes={start}-{start + length - 1}"
+
+
+def get_free_port():
+    with socket.socket() as free_socket:
+        free_socket.bind(("127.0.0.1", 0))
+        return free_socket.getsockname()[1]
+
+
+def get_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=API_DIRECTORY,
+            capture_output=True,
+            check=True,
+            text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def measure(function, count, concurrency):
+    local = threading.local()
+
+    def timed_request(_):
+        if not hasattr(local, "session"):
+            local.session = requests.Session()
+        start = time.perf_counter()
+        try:
+            size = function(local.session)
+        except Exception:
+            return None
+        return time.perf_counter() - start, size
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as executor:
+        results = list(executor.map(timed_request, range(count)))
+    duration = time.perf_counter() - start
+    timings = sorted(result[0] for result in results if result)
+    transferred = sum(result[1] for result in results if result)
+    return {
+        "requests": count,
+        "errors": count - len(timings),
+        "duration_s": duration,
+        "requests_per_s": len(timings) / duration,
+        "throughput_mib_s": transferred / duration / 1048576,
+        "latency_ms": (
+            {
+                "p50": timings[len(timings) // 2] * 1000,
+                "p90": timings[int(len(timings) * 0.9)] * 1000,
+                "p99": timings[int(len(timings) * 0.99)] * 1000,
+                "max": timings[-1] * 1000,
+            }
+            if timings
+            else None
+        ),
+    }
+
+
+def upload(url, data):
+    def request(session):
+        key = f"{uuid4()}.bin"
+        response = session.post(
+            f"{url}/upload-with-ticket/{key}?ticket_id={key}",
+            data=UploadBody(data),
+            headers={"Content-Type": "application/octet-stream"},
+        )
+        if response.status_code != 201:
+            raise Exception(response.text)
+        return len(data)
+
+    return request
+
+
+def download(url, key, size, range_pattern):
+    def request(session):
+        range = RANGE_PATTERNS[range_pattern](size)
+        response = session.get(
+            f"{url}/download-with-ticket/{key}?ticket_id={key}",
+            headers={"Range": range} if range else None,
+            stream=True,
+        )
+        if response.status_code != (206 if range else 200):
+            raise Exception(response.status_code)
+        return sum(len(chunk) for chunk in response.iter_content(1048576))
+
+    return request
+
+
+def main():
+    argument_parser = argparse.ArgumentParser(
+        description="Measure upload and download throughput of the storage API"
+    )
+    argument_parser.add_argument("--sizes", default="64 KiB,8 MiB,64 MiB")
+    argument_parser.add_argument("--concurrency", default="1,8,32")
+    argument_parser.add_argument("--ranges", default=",".join(RANGE_PATTERNS))
+    argument_parser.add_argument(
+        "--worker-models",
+        default="sync:4,gthread:4x8,asgi:4",
+        help="gunicorn worker models as class:workers[xthreads]",
+    )
+    argument_parser.add_argument("--requests", type=int, default=64)
+    argument_parser.add_argument("--gunicorn-args", default="")
+    argument_parser.add_argument(
+        "--s3-endpoint", help="use an existing S3 endpoint instead of moto"
+    )
+    argument_parser.add_argument("--output", help="write the results to a file")
+    arguments = argument_parser.parse_args()
+    sizes = [parse_size(size) for size in arguments.sizes.split(",")]
+    concurrencies = [int(level) for level in arguments.concurrency.split(",")]
+    range_patterns = arguments.ranges.split(",")
+    s3_server = None
+    if not (s3_endpoint := arguments.s3_endpoint):
+        logging.getLogger("werkzeug").setLevel(logging.ERROR)
+        port = get_free_port()
+        s3_server = ThreadedMotoServer(port=port, verbose=False)
+        s3_server.start()
+        s3_endpoint = f"http://127.0.0.1:{port}"
+    collection_api = ThreadingHTTPServer(("127.0.0.1", 0), CollectionApiStub)
+    threading.Thread(target=collection_api.serve_forever, daemon=True).start()
+    environment = os.environ | {
+        "MINIO_ENDPOINT": s3_endpoint,
+        "MINIO_ACCESS_KEY": os.getenv("MINIO_ACCESS_KEY", "benchmark"),
+        "MINIO_SECRET_KEY": os.getenv("MINIO_SECRET_KEY", "benchmark"),
+        "MINIO_BUCKET": BUCKET,
+        "COLLECTION_API_URL": f"http://127.0.0.1:{collection_api.server_port}",
+        "HEALTH_CHECK_EXTERNAL_SERVICES": "false",
+    }
+    s3 = boto3.resource(
+        "s3",
+        endpoint_url=s3_endpoint,
+        aws_access_key_id=environment["MINIO_ACCESS_KEY"],
+        aws_secret_access_key=environment["MINIO_SECRET_KEY"],
+    )
+    s3.create_bucket(Bucket=BUCKET)
+    for size in sizes:
+        s3.Bucket(BUCKET).put_object(Key=f"download-{size}.bin", Body=os.urandom(size))
+    results = list()
+    try:
+        for worker_model in arguments.worker_models.split(","):
+            with StorageServer(
+                worker_model, environment, arguments.gunicorn_args
+            ) as server:
+                for size in sizes:
+                    data = os.urandom(size)
+                    key = f"download-{size}.bin"
+                    for concurrency in concurrencies:
+                        scenarios = [("upload", "full", upload(server.url, data))] + [
+                            (
+                                "download",
+                                range_pattern,
+                                download(server.url, key, size, range_pattern),
+                            )
+                            for range_pattern in range_patterns
+                        ]
+                        for operation, range_pattern, function in scenarios:
+                            result = {
+                                "operation": operation,
+                                "worker_model": worker_model,
+                                "size": size,
+                                "range": range_pattern,
+                                "concurrency": concurrency,
+                            }
+                            result |= measure(function, arguments.requests, concurrency)
+                            results.append(result)
+                            print(
+                                f"{worker_model} {operation} {format_size(size, binary=True)} "
+                                f"{range_pattern} x{concurrency}: "
+                                f"{result['throughput_mib_s']:.1f} MiB/s",
+                                file=sys.stderr,
+                            )
+    finally:
+        collection_api.shutdown()
+        if s3_server:
+            s3_server.stop()
+    report = json.dumps(
+        {
+            "commit": get_commit(),
+            "date": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "cpu_count": os.cpu_count(),
+            "s3_endpoint": arguments.s3_endpoint or "moto",
+            "gunicorn_args": arguments.gunicorn_args,
+            "results": results,
+        },
+        indent=2,
+    )
+    if arguments.output:
+        with open(arguments.output, "w") as output:
+            output.write(report)
+    else:
+        print(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,280 @@
+import os
+import time
+
+from flask import Response, request
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+)
+from prometheus_client.multiprocess import MultiProcessCollector
+
+DURATION_BUCKETS = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1,
+    2.5,
+    5,
+    10,
+    30,
+    60,
+    120,
+    300,
+)
+
+REQUEST_DURATION = Histogram(
+    "storage_http_request_duration_seconds",
+    "Time until the response body was sent, by endpoint",
+    ["method", "endpoint", "status"],
+    buckets=DURATION_BUCKETS,
+)
+RECEIVED_BYTES = Counter(
+    "storage_http_received_bytes",
+    "Request body bytes read, by endpoint",
+    ["method", "endpoint"],
+)
+SENT_BYTES = Counter(
+    "storage_http_sent_bytes",
+    "Response body bytes sent, by endpoint",
+    ["method", "endpoint"],
+)
+ACTIVE_TRANSFERS = Gauge(
+    "storage_active_transfers",
+    "Requests currently being handled",
+    ["method"],
+    multiprocess_mode="livesum",
+)
+STAGE_DURATION = Histogram(
+    "storage_stage_duration_seconds",
+    "Time spent in a stage of the upload and download pipeline",
+    ["stage"],
+    buckets=DURATION_BUCKETS,
+)
+S3_REQUESTS = Counter(
+    "storage_s3_requests",
+    "S3 API calls, by operation and HTTP status",
+    ["operation", "status"],
+)
+S3_REQUEST_DURATION = Histogram(
+    "storage_s3_request_duration_seconds",
+    "S3 API call latency, by operation",
+    ["operation"],
+    buckets=DURATION_BUCKETS,
+)
+COLLECTION_API_REQUEST_DURATION = Histogram(
+    "storage_collection_api_request_duration_seconds",
+    "Collection API call latency until the response headers arrived",
+    ["method", "status"],
+    buckets=DURATION_BUCKETS,
+)
+
+
+class CountingStream:
+    def __init__(self, stream):
+        self.stream = stream
+        self.size = 0
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+    def __iter__(self):
+        for line in self.stream:
+            self.size += len(line)
+            yield line
+
+    def read(self, *args):
+        data = self.stream.read(*args)
+        self.size += len(data)
+        return data
+
+    def readinto(self, buffer):
+        if hasattr(self.stream, "readinto"):
+            size = self.stream.readinto(buffer) or 0
+        else:
+            data = self.stream.read(len(buffer))
+            size = len(data)
+            buffer[:size] = data
+        self.size += size
+        return size
+
+    def readline(self, *args):
+        line = self.stream.readline(*args)
+        self.size += len(line)
+        return line
+
+    def readlines(self, *args):
+        lines = self.stream.readlines(*args)
+        self.size += sum(len(line) for line in lines)
+        return lines
+
+
+class MetricsMiddleware:
+    def __init__(self, wsgi_app):
+        self.wsgi_app = wsgi_app
+
+    def __call__(self, environ, start_response):
+        start = time.perf_counter()
+        method = environ["REQUEST_METHOD"]
+        response = dict()
+        environ["wsgi.input"] = body = CountingStream(environ["wsgi.input"])
+        if scope := environ.get("asgi.scope"):
+            scope["metrics.recorded"] = True
+        else:
+            ACTIVE_TRANSFERS.labels(method).inc()
+
+        def record(sent):
+            endpoint = environ.get("metrics.endpoint", "none")
+            REQUEST_DURATION.labels(
+                method, endpoint, response.get("status", "500")
+            ).observe(time.perf_counter() - start)
+            RECEIVED_BYTES.labels(method, endpoint).inc(body.size)
+            SENT_BYTES.labels(method, endpoint).inc(sent)
+            if not scope:
+                ACTIVE_TRANSFERS.labels(method).dec()
+
+        def metrics_start_response(status, headers, exc_info=None):
+            response["status"] = status.split(" ", 1)[0]
+            for name, value in headers:
+                if name.lower() == "content-length":
+                    response["content_length"] = int(value)
+            return start_response(status, headers, exc_info)
+
+        try:
+            iterable = self.wsgi_app(environ, metrics_start_response)
+        except Exception:
+            record(0)
+            raise
+        file_wrapper = environ.get("wsgi.file_wrapper")
+        if file_wrapper and isinstance(iterable, file_wrapper):
+            record(response.get("content_length", 0))
+            return iterable
+        return self.__iter_response(iterable, record)
+
+    def __iter_response(self, iterable, record):
+        sent = 0
+        try:
+            for chunk in iterable:
+                sent += len(chunk)
+                yield chunk
+        finally:
+            if hasattr(iterable, "close"):
+                iterable.close()
+            record(sent)
+
+
+class AsyncMetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        start = time.perf_counter()
+        method = scope["method"]
+        transfer = {"status": "500", "received": 0, "sent": 0}
+
+        async def metrics_receive():
+            message = await receive()
+            transfer["received"] += len(message.get("body", b""))
+            return message
+
+        async def metrics_send(message):
+            if message["type"] == "http.response.start":
+                transfer["status"] = str(message["status"])
+            elif message["type"] == "http.response.body":
+                transfer["sent"] += len(message.get("body", b""))
+            await send(message)
+
+        ACTIVE_TRANSFERS.labels(method).inc()
+        try:
+            await self.app(scope, metrics_receive, metrics_send)
+        finally:
+            ACTIVE_TRANSFERS.labels(method).dec()
+            if not scope.get("metrics.recorded"):
+                endpoint = getattr(scope.get("endpoint"), "__name__", "none").lower()
+                REQUEST_DURATION.labels(method, endpoint, transfer["status"]).observe(
+                    time.perf_counter() - start
+                )
+                RECEIVED_BYTES.labels(method, endpoint).inc(transfer["received"])
+                SENT_BYTES.labels(method, endpoint).inc(transfer["sent"])
+
+
+def get_metrics():
+    registry = REGISTRY
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        MultiProcessCollector(registry)
+    return Response(generate_latest(registry), mimetype=CONTENT_TYPE_LATEST)
+
+
+def init_app(app):
+    app.before_request(__set_endpoint)
+    app.add_url_rule("/metrics", "metrics", view_func=get_metrics)
+    app.wsgi_app = MetricsMiddleware(app.wsgi_app)
+
+
+def instrument_s3_client(client):
+    client.meta.events.register("before-call.s3", __start_s3_request)
+    client.meta.events.register("after-call.s3", __finish_s3_request)
+    client.meta.events.register("after-call-error.s3", __fail_s3_request)
+
+
+def instrument_session(session):
+    session.hooks["response"].append(__observe_collection_api_request)
+
+
+def observe_collection_api_request(method, status, duration):
+    COLLECTION_API_REQUEST_DURATION.labels(method, str(status)).observe(duration)
+
+
+def observe_s3_request(operation, status, duration):
+    S3_REQUESTS.labels(operation, str(status)).inc()
+    S3_REQUEST_DURATION.labels(operation).observe(duration)
+
+
+def observe_stage(stage, duration):
+    STAGE_DURATION.labels(stage).observe(duration)
+
+
+def time_stage(stage):
+    return STAGE_DURATION.labels(stage).time()
+
+
+def __fail_s3_request(exception, context, **kwargs):
+    if start := context.get("metrics.start"):
+        observe_s3_request(
+            context["metrics.operation"], "error", time.perf_counter() - start
+        )
+
+
+def __finish_s3_request(http_response, model, context, **kwargs):
+    if start := context.get("metrics.start"):
+        observe_s3_request(
+            model.name, http_response.status_code, time.perf_counter() - start
+        )
+
+
+def __observe_collection_api_request(response, *args, **kwargs):
+    observe_collection_api_request(
+        response.request.method,
+        response.status_code,
+        response.elapsed.total_seconds(),
+    )
+
+
+def __set_endpoint():
+    request.environ["metrics.endpoint"] = request.endpoint or "none"
+
+
+def __start_s3_request(model, context, **kwargs):
+    context["metrics.start"] = time.perf_counter()
+    context["metrics.operation"] = model.name
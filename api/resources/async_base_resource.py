@@ -0,0 +1,182 @@
+import os
+
+from app import app, policy_factory, rabbit
+from elody.error_codes import ErrorCode, get_error_code, get_write
+from elody.exceptions import (
+    DuplicateFileException,
+    FileNotFoundException,
+    NotFoundException,
+)
+from elody.job import start_job, finish_job, fail_job
+from elody.util import get_mimetype_from_filename
+from flask import request as flask_request
+from inuits_policy_based_auth import RequestContext
+from inuits_policy_based_auth.exceptions import NoUserContextException
+from starlette.concurrency import run_in_threadpool
+from starlette.endpoints import HTTPEndpoint
+from starlette.responses import Response, StreamingResponse
+from storage.engine import is_immutable_key
+from storage.exceptions import InvalidRangeException
+from storage.s3store import S3StorageManager
+from werkzeug.http import http_date
+
+
+class AsyncBaseResource(HTTPEndpoint):
+    def __init__(self, scope, receive, send):
+        super().__init__(scope, receive, send)
+        self.storage = scope["app"].state.storage
+        self.wsgi = scope["app"].state.wsgi
+        self.cache_control = os.getenv(
+            "DOWNLOAD_CACHE_CONTROL", "max-age=31536000, immutable"
+        )
+        self.mutable_cache_control = os.getenv(
+            "DOWNLOAD_MUTABLE_CACHE_CONTROL", "no-cache"
+        )
+        self.presigned_urls = os.getenv("PRESIGNED_URLS", False) in [
+            "True",
+            "true",
+            True,
+        ]
+
+    def __authenticate(self, request, authenticate):
+        with app.test_request_context(
+            request.url.path,
+            method=request.method,
+            headers=list(request.headers.items()),
+            query_string=request.url.query,
+        ):
+            if authenticate:
+                return policy_factory.authenticate(RequestContext(flask_request))(
+                    self.__get_request_context
+                )()
+            return self.__get_request_context()
+
+    def __get_auth_headers(self):
+        try:
+            tenant = policy_factory.get_user_context().x_tenant.id
+        except NoUserContextException:
+            tenant = flask_request.headers.get("apikey", os.getenv("STATIC_APIKEY"))
+        if tenant:
+            return {
+                "Authorization": f'Bearer {os.getenv("STATIC_JWT")}',
+                "apikey": tenant,
+            }
+        else:
+            return {"Authorization": f'Bearer {os.getenv("STATIC_JWT")}'}
+
+    def __get_cache_headers(self, key, file_object):
+        headers = dict()
+        if etag := file_object.get("etag"):
+            headers["ETag"] = etag
+        if last_modified := file_object.get("last_modified"):
+            headers["Last-Modified"] = http_date(last_modified)
+        headers["Cache-Control"] = (
+            self.cache_control if is_immutable_key(key) else self.mutable_cache_control
+        )
+        return headers
+
+    def __get_mediafile_id(self, request, ticket=None):
+        if not (mediafile_id := request.query_params.get("id")) and not ticket:
+            raise NotFoundException(
+                f"{get_error_code(ErrorCode.PROVIDE_MEDIAFILE_ID_OR_TICKET_ID, get_write())} Provide either a mediafile ID or a ticket ID"
+            )
+        if not mediafile_id and "mediafile_id" in ticket:
+            mediafile_id = ticket.get("mediafile_id")
+        return mediafile_id
+
+    def __get_request_context(self):
+        return self.__get_auth_headers(), self.__get_uploader()
+
+    def __get_uploader(self):
+        try:
+            return policy_factory.get_user_context().email or "default_uploader"
+        except NoUserContextException:
+            return "default_uploader"
+
+    async def _authenticate(self, request, authenticate=True):
+        return await run_in_threadpool(self.__authenticate, request, authenticate)
+
+    async def _get_ticket(self, ticket_id, api_key_hash=None, auth_headers=None):
+        if not ticket_id:
+            raise Exception(
+                f"{get_error_code(ErrorCode.NO_TICKET_ID_SPECIFIED, get_write())} No ticket id given"
+            )
+        return await self.storage.get_ticket(ticket_id, api_key_hash, auth_headers)
+
+    async def _handle_file_download(self, request, key, ticket=None):
+        content_type = get_mimetype_from_filename(key)
+        range = request.headers.get("Range")
+        try:
+            file_object = await self.storage.download_file(key, range, ticket)
+        except FileNotFoundException as ex:
+            return Response(str(ex), status_code=404)
+        except InvalidRangeException:
+            file_info = await self.storage.head_file(key, ticket)
+            return Response(
+                status_code=416,
+                headers={
+                    "Accept-Ranges": "bytes",
+                    "Content-Range": f"bytes */{file_info['content_length']}",
+                },
+            )
+        headers = self.__get_cache_headers(key, file_object)
+        headers["Accept-Ranges"] = "bytes"
+        headers["Content-Length"] = str(file_object["content_length"])
+        if content_range := file_object.get("content_range"):
+            headers["Content-Range"] = content_range
+        return StreamingResponse(
+            self.storage.get_stream_generator(file_object["stream"]),
+            status_code=206 if content_range else 200,
+            headers=headers,
+            media_type=content_type,
+        )
+
+    async def _handle_file_upload(
+        self, request, key, auth_headers, uploader, ticket=None
+    ):
+        job_id = None
+        try:
+            job_id = await run_in_threadpool(
+                lambda: start_job(
+                    f"Upload {key}",
+                    "File upload",
+                    get_rabbit=lambda: rabbit,
+                    user_email=request.query_params.get("user_email") or uploader,
+                    parent_id=request.query_params.get("parent_job_id"),
+                )
+            )
+            mediafile_id = self.__get_mediafile_id(request, ticket)
+            await self.storage.upload_file(
+                request.stream(), mediafile_id, key, ticket, auth_headers
+            )
+        except Exception as ex:
+            if job_id:
+                await run_in_threadpool(
+                    lambda: fail_job(job_id, str(ex), get_rabbit=lambda: rabbit)
+                )
+            return Response(
+                str(ex),
+                status_code=409 if isinstance(ex, DuplicateFileException) else 400,
+            )
+        await run_in_threadpool(lambda: finish_job(job_id, get_rabbit=lambda: rabbit))
+        return Response("", status_code=201)
+
+    def _is_delegated_upload(self, request):
+        storage_manager = self.storage.storage_manager
+        return (
+            request.headers.get("Content-Type", "").startswith("multipart/form-data")
+            or "md5" in request.query_params
+            or not isinstance(
+                getattr(storage_manager, "storage_manager", storage_manager),
+                S3StorageManager,
+            )
+        )
+
+    def _is_delegated_download(self, request):
+        return (
+            self.presigned_urls
+            or not isinstance(self.storage.storage_manager, S3StorageManager)
+            or "," in request.headers.get("Range", "")
+            or "If-None-Match" in request.headers
+            or "If-Modified-Since" in request.headers
+        )
@@ -0,0 +1,34 @@
+from resources.async_base_resource import AsyncBaseResource
+from starlette.responses import Response
+
+
+class Download(AsyncBaseResource):
+    async def get(self, request):
+        if self._is_delegated_download(request):
+            return self.wsgi
+        await self._authenticate(request)
+        return await self._handle_file_download(request, request.path_params["key"])
+
+    async def head(self, request):
+        return self.wsgi
+
+
+class DownloadWithTicket(AsyncBaseResource):
+    async def get(self, request):
+        if self._is_delegated_download(request):
+            return self.wsgi
+        try:
+            auth_headers, _ = await self._authenticate(request, authenticate=False)
+            ticket = await self._get_ticket(
+                request.query_params.get("ticket_id"),
+                request.query_params.get("api_key_hash"),
+                auth_headers,
+            )
+        except Exception as ex:
+            return Response(str(ex), status_code=400)
+        return await self._handle_file_download(
+            request, request.path_params["key"], ticket=ticket
+        )
+
+    async def head(self, request):
+        return self.wsgi
@@ -0,0 +1,30 @@
+from resources.async_base_resource import AsyncBaseResource
+from starlette.responses import Response
+
+
+class UploadKey(AsyncBaseResource):
+    async def post(self, request):
+        if self._is_delegated_upload(request):
+            return self.wsgi
+        auth_headers, uploader = await self._authenticate(request)
+        return await self._handle_file_upload(
+            request, request.path_params["key"], auth_headers, uploader
+        )
+
+
+class UploadKeyWithTicket(AsyncBaseResource):
+    async def post(self, request):
+        if self._is_delegated_upload(request):
+            return self.wsgi
+        try:
+            auth_headers, uploader = await self._authenticate(
+                request, authenticate=False
+            )
+            ticket = await self._get_ticket(
+                request.query_params.get("ticket_id"), auth_headers=auth_headers
+            )
+        except Exception as ex:
+            return Response(str(ex), status_code=400)
+        return await self._handle_file_upload(
+            request, request.path_params["key"], auth_headers, uploader, ticket
+        )
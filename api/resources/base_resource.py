@@ -1,10 +1,7 @@
+import io
 import os
-import re
-import requests
-import shutil
-import tempfile
 
-from app import policy_factory, rabbit
+from app import logger, policy_factory, rabbit
 from elody.error_codes import ErrorCode, get_error_code, get_write
 from elody.exceptions import (
     DuplicateFileException,
@@ -12,19 +9,48 @@ from elody.exceptions import (
     FileNotFoundException,
 )
 from elody.job import start_job, finish_job, fail_job
-from elody.util import get_mimetype_from_filename
-from flask import request, Response, stream_with_context
+from elody.util import get_mimetype_from_filename, send_cloudevent
+from flask import redirect, request, Response, stream_with_context
 from flask_restful import Resource, abort
+from humanfriendly import parse_size
 from inuits_policy_based_auth.exceptions import NoUserContextException
+from storage.archive import head_files, stream_archive
+from storage.cache import CachedFileStream
+from storage.engine import is_immutable_key
+from storage.exceptions import InvalidRangeException, UnsupportedOperationException
 from storage.storagemanager import StorageManager
+from uuid import uuid4
 from werkzeug.datastructures import Headers
+from werkzeug.http import http_date, is_resource_modified
+from werkzeug.wsgi import wrap_file
 
 
 class BaseResource(Resource):
     def __init__(self):
         self.auth_headers = self.__get_auth_headers()
-        self.storage = StorageManager().get_storage_engine(self.auth_headers)
+        self.storage = StorageManager().get_storage_engine()
         self.collection_api_url = os.getenv("COLLECTION_API_URL")
+        self.cache_control = os.getenv(
+            "DOWNLOAD_CACHE_CONTROL", "max-age=31536000, immutable"
+        )
+        self.mutable_cache_control = os.getenv(
+            "DOWNLOAD_MUTABLE_CACHE_CONTROL", "no-cache"
+        )
+        self.max_byte_ranges = int(os.getenv("MAX_BYTE_RANGES", 16))
+        self.presigned_urls = os.getenv("PRESIGNED_URLS", False) in [
+            "True",
+            "true",
+            True,
+        ]
+        self.archive_head_concurrency = int(os.getenv("ARCHIVE_HEAD_CONCURRENCY", 16))
+        self.archive_prefetch = int(os.getenv("ARCHIVE_PREFETCH", 4))
+        self.archive_prefetch_size = parse_size(
+            os.getenv("ARCHIVE_PREFETCH_SIZE", "8 MiB")
+        )
+
+    def __close_file(self, file):
+        if hasattr(file, "close"):
+            file.close()
 
     def __get_auth_headers(self):
         try:
@@ -39,24 +65,114 @@ class BaseResource(Resource):
         else:
             return {"Authorization": f'Bearer {os.getenv("STATIC_JWT")}'}
 
-    def __get_byte_range(self, range_header):
-        g = re.search("(\d+)-(\d*)", range_header).groups()
-        byte1, byte2, length = 0, None, None
-        if g[0]:
-            byte1 = int(g[0])
-        if g[1]:
-            byte2 = int(g[1])
-            length = byte2 + 1 - byte1
-        return byte1, byte2, length
+    def __get_byte_ranges(self, byte_range, total_length):
+        byte_ranges = list()
+        for begin, end in byte_range.ranges:
+            if begin < 0:
+                begin, end = max(total_length + begin, 0), total_length
+            else:
+                end = min(end or total_length, total_length)
+            if begin < end:
+                byte_ranges.append((begin, end))
+        merged_ranges = list()
+        for begin, end in sorted(byte_ranges):
+            if merged_ranges and begin <= merged_ranges[-1][1]:
+                merged_ranges[-1] = (
+                    merged_ranges[-1][0],
+                    max(merged_ranges[-1][1], end),
+                )
+            else:
+                merged_ranges.append((begin, end))
+        return [(begin, end - 1) for begin, end in merged_ranges]
 
     def __get_file_object(self):
         if request.files:
-            file = request.files["file"]
-        else:
-            file = tempfile.NamedTemporaryFile(mode="ab+")
-            shutil.copyfileobj(request.stream, file)
-            file.seek(0)
-        return file
+            return request.files["file"]
+        return self.__get_request_stream()
+
+    def __get_cache_headers(self, key, file_info):
+        headers = Headers()
+        if etag := file_info.get("etag"):
+            headers["ETag"] = etag
+        if last_modified := file_info.get("last_modified"):
+            headers["Last-Modified"] = http_date(last_modified)
+        headers["Cache-Control"] = (
+            self.cache_control if is_immutable_key(key) else self.mutable_cache_control
+        )
+        return headers
+
+    def __get_multipart_byteranges_response(
+        self, key, content_type, byte_ranges, file_info, ticket=None
+    ):
+        total_length = file_info["content_length"]
+        boundary = uuid4().hex
+        part_headers = [
+            (
+                f"--{boundary}\r\nContent-Type: {content_type}\r\n"
+                f"Content-Range: bytes {start}-{end}/{total_length}\r\n\r\n"
+            ).encode()
+            for start, end in byte_ranges
+        ]
+        closing = f"--{boundary}--\r\n".encode()
+
+        def generate():
+            for part_header, (start, end) in zip(part_headers, byte_ranges):
+                yield part_header
+                file_object = self.storage.download_file(
+                    key, f"bytes={start}-{end}", ticket
+                )
+                yield from self.storage.get_stream_generator(file_object["stream"])
+                yield b"\r\n"
+            yield closing
+
+        headers = self.__get_cache_headers(key, file_info)
+        headers["Accept-Ranges"] = "bytes"
+        headers["Content-Length"] = len(closing) + sum(
+            len(part_header) + end - start + 3
+            for part_header, (start, end) in zip(part_headers, byte_ranges)
+        )
+        return Response(
+            stream_with_context(generate()),
+            content_type=f"multipart/byteranges; boundary={boundary}",
+            headers=headers,
+            status=206,
+            direct_passthrough=True,
+        )
+
+    def __get_mediafile_id(self, ticket=None):
+        if not (mediafile_id := request.args.get("id")) and not ticket:
+            raise NotFoundException(
+                f"{get_error_code(ErrorCode.PROVIDE_MEDIAFILE_ID_OR_TICKET_ID, get_write())} Provide either a mediafile ID or a ticket ID"
+            )
+        if not mediafile_id and "mediafile_id" in ticket:
+            mediafile_id = ticket.get("mediafile_id")
+        return mediafile_id
+
+    def __get_range_not_satisfiable_response(self, key, ticket=None):
+        total_length = self.storage.head_file(key, ticket)["content_length"]
+        headers = Headers()
+        headers["Accept-Ranges"] = "bytes"
+        headers["Content-Range"] = f"bytes */{total_length}"
+        return Response(status=416, headers=headers)
+
+    def __get_request_stream(self):
+        stream = request.stream
+        if request.content_length and getattr(stream, "is_exhausted", False):
+            return io.BytesIO(request.get_data(cache=True))
+        return stream
+
+    def __get_s3_range(self, begin, end):
+        if begin < 0:
+            return f"bytes={begin}"
+        return f"bytes={begin}-{end - 1 if end else ''}"
+
+    def __get_uploader(self, user=None):
+        if user:
+            return user
+        try:
+            return policy_factory.get_user_context().email or "default_uploader"
+        except NoUserContextException:
+            return "default_uploader"
 
     def __get_key_for_file(self, key, file):
         if key:
@@ -74,48 +190,132 @@ class BaseResource(Resource):
             raise Exception(
                 f"{get_error_code(ErrorCode.NO_TICKET_ID_SPECIFIED, get_write())} No ticket id given"
             )
-        request_url = f"{self.collection_api_url}/tickets/{ticket_id}"
-        if api_key_hash:
-            request_url = f"{request_url}?api_key_hash={api_key_hash}"
-        response = requests.get(request_url, headers=self.auth_headers)
-        if response.status_code != 200:
-            raise NotFoundException(
-                f"{get_error_code(ErrorCode.TICKET_NOT_FOUND, get_write())} Ticket with id {ticket_id} not found"
+        return self.storage.get_ticket(ticket_id, api_key_hash, self.auth_headers)
+
+    def _handle_archive_download(self, files, filename=None):
+        if not files:
+            abort(400, message="No files to download")
+        try:
+            file_infos = head_files(self.storage, files, self.archive_head_concurrency)
+        except FileNotFoundException as ex:
+            abort(404, message=str(ex))
+        return Response(
+            stream_with_context(
+                stream_archive(
+                    self.storage,
+                    files,
+                    file_infos,
+                    self.archive_prefetch,
+                    self.archive_prefetch_size,
+                )
+            ),
+            mimetype="application/zip",
+            headers={
+                "Content-Disposition": f'attachment; filename="{filename or "download.zip"}"'
+            },
+        )
+
+    def _handle_files_delete(
+        self, files, background=False, parent_job_id=None, user=None, results=False
+    ):
+        if not background:
+            try:
+                result = self.storage.delete_files(files)
+            except Exception as ex:
+                logger.error(f"Deleting {len(files)} files failed with: {ex}")
+                return str(ex), 400
+            if results:
+                return result, 200
+            if result["errors"]:
+                return (
+                    "; ".join(
+                        f"{error['key']}: {error['message']}"
+                        for error in result["errors"]
+                    ),
+                    400,
+                )
+            return "", 204
+        user = self.__get_uploader(user)
+        try:
+            job_id = start_job(
+                f"Delete {len(files)} files",
+                "File delete",
+                get_rabbit=lambda: rabbit,
+                user_email=user,
+                parent_id=parent_job_id,
             )
-        ticket = response.json()
-        if ticket.get("is_expired", True):
-            raise Exception(
-                f"{get_error_code(ErrorCode.TICKET_EXPIRED, get_write())} Ticket is expired"
+        except Exception as ex:
+            return str(ex), 400
+        try:
+            send_cloudevent(
+                rabbit,
+                "dams",
+                "dams.files_delete_requested",
+                {"files": files, "job_id": job_id, "user_email": user},
             )
-        return ticket
+        except Exception as ex:
+            fail_job(job_id, str(ex), get_rabbit=lambda: rabbit)
+            return str(ex), 400
+        return {"job_id": job_id}, 202
 
     def _handle_file_download(self, key, ticket=None):
-        chunk = False
+        if self.presigned_urls:
+            try:
+                return redirect(self.storage.get_download_url(key, ticket), 302)
+            except UnsupportedOperationException as ex:
+                abort(501, message=str(ex))
+        content_type = get_mimetype_from_filename(key)
+        byte_range = request.range
+        if byte_range and byte_range.units != "bytes":
+            byte_range = None
         try:
-            file_object = self.storage.download_file(key, ticket=ticket)
+            if request.if_none_match or request.if_modified_since:
+                file_info = self.storage.head_file(key, ticket)
+                if not is_resource_modified(
+                    request.environ,
+                    etag=file_info["etag"],
+                    last_modified=file_info["last_modified"],
+                ):
+                    return Response(
+                        status=304, headers=self.__get_cache_headers(key, file_info)
+                    )
+            s3_range = (
+                self.__get_s3_range(*byte_range.ranges[0]) if byte_range else None
+            )
+            if byte_range and len(byte_range.ranges) > 1:
+                file_info = self.storage.head_file(key, ticket)
+                byte_ranges = self.__get_byte_ranges(
+                    byte_range, file_info["content_length"]
+                )
+                if not byte_ranges:
+                    return self.__get_range_not_satisfiable_response(key, ticket)
+                if len(byte_ranges) > self.max_byte_ranges:
+                    s3_range = None
+                elif len(byte_ranges) > 1:
+                    return self.__get_multipart_byteranges_response(
+                        key, content_type, byte_ranges, file_info, ticket
+                    )
+                else:
+                    s3_range = "bytes={}-{}".format(*byte_ranges[0])
+            file_object = self.storage.download_file(key, s3_range, ticket)
         except FileNotFoundException as ex:
             abort(404, message=str(ex))
-        content_type = get_mimetype_from_filename(key)
-        full_length = file_object["content_length"]
-        headers = Headers()
+        except InvalidRangeException:
+            return self.__get_range_not_satisfiable_response(key, ticket)
+        headers = self.__get_cache_headers(key, file_object)
         headers["Accept-Ranges"] = "bytes"
-        headers["Content-Type"] = content_type
-        headers["Content-Length"] = full_length
-        if range_header := request.headers.get("Range"):
-            byte_start, byte_end, length = self.__get_byte_range(range_header)
-            if byte_end:
-                chunk = True
-                file_object = self.storage.download_file(
-                    key, f"bytes={byte_start}-{byte_end}", ticket
-                )
-                end = byte_start + length - 1
-                headers["Content-Range"] = f"bytes {byte_start}-{end}/{full_length}"
-                headers["Content-Transfer-Encoding"] = "binary"
-                headers["Connection"] = "Keep-Alive"
-                headers["Content-Type"] = content_type
-                headers["Content-Length"] = file_object["content_length"]
-                if byte_end == 1:
-                    headers["Content-Length"] = "1"
+        headers["Content-Length"] = file_object["content_length"]
+        if content_range := file_object.get("content_range"):
+            headers["Content-Range"] = content_range
+        if isinstance(file_object["stream"], CachedFileStream):
+            return Response(
+                wrap_file(request.environ, file_object["stream"], 1024 * 1024),
+                mimetype=content_type,
+                content_type=content_type,
+                headers=headers,
+                status=206 if content_range else 200,
+                direct_passthrough=True,
+            )
         response = Response(
             stream_with_context(
                 self.storage.get_stream_generator(file_object["stream"])
@@ -123,19 +323,15 @@ class BaseResource(Resource):
             mimetype=content_type,
             content_type=content_type,
             headers=headers,
-            status=206 if chunk else 200,
-            direct_passthrough=chunk,
+            status=206 if content_range else 200,
+            direct_passthrough=bool(content_range),
         )
         return response
 
     def _handle_file_upload(
         self, key=None, transcode=False, ticket=None, parent_job_id=None, user=None
     ):
-        if not user:
-            try:
-                user = policy_factory.get_user_context().email or "default_uploader"
-            except NoUserContextException:
-                user = "default_uploader"
+        user = self.__get_uploader(user)
         job_id = None
         file = None
         try:
@@ -148,22 +344,101 @@ class BaseResource(Resource):
                 user_email=user,
                 parent_id=parent_job_id,
             )
-            if not (mediafile_id := request.args.get("id")) and not ticket:
-                raise NotFoundException(
-                    f"{get_error_code(ErrorCode.PROVIDE_MEDIAFILE_ID_OR_TICKET_ID, get_write())} Provide either a mediafile ID or a ticket ID"
-                )
-            if not mediafile_id and "mediafile_id" in ticket:
-                mediafile_id = ticket.get("mediafile_id")
+            mediafile_id = self.__get_mediafile_id(ticket)
+            md5sum = request.args.get("md5", type=str.lower)
             if transcode:
-                self.storage.upload_transcode(file, mediafile_id, key, ticket)
+                self.storage.upload_transcode(
+                    file, mediafile_id, key, ticket, self.auth_headers, md5sum
+                )
             else:
-                self.storage.upload_file(file, mediafile_id, key, ticket)
+                self.storage.upload_file(
+                    file, mediafile_id, key, ticket, self.auth_headers, md5sum
+                )
         except (DuplicateFileException, Exception) as ex:
             if file:
-                file.close()
+                self.__close_file(file)
             if job_id:
                 fail_job(job_id, str(ex), get_rabbit=lambda: rabbit)
             return str(ex), 409 if isinstance(ex, DuplicateFileException) else 400
-        file.close()
+        self.__close_file(file)
         finish_job(job_id, get_rabbit=lambda: rabbit)
         return "", 201
+
+    def _handle_upload_session_complete(
+        self, session_id, ticket=None, parent_job_id=None, user=None
+    ):
+        job_id = None
+        try:
+            job_id = start_job(
+                f"Upload session {session_id}",
+                "File upload",
+                get_rabbit=lambda: rabbit,
+                user_email=self.__get_uploader(user),
+                parent_id=parent_job_id,
+            )
+            self.storage.complete_upload_session(
+                session_id,
+                ticket,
+                self.auth_headers,
+                request.args.get("md5", type=str.lower),
+            )
+        except NotFoundException as ex:
+            if job_id:
+                fail_job(job_id, str(ex), get_rabbit=lambda: rabbit)
+            return str(ex), 404
+        except UnsupportedOperationException as ex:
+            if job_id:
+                fail_job(job_id, str(ex), get_rabbit=lambda: rabbit)
+            return str(ex), 501
+        except (DuplicateFileException, Exception) as ex:
+            if job_id:
+                fail_job(job_id, str(ex), get_rabbit=lambda: rabbit)
+            return str(ex), 409 if isinstance(ex, DuplicateFileException) else 400
+        finish_job(job_id, get_rabbit=lambda: rabbit)
+        return "", 201
+
+    def _handle_upload_session_create(self, key=None, ticket=None):
+        try:
+            mediafile_id = self.__get_mediafile_id(ticket)
+            if not (key := key or request.args.get("filename")) and ticket:
+                key = ticket.get("location")
+            if not key:
+                raise Exception(
+                    f"{get_error_code(ErrorCode.NO_FILENAME_SPECIFIED, get_write())} Could not determine filename for upload"
+                )
+            session = self.storage.create_upload_session(
+                key, mediafile_id, ticket, self.auth_headers
+            )
+        except UnsupportedOperationException as ex:
+            return str(ex), 501
+        except Exception as ex:
+            return str(ex), 400
+        return session, 201
+
+    def _handle_upload_session_part_url(self, session_id, part_number, ticket=None):
+        if not self.presigned_urls:
+            return "Presigned URLs are not enabled", 404
+        try:
+            part = self.storage.get_upload_session_part_url(
+                session_id, part_number, ticket
+            )
+        except NotFoundException as ex:
+            return str(ex), 404
+        except UnsupportedOperationException as ex:
+            return str(ex), 501
+        except Exception as ex:
+            return str(ex), 400
+        return part, 200
+
+    def _handle_upload_session_part(self, session_id, part_number, ticket=None):
+        try:
+            part = self.storage.upload_session_part(
+                session_id, part_number, self.__get_request_stream(), ticket
+            )
+        except NotFoundException as ex:
+            return str(ex), 404
+        except UnsupportedOperationException as ex:
+            return str(ex), 501
+        except Exception as ex:
+            return str(ex), 400
+        return part, 200
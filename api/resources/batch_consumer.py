@@ -0,0 +1,165 @@
+import json
+import os
+import threading
+import time
+
+from app import app, logger, rabbit
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from pika import BlockingConnection, URLParameters
+
+
+class BatchConsumer:
+    def __init__(
+        self, handler, routing_keys, batch_size, batch_timeout, prefetch, concurrency
+    ):
+        self.handler = handler
+        self.routing_keys = routing_keys
+        self.batch_size = batch_size
+        self.batch_timeout = batch_timeout
+        self.prefetch = prefetch
+        self.executor = ThreadPoolExecutor(concurrency)
+        self.exchange_name = os.getenv("MQ_EXCHANGE")
+        self.exchange_durable = os.getenv("DURABLE_EXCHANGE", False) in [
+            1,
+            "1",
+            "True",
+            "true",
+            True,
+        ]
+        self.exchange_passive = os.getenv("PASSIVE_EXCHANGE", False) in [
+            1,
+            "1",
+            "True",
+            "true",
+            True,
+        ]
+        self.queue_durable = os.getenv("MQ_BATCH_QUEUE_DURABLE", True) in [
+            "True",
+            "true",
+            True,
+        ]
+        self.queue_name = (
+            f"{os.getenv('MQ_BATCH_QUEUE_PREFIX', 'basic')}."
+            f"{handler.__name__.replace('_', '.')}"
+        )
+        self.messages = list()
+        self.deadline = None
+
+    def __acknowledge(self, connection, channel, messages, results):
+        for (method, _, _), error in zip(messages, results):
+            if error:
+                logger.error(f"ERROR IN {self.queue_name}: {error}")
+                callback = partial(
+                    channel.basic_reject,
+                    method.delivery_tag,
+                    requeue=not method.redelivered,
+                )
+            else:
+                callback = partial(channel.basic_ack, method.delivery_tag)
+            connection.add_callback_threadsafe(callback)
+
+    def __consume(self):
+        connection = BlockingConnection(URLParameters(os.getenv("MQ_URL")))
+        channel = connection.channel()
+        channel.basic_qos(prefetch_count=self.prefetch)
+        channel.exchange_declare(
+            exchange=self.exchange_name,
+            exchange_type="topic",
+            passive=self.exchange_passive,
+            durable=self.exchange_durable,
+        )
+        channel.queue_declare(self.queue_name, durable=self.queue_durable)
+        for routing_key in self.routing_keys:
+            channel.queue_bind(
+                exchange=self.exchange_name,
+                queue=self.queue_name,
+                routing_key=routing_key,
+            )
+        channel.basic_consume(
+            queue=self.queue_name,
+            on_message_callback=lambda _, method, props, body: self.add(
+                method, props, body
+            ),
+        )
+        logger.info(f"Consuming {self.queue_name} in batches of {self.batch_size}")
+        while channel.is_open:
+            time_limit = (
+                max(self.deadline - time.monotonic(), 0)
+                if self.deadline
+                else self.batch_timeout
+            )
+            connection.process_data_events(time_limit=time_limit)
+            if self.is_ready():
+                self.flush(connection, channel)
+
+    def __run(self):
+        while True:
+            try:
+                self.__consume()
+            except Exception as ex:
+                logger.error(f"Batch consumer {self.queue_name} failed with: {ex}")
+            self.messages.clear()
+            self.deadline = None
+            time.sleep(5)
+
+    def add(self, method, props, body):
+        if not self.messages:
+            self.deadline = time.monotonic() + self.batch_timeout
+        self.messages.append((method, props, body))
+
+    def flush(self, connection, channel):
+        messages, self.messages, self.deadline = self.messages, list(), None
+        self.executor.submit(self.handle, connection, channel, messages)
+
+    def handle(self, connection, channel, messages):
+        parsed_messages = list()
+        results = list()
+        for method, props, body in messages:
+            try:
+                parsed_messages.append((method.routing_key, json.loads(body)))
+                results.append(None)
+            except Exception as ex:
+                parsed_messages.append(None)
+                results.append(ex)
+        valid = [message for message in parsed_messages if message]
+        try:
+            with app.app_context():
+                handled = iter(self.handler(valid))
+            results = [result or next(handled) for result in results]
+        except Exception as ex:
+            results = [ex] * len(messages)
+        self.__acknowledge(connection, channel, messages, results)
+
+    def is_ready(self):
+        return len(self.messages) >= self.batch_size or (
+            self.messages and time.monotonic() >= self.deadline
+        )
+
+    def start(self):
+        thread = threading.Thread(target=self.__run, name=self.queue_name, daemon=True)
+        thread.start()
+
+
+def batch_queue(routing_key):
+    batch_size = int(os.getenv("MQ_BATCH_SIZE", 1))
+
+    def decorator(handler):
+        if batch_size > 1 and (
+            not rabbit.development or os.getenv("WERKZEUG_RUN_MAIN") == "true"
+        ):
+            BatchConsumer(
+                handler,
+                routing_key if isinstance(routing_key, list) else [routing_key],
+                batch_size,
+                int(os.getenv("MQ_BATCH_TIMEOUT", 500)) / 1000,
+                int(os.getenv("MQ_PREFETCH", batch_size * 2)),
+                int(os.getenv("MQ_BATCH_CONCURRENCY", 1)),
+            ).start()
+        return handler
+
+    return decorator
+
+
+def is_batch_enabled():
+    return int(os.getenv("MQ_BATCH_SIZE", 1)) > 1
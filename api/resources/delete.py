@@ -6,28 +6,35 @@ from resources.base_resource import BaseResource
 
 
 class Delete(BaseResource):
-    @policy_factory.authenticate()
+    @policy_factory.authenticate(RequestContext(request))
     def delete(self, key):
         try:
-            self.storage.delete_files([key])
+            result = self.storage.delete_files([key])
         except Exception as ex:
             logger.error(f"Deleting {key} failed with: {ex}")
             return str(ex), 400
+        if result["errors"]:
+            return result["errors"][0]["message"], 400
         return "", 204
 
 
 class DeleteMultiple(BaseResource):
     def __get_request_body(self):
-        if request_body := request.get_json(silent=True):
+        request_body = request.get_json(silent=True)
+        if (
+            request_body
+            and isinstance(request_body, list)
+            and all(isinstance(file, (str, dict)) for file in request_body)
+        ):
             return request_body
         abort(405, message="Invalid input")
 
     @policy_factory.authenticate(RequestContext(request))
     def delete(self):
-        files = self.__get_request_body()
-        try:
-            self.storage.delete_files(files)
-        except Exception as ex:
-            logger.error(f"Deleting {files} failed with: {ex}")
-            return str(ex), 400
-        return "", 204
+        return self._handle_files_delete(
+            self.__get_request_body(),
+            background=request.args.get("background") in ["True", "true"],
+            parent_job_id=request.args.get("parent_job_id"),
+            user=request.args.get("user_email"),
+            results=request.args.get("results") in ["True", "true"],
+        )
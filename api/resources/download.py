@@ -1,5 +1,6 @@
 from app import policy_factory
 from flask import request, Response
+from flask_restful import abort
 from inuits_policy_based_auth import RequestContext
 from resources.base_resource import BaseResource
 
@@ -31,3 +32,32 @@ class DownloadWithTicket(BaseResource):
         except Exception as ex:
             return str(ex), 400
         return self._handle_file_download(key, ticket=ticket)
+
+
+class DownloadArchive(BaseResource):
+    def __get_keys(self):
+        keys = request.get_json(silent=True)
+        if not isinstance(keys, list) or not all(isinstance(key, str) for key in keys):
+            abort(405, message="Invalid input")
+        return keys
+
+    @policy_factory.authenticate(RequestContext(request))
+    def post(self):
+        return self._handle_archive_download(
+            [(key, None) for key in self.__get_keys()], request.args.get("filename")
+        )
+
+
+class DownloadArchiveWithTicket(BaseResource):
+    def get(self):
+        try:
+            ticket = self._get_ticket(
+                request.args.get("ticket_id"), request.args.get("api_key_hash")
+            )
+        except Exception as ex:
+            return str(ex), 400
+        locations = ticket.get("locations") or [ticket["location"]]
+        return self._handle_archive_download(
+            [(location, {**ticket, "location": location}) for location in locations],
+            request.args.get("filename"),
+        )
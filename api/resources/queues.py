@@ -1,4 +1,6 @@
 from app import logger, rabbit
+from elody.job import fail_job, finish_job, start_job
+from resources.batch_consumer import batch_queue, is_batch_enabled
 from storage.storagemanager import StorageManager
 
 
@@ -19,32 +21,119 @@ def add_exif_data_to_image(routing_key, body, message_id):
         return
     mediafile = data["mediafile"]
     old_mediafile = data.get("old_mediafile")
+    storage = StorageManager().get_storage_engine()
+    if routing_key == "dams.mediafile_changed":
+        storage.invalidate_mediafile(mediafile)
     if not mediafile.get("mimetype") or not mediafile.get("metadata"):
         return
-    storage = StorageManager().get_storage_engine()
     if old_mediafile and not storage.is_metadata_updated(old_mediafile, mediafile):
         return
     # storage.add_exif_data(mediafile)
 
 
-@rabbit.queue("dams.file_scanned")
-def remove_infected_file_from_storage(routing_key, body, message_id):
-    data = body["data"]
-    if __is_malformed_message(data, ["mediafile_id", "clamav_version", "infected"]):
-        return
-    if data["infected"]:
-        StorageManager().get_storage_engine().delete_files([data["filename"]])
+def __delete_files_in_batch(messages):
+    storage = StorageManager().get_storage_engine()
+    files_per_message = list()
+    for routing_key, body in messages:
+        data = body["data"]
+        if routing_key == "dams.file_scanned":
+            required = ["mediafile_id", "clamav_version", "infected"]
+        else:
+            required = ["mediafile", "linked_entities"]
+        if __is_malformed_message(data, required):
+            files_per_message.append(list())
+        elif routing_key == "dams.file_scanned":
+            files_per_message.append([data["filename"]] if data["infected"] else [])
+        else:
+            storage.invalidate_mediafile(data["mediafile"])
+            files_per_message.append(
+                list(storage.get_keys_for_files([data["mediafile"]]))
+            )
+    files = [file for message_files in files_per_message for file in message_files]
+    errors = dict()
+    if files:
+        result = storage.delete_files(files)
+        errors = {error["key"]: error["message"] for error in result["errors"]}
+    return [
+        "; ".join(f"{file}: {errors[file]}" for file in message_files if file in errors)
+        or None
+        for message_files in files_per_message
+    ]
 
 
-@rabbit.queue("dams.mediafile_deleted")
-def remove_file_from_storage(routing_key, body, message_id):
+@rabbit.queue("dams.files_delete_requested")
+def delete_files_in_background(routing_key, body, message_id):
     data = body["data"]
-    if __is_malformed_message(data, ["mediafile", "linked_entities"]):
+    if __is_malformed_message(data, ["files", "job_id", "user_email"]):
         return
-    files = [data["mediafile"]["filename"]]
-    if "transcode_filename" in data["mediafile"]:
-        files.append(data["mediafile"]["transcode_filename"])
+    job_id = data["job_id"]
+
+    def on_batch_deleted(keys, result):
+        batch_job_id = start_job(
+            f"Delete batch of {len(keys)} files",
+            "File delete",
+            get_rabbit=lambda: rabbit,
+            user_email=data["user_email"],
+            parent_id=job_id,
+        )
+        if result["errors"]:
+            fail_job(
+                batch_job_id,
+                f"Deleting {len(result['errors'])} of {len(keys)} files failed",
+                get_rabbit=lambda: rabbit,
+            )
+        else:
+            finish_job(batch_job_id, get_rabbit=lambda: rabbit)
+
+    storage = StorageManager().get_storage_engine()
     try:
-        StorageManager().get_storage_engine().delete_files(files)
+        result = storage.delete_files(data["files"], on_batch_deleted)
     except Exception as ex:
-        logger.error(f"Deleting {files} failed with: {ex}")
+        logger.error(f"Deleting {len(data['files'])} files failed with: {ex}")
+        fail_job(job_id, str(ex), get_rabbit=lambda: rabbit)
+        return
+    if result["errors"]:
+        fail_job(
+            job_id,
+            f"Deleting {len(result['errors'])} files failed",
+            get_rabbit=lambda: rabbit,
+        )
+    else:
+        finish_job(job_id, get_rabbit=lambda: rabbit)
+
+
+if not is_batch_enabled():
+
+    @rabbit.queue("dams.file_scanned")
+    def remove_infected_file_from_storage(routing_key, body, message_id):
+        data = body["data"]
+        if __is_malformed_message(data, ["mediafile_id", "clamav_version", "infected"]):
+            return
+        if data["infected"]:
+            StorageManager().get_storage_engine().delete_files([data["filename"]])
+
+    @rabbit.queue("dams.mediafile_deleted")
+    def remove_file_from_storage(routing_key, body, message_id):
+        data = body["data"]
+        if __is_malformed_message(data, ["mediafile", "linked_entities"]):
+            return
+        storage = StorageManager().get_storage_engine()
+        storage.invalidate_mediafile(data["mediafile"])
+        files = list(storage.get_keys_for_files([data["mediafile"]]))
+        try:
+            result = storage.delete_files(files)
+        except Exception as ex:
+            logger.error(f"Deleting {files} failed with: {ex}")
+            return
+        for error in result["errors"]:
+            logger.error(f"Deleting {error['key']} failed with: {error['message']}")
+
+else:
+
+    @batch_queue("dams.file_scanned")
+    def remove_infected_file_from_storage(messages):
+        return __delete_files_in_batch(messages)
+
+    @batch_queue("dams.mediafile_deleted")
+    def remove_file_from_storage(messages):
+        return __delete_files_in_batch(messages)
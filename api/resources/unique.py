@@ -1,8 +1,12 @@
+import os
+
 from app import policy_factory
 from elody.exceptions import DuplicateFileException
 from flask import request
+from flask_restful import abort
 from inuits_policy_based_auth import RequestContext
 from resources.base_resource import BaseResource
+from storage.engine import validate_md5
 
 
 class Unique(BaseResource):
@@ -13,3 +17,32 @@ class Unique(BaseResource):
         except DuplicateFileException as ex:
             return ex.filename, 409
         return "", 200
+
+
+class UniqueMultiple(BaseResource):
+    def __init__(self):
+        super().__init__()
+        self.max_md5sums = int(os.getenv("UNIQUE_CHECK_MAX_MD5SUMS", 1000))
+
+    def __get_md5sums(self):
+        if request.is_json:
+            md5sums = request.get_json(silent=True)
+        else:
+            md5sums = request.get_data(as_text=True).splitlines()
+        if not isinstance(md5sums, list) or not all(
+            isinstance(md5sum, str) for md5sum in md5sums
+        ):
+            abort(405, message="Invalid input")
+        md5sums = [md5sum.strip().lower() for md5sum in md5sums if md5sum.strip()]
+        if len(md5sums) > self.max_md5sums:
+            abort(405, message=f"At most {self.max_md5sums} md5 sums can be checked")
+        try:
+            for md5sum in md5sums:
+                validate_md5(md5sum)
+        except Exception as ex:
+            abort(405, message=str(ex))
+        return md5sums
+
+    @policy_factory.authenticate(RequestContext(request))
+    def post(self):
+        return self.storage.find_existing_files(self.__get_md5sums())
@@ -1,7 +1,9 @@
 from app import policy_factory
+from elody.exceptions import NotFoundException
 from flask import request
 from inuits_policy_based_auth import RequestContext
 from resources.base_resource import BaseResource
+from storage.exceptions import UnsupportedOperationException
 
 
 class Upload(BaseResource):
@@ -67,3 +69,109 @@ class UploadTranscode(BaseResource):
                 )
         except Exception as ex:
             return str(ex), 400
+
+
+class UploadSession(BaseResource):
+    @policy_factory.authenticate(RequestContext(request))
+    def post(self):
+        return self._handle_upload_session_create()
+
+
+class UploadSessionWithTicket(BaseResource):
+    def post(self):
+        try:
+            ticket = self._get_ticket(request.args.get("ticket_id"))
+        except Exception as ex:
+            return str(ex), 400
+        return self._handle_upload_session_create(ticket=ticket)
+
+
+class UploadSessionDetail(BaseResource):
+    @policy_factory.authenticate(RequestContext(request))
+    def delete(self, session_id):
+        try:
+            self.storage.abort_upload_session(session_id)
+        except NotFoundException as ex:
+            return str(ex), 404
+        except UnsupportedOperationException as ex:
+            return str(ex), 501
+        return "", 204
+
+    @policy_factory.authenticate(RequestContext(request))
+    def get(self, session_id):
+        try:
+            return self.storage.get_upload_session(session_id)
+        except NotFoundException as ex:
+            return str(ex), 404
+        except UnsupportedOperationException as ex:
+            return str(ex), 501
+
+    @policy_factory.authenticate(RequestContext(request))
+    def post(self, session_id):
+        parent_job_id = request.args.get("parent_job_id")
+        user = request.args.get("user_email")
+        return self._handle_upload_session_complete(
+            session_id, parent_job_id=parent_job_id, user=user
+        )
+
+
+class UploadSessionDetailWithTicket(BaseResource):
+    def delete(self, session_id):
+        try:
+            ticket = self._get_ticket(request.args.get("ticket_id"))
+            self.storage.abort_upload_session(session_id, ticket)
+        except NotFoundException as ex:
+            return str(ex), 404
+        except UnsupportedOperationException as ex:
+            return str(ex), 501
+        except Exception as ex:
+            return str(ex), 400
+        return "", 204
+
+    def get(self, session_id):
+        try:
+            ticket = self._get_ticket(request.args.get("ticket_id"))
+            return self.storage.get_upload_session(session_id, ticket)
+        except NotFoundException as ex:
+            return str(ex), 404
+        except UnsupportedOperationException as ex:
+            return str(ex), 501
+        except Exception as ex:
+            return str(ex), 400
+
+    def post(self, session_id):
+        try:
+            ticket = self._get_ticket(request.args.get("ticket_id"))
+            parent_job_id = request.args.get("parent_job_id")
+            user = request.args.get("user_email")
+        except Exception as ex:
+            return str(ex), 400
+        return self._handle_upload_session_complete(
+            session_id, ticket=ticket, parent_job_id=parent_job_id, user=user
+        )
+
+
+class UploadSessionPart(BaseResource):
+    @policy_factory.authenticate(RequestContext(request))
+    def get(self, session_id, part_number):
+        return self._handle_upload_session_part_url(session_id, part_number)
+
+    @policy_factory.authenticate(RequestContext(request))
+    def put(self, session_id, part_number):
+        return self._handle_upload_session_part(session_id, part_number)
+
+
+class UploadSessionPartWithTicket(BaseResource):
+    def get(self, session_id, part_number):
+        try:
+            ticket = self._get_ticket(request.args.get("ticket_id"))
+        except Exception as ex:
+            return str(ex), 400
+        return self._handle_upload_session_part_url(session_id, part_number, ticket)
+
+    def put(self, session_id, part_number):
+        try:
+            ticket = self._get_ticket(request.args.get("ticket_id"))
+        except Exception as ex:
+            return str(ex), 400
+        return self._handle_upload_session_part(session_id, part_number, ticket)
@@ -0,0 +1,141 @@
+import os
+import zipfile
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+
+class ArchiveBuffer:
+    def __init__(self):
+        self.chunks = list()
+        self.position = 0
+
+    def drain(self):
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+    def flush(self):
+        pass
+
+    def tell(self):
+        return self.position
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+
+class ArchiveEntry:
+    def __init__(self, storage, file_name, ticket=None):
+        self.storage = storage
+        self.file_name = file_name
+        self.ticket = ticket
+        self.head = list()
+        self.chunks = None
+        self.stream = None
+
+    def close(self):
+        if self.chunks:
+            self.chunks.close()
+        if self.stream:
+            self.stream.close()
+        self.chunks = self.stream = None
+
+    def iter_chunks(self):
+        try:
+            yield from self.head
+            if self.chunks:
+                yield from self.chunks
+        finally:
+            self.close()
+
+    def prefetch(self, size):
+        file_object = self.storage.download_file(self.file_name, ticket=self.ticket)
+        self.stream = file_object["stream"]
+        self.chunks = iter(self.storage.get_stream_generator(self.stream))
+        prefetched = 0
+        try:
+            while prefetched < size:
+                if not (chunk := next(self.chunks, None)):
+                    self.close()
+                    break
+                self.head.append(chunk)
+                prefetched += len(chunk)
+        except Exception:
+            self.close()
+            raise
+        return self
+
+
+def get_archive_names(file_names):
+    names = list()
+    seen = set()
+    for file_name in file_names:
+        name = file_name.split("/")[-1]
+        base, extension = os.path.splitext(name)
+        index = 1
+        while name in seen:
+            name = f"{base} ({index}){extension}"
+            index += 1
+        seen.add(name)
+        names.append(name)
+    return names
+
+
+def head_files(storage, files, concurrency):
+    with ThreadPoolExecutor(concurrency) as executor:
+        return list(
+            executor.map(lambda file: storage.head_file(file[0], file[1]), files)
+        )
+
+
+def stream_archive(storage, files, file_infos, prefetch=4, prefetch_size=8388608):
+    buffer = ArchiveBuffer()
+    names = get_archive_names([file_name for file_name, _ in files])
+    with ThreadPoolExecutor(max(prefetch, 1)) as executor:
+        pending = list()
+        upcoming = iter(zip(files, names, file_infos))
+        try:
+            with zipfile.ZipFile(buffer, "w", zipfile.ZIP_STORED) as archive:
+                for (file_name, ticket), name, file_info in upcoming:
+                    pending.append(
+                        (
+                            name,
+                            file_info,
+                            executor.submit(
+                                ArchiveEntry(storage, file_name, ticket).prefetch,
+                                prefetch_size,
+                            ),
+                        )
+                    )
+                    if len(pending) <= prefetch:
+                        continue
+                    yield from __write_entry(archive, buffer, *pending.pop(0))
+                while pending:
+                    yield from __write_entry(archive, buffer, *pending.pop(0))
+            yield buffer.drain()
+        finally:
+            for _, _, future in pending:
+                if not future.cancel():
+                    future.add_done_callback(__close_entry)
+
+
+def __close_entry(future):
+    if not future.exception():
+        future.result().close()
+
+
+def __write_entry(archive, buffer, name, file_info, future):
+    last_modified = file_info.get("last_modified") or datetime.now()
+    entry_info = zipfile.ZipInfo(
+        name, max(last_modified.timetuple()[:6], (1980, 1, 1, 0, 0, 0))
+    )
+    entry_info.file_size = file_info["content_length"]
+    entry_info.compress_type = zipfile.ZIP_STORED
+    with archive.open(entry_info, "w") as entry:
+        for chunk in future.result().iter_chunks():
+            entry.write(chunk)
+            if data := buffer.drain():
+                yield data
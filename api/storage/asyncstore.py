@@ -0,0 +1,219 @@
+import asyncio
+import httpx
+import os
+import time
+
+from elody.error_codes import ErrorCode, get_error_code, get_read, get_write
+from elody.exceptions import FileNotFoundException
+from email.utils import parsedate_to_datetime
+from metrics import observe_collection_api_request, observe_s3_request, time_stage
+from starlette.concurrency import run_in_threadpool
+from storage.exceptions import InvalidRangeException
+from storage.multipart import MultipartUpload, get_content_md5
+from uuid import uuid4
+
+
+class AsyncS3StorageManager:
+    def __init__(self, storage_manager):
+        self.storage_manager = storage_manager
+        self.http = httpx.AsyncClient(
+            timeout=httpx.Timeout(float(os.getenv("ASYNC_HTTP_TIMEOUT", 60))),
+            limits=httpx.Limits(
+                max_connections=int(os.getenv("ASYNC_HTTP_MAX_CONNECTIONS", 1000)),
+                max_keepalive_connections=int(
+                    os.getenv("ASYNC_HTTP_MAX_KEEPALIVE_CONNECTIONS", 100)
+                ),
+            ),
+        )
+
+    async def __get_from_collection_api(self, url, headers):
+        response = await self.http.get(url, headers=headers)
+        observe_collection_api_request(
+            "GET", response.status_code, response.elapsed.total_seconds()
+        )
+        return response
+
+    def __get_presigned_url(self, method, **params):
+        return self.storage_manager.client.generate_presigned_url(
+            method, Params=params, ExpiresIn=self.storage_manager.presigned_url_expiry
+        )
+
+    async def __put_object(self, bucket_name, key, data):
+        start = time.perf_counter()
+        response = await self.http.put(
+            self.__get_presigned_url("put_object", Bucket=bucket_name, Key=key),
+            content=data,
+            headers={"Content-MD5": get_content_md5(data)},
+        )
+        observe_s3_request(
+            "PutObject", response.status_code, time.perf_counter() - start
+        )
+        response.raise_for_status()
+
+    async def __stream_to_staging(self, stream, key, ticket=None):
+        storage_manager = self.storage_manager
+        ingest = storage_manager.create_ingest_stream()
+        staging_key = f"{storage_manager.staging_prefix}{uuid4()}-{key.split('/')[-1]}"
+        bucket_name = storage_manager._get_bucket_name(ticket)
+        part_size = storage_manager.upload_part_size
+        upload = None
+        in_flight = set()
+        buffer = bytearray()
+        part_number = 1
+        try:
+            async for chunk in stream:
+                ingest.update(chunk)
+                buffer += chunk
+                while len(buffer) > part_size:
+                    if not upload:
+                        upload = MultipartUpload(
+                            storage_manager.client, bucket_name, staging_key
+                        )
+                        await run_in_threadpool(upload.create)
+                    if len(in_flight) >= storage_manager.upload_part_concurrency:
+                        done, in_flight = await asyncio.wait(
+                            in_flight, return_when=asyncio.FIRST_COMPLETED
+                        )
+                        for task in done:
+                            task.result()
+                    in_flight.add(
+                        asyncio.create_task(
+                            self.__upload_part(
+                                upload, part_number, bytes(buffer[:part_size])
+                            )
+                        )
+                    )
+                    del buffer[:part_size]
+                    part_number += 1
+            if not upload:
+                await self.__put_object(bucket_name, staging_key, bytes(buffer))
+                return ingest, staging_key
+            in_flight.add(
+                asyncio.create_task(
+                    self.__upload_part(upload, part_number, bytes(buffer))
+                )
+            )
+            for task in (await asyncio.wait(in_flight))[0]:
+                task.result()
+            await run_in_threadpool(upload.complete)
+        except BaseException:
+            for task in in_flight:
+                task.cancel()
+            if upload:
+                await run_in_threadpool(upload.abort)
+            raise
+        return ingest, staging_key
+
+    async def __upload_part(self, upload, part_number, data):
+        start = time.perf_counter()
+        response = await self.http.put(
+            self.__get_presigned_url(
+                "upload_part",
+                Bucket=upload.bucket_name,
+                Key=upload.key,
+                UploadId=upload.upload_id,
+                PartNumber=part_number,
+            ),
+            content=data,
+            headers={"Content-MD5": get_content_md5(data)},
+        )
+        observe_s3_request(
+            "UploadPart", response.status_code, time.perf_counter() - start
+        )
+        response.raise_for_status()
+        upload.parts[part_number] = response.headers["ETag"]
+
+    async def close(self):
+        await self.http.aclose()
+
+    async def download_file(self, file_name, range=None, ticket=None):
+        bucket_name, key = await run_in_threadpool(
+            self.storage_manager.get_object_location, file_name, ticket
+        )
+        request = self.http.build_request(
+            "GET",
+            self.__get_presigned_url("get_object", Bucket=bucket_name, Key=key),
+            headers={"Range": range} if range else None,
+        )
+        start = time.perf_counter()
+        response = await self.http.send(request, stream=True)
+        observe_s3_request(
+            "GetObject", response.status_code, time.perf_counter() - start
+        )
+        if response.status_code == 416:
+            await response.aclose()
+            raise InvalidRangeException(
+                f"{get_error_code(ErrorCode.INVALID_INPUT, get_read())} Range {range} not satisfiable for file {file_name}"
+            )
+        if response.status_code >= 400:
+            await response.aclose()
+            raise FileNotFoundException(
+                f"{get_error_code(ErrorCode.FILE_NOT_FOUND, get_write())} File {file_name} not found with key {key}"
+            )
+        content_range = response.headers.get("Content-Range")
+        last_modified = response.headers.get("Last-Modified")
+        return {
+            "stream": response,
+            "content_length": int(response.headers["Content-Length"]),
+            "content_range": content_range,
+            "total_length": (
+                int(content_range.split("/")[-1])
+                if content_range
+                else int(response.headers["Content-Length"])
+            ),
+            "etag": response.headers.get("ETag"),
+            "last_modified": (
+                parsedate_to_datetime(last_modified) if last_modified else None
+            ),
+        }
+
+    async def get_mediafile(self, mediafile_id, fatal=True, headers=None):
+        storage_manager = self.storage_manager
+        cache_key, url, headers = storage_manager._get_mediafile_request(
+            mediafile_id, headers
+        )
+        if mediafile := storage_manager.mediafile_cache.get(cache_key):
+            return mediafile
+        return storage_manager._read_mediafile_response(
+            await self.__get_from_collection_api(url, headers), cache_key, fatal
+        )
+
+    async def get_stream_generator(self, stream, chunk_size=1024 * 1024):
+        try:
+            async for chunk in stream.aiter_raw(chunk_size):
+                yield chunk
+        finally:
+            await stream.aclose()
+
+    async def get_ticket(self, ticket_id, api_key_hash=None, headers=None):
+        storage_manager = self.storage_manager
+        cache_key, url, headers = storage_manager._get_ticket_request(
+            ticket_id, api_key_hash, headers
+        )
+        if not (ticket := storage_manager.ticket_cache.get(cache_key)):
+            ticket = storage_manager._read_ticket_response(
+                await self.__get_from_collection_api(url, headers), ticket_id, cache_key
+            )
+        return storage_manager._check_ticket(ticket)
+
+    async def head_file(self, file_name, ticket=None):
+        return await run_in_threadpool(
+            self.storage_manager.head_file, file_name, ticket
+        )
+
+    async def upload_file(self, stream, mediafile_id, key, ticket, headers=None):
+        mediafile = await self.get_mediafile(
+            mediafile_id, fatal=ticket is None, headers=headers
+        )
+        with time_stage("store"):
+            ingest, staging_key = await self.__stream_to_staging(stream, key, ticket)
+        await run_in_threadpool(
+            self.storage_manager.finalize_upload,
+            ingest,
+            staging_key,
+            mediafile_id,
+            mediafile,
+            key,
+            ticket,
+            headers,
+        )
@@ -0,0 +1,187 @@
+import sqlite3
+import threading
+import time
+
+from contextlib import contextmanager
+
+
+class BlobIndex:
+    def __init__(self, path):
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(
+            path, check_same_thread=False, isolation_level=None, timeout=60
+        )
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS blobs "
+            "(md5 TEXT PRIMARY KEY, size INTEGER NOT NULL, etag TEXT, "
+            "refs INTEGER NOT NULL, orphaned_at REAL)"
+        )
+        self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS blobs_orphaned_at ON blobs (orphaned_at)"
+        )
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS refs (bucket TEXT NOT NULL, "
+            "key TEXT NOT NULL, md5 TEXT NOT NULL, PRIMARY KEY (bucket, key))"
+        )
+        self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS refs_bucket_md5 ON refs (bucket, md5)"
+        )
+        self.connection.execute("CREATE INDEX IF NOT EXISTS refs_md5 ON refs (md5)")
+
+    def __reference(self, bucket_name, key, md5sum):
+        previous = self.connection.execute(
+            "SELECT md5 FROM refs WHERE bucket = ? AND key = ?", (bucket_name, key)
+        ).fetchone()
+        if previous and previous[0] == md5sum:
+            return
+        self.connection.execute(
+            "UPDATE blobs SET refs = refs + 1, orphaned_at = NULL WHERE md5 = ?",
+            (md5sum,),
+        )
+        self.connection.execute(
+            "INSERT OR REPLACE INTO refs (bucket, key, md5) VALUES (?, ?, ?)",
+            (bucket_name, key, md5sum),
+        )
+        if previous:
+            self.__release(previous[0])
+
+    def __release(self, md5sum):
+        self.connection.execute(
+            "UPDATE blobs SET refs = refs - 1, orphaned_at = "
+            "CASE WHEN refs = 1 THEN ? ELSE orphaned_at END WHERE md5 = ?",
+            (time.time(), md5sum),
+        )
+
+    @contextmanager
+    def __transaction(self):
+        with self.lock:
+            self.connection.execute("BEGIN IMMEDIATE")
+            try:
+                yield
+            except BaseException:
+                self.connection.execute("ROLLBACK")
+                raise
+            self.connection.execute("COMMIT")
+
+    def add_existing_reference(self, bucket_name, key, md5sum):
+        with self.__transaction():
+            row = self.connection.execute(
+                "SELECT etag FROM blobs WHERE md5 = ?", (md5sum,)
+            ).fetchone()
+            if row:
+                self.__reference(bucket_name, key, md5sum)
+        return row[0] if row else None
+
+    def add_reference(self, bucket_name, key, md5sum, size, etag):
+        with self.__transaction():
+            self.connection.execute(
+                "INSERT OR IGNORE INTO blobs (md5, size, etag, refs, orphaned_at) "
+                "VALUES (?, ?, ?, 0, ?)",
+                (md5sum, size, etag, time.time()),
+            )
+            self.__reference(bucket_name, key, md5sum)
+
+    def collect_garbage(self, grace_period, delete_blobs, batch_size=1000):
+        collected = list()
+        while True:
+            with self.__transaction():
+                md5sums = [
+                    row[0]
+                    for row in self.connection.execute(
+                        "SELECT md5 FROM blobs WHERE refs = 0 AND orphaned_at < ? "
+                        "LIMIT ?",
+                        (time.time() - grace_period, batch_size),
+                    )
+                ]
+                deleted = delete_blobs(md5sums) if md5sums else list()
+                self.connection.executemany(
+                    "DELETE FROM blobs WHERE md5 = ? AND refs = 0",
+                    [(md5sum,) for md5sum in deleted],
+                )
+            collected.extend(deleted)
+            if len(md5sums) < batch_size or not deleted:
+                return collected
+
+    def find(self, bucket_name, md5sum):
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT key FROM refs WHERE bucket = ? AND md5 = ? ORDER BY key LIMIT 1",
+                (bucket_name, md5sum),
+            ).fetchone()
+        return row[0] if row else None
+
+    def rebuild(self, bucket_names, list_blobs, list_references, has_reference):
+        with self.lock:
+            self.connection.execute(
+                "CREATE TEMP TABLE IF NOT EXISTS listed_refs (bucket TEXT NOT NULL, "
+                "key TEXT NOT NULL, PRIMARY KEY (bucket, key))"
+            )
+            self.connection.execute("DELETE FROM listed_refs")
+        for blobs in list_blobs():
+            with self.__transaction():
+                self.connection.executemany(
+                    "INSERT OR IGNORE INTO blobs (md5, size, etag, refs, orphaned_at) "
+                    "VALUES (?, ?, ?, 0, NULL)",
+                    blobs,
+                )
+        count = 0
+        for bucket_name in bucket_names:
+            for references in list_references(bucket_name):
+                with self.__transaction():
+                    for key, md5sum in references:
+                        self.__reference(bucket_name, key, md5sum)
+                    self.connection.executemany(
+                        "INSERT OR IGNORE INTO listed_refs (bucket, key) VALUES (?, ?)",
+                        [(bucket_name, key) for key, _ in references],
+                    )
+                count += len(references)
+            with self.lock:
+                unlisted = [
+                    row[0]
+                    for row in self.connection.execute(
+                        "SELECT key FROM refs WHERE bucket = ? AND key NOT IN "
+                        "(SELECT key FROM listed_refs WHERE bucket = ?)",
+                        (bucket_name, bucket_name),
+                    )
+                ]
+            self.remove_references(
+                bucket_name,
+                [key for key in unlisted if not has_reference(bucket_name, key)],
+            )
+        with self.__transaction():
+            self.connection.execute(
+                "UPDATE blobs SET refs = "
+                "(SELECT COUNT(*) FROM refs WHERE refs.md5 = blobs.md5)"
+            )
+            self.connection.execute(
+                "UPDATE blobs SET orphaned_at = CASE WHEN refs = 0 "
+                "THEN COALESCE(orphaned_at, ?) ELSE NULL END",
+                (time.time(),),
+            )
+            self.connection.execute("DELETE FROM listed_refs")
+        return count
+
+    def remove_references(self, bucket_name, keys):
+        removed = list()
+        with self.__transaction():
+            for key in keys:
+                row = self.connection.execute(
+                    "SELECT md5 FROM refs WHERE bucket = ? AND key = ?",
+                    (bucket_name, key),
+                ).fetchone()
+                if not row:
+                    continue
+                self.connection.execute(
+                    "DELETE FROM refs WHERE bucket = ? AND key = ?", (bucket_name, key)
+                )
+                self.__release(row[0])
+                removed.append(key)
+        return removed
+
+    def resolve(self, bucket_name, key):
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT md5 FROM refs WHERE bucket = ? AND key = ?", (bucket_name, key)
+            ).fetchone()
+        return row[0] if row else None
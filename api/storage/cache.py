@@ -0,0 +1,277 @@
+import app
+import hashlib
+import json
+import mmap
+import os
+import tempfile
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from storage.engine import get_byte_range
+from storage.exceptions import InvalidRangeException
+
+
+class CachedFileStream:
+    def __init__(self, file, start, length):
+        self.file = file
+        self.start = start
+        self.length = length
+        self.position = 0
+
+    def close(self):
+        self.file.close()
+
+    def fileno(self):
+        self.file.seek(self.start + self.position)
+        return self.file.fileno()
+
+    def iter_chunks(self, chunk_size=1024 * 1024):
+        try:
+            if not self.length:
+                return
+            with mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                end = self.start + self.length
+                for offset in range(self.start, end, chunk_size):
+                    yield mapped[offset : min(offset + chunk_size, end)]
+        finally:
+            self.close()
+
+    def read(self, size=-1):
+        remaining = self.length - self.position
+        if size is None or size < 0 or size > remaining:
+            size = remaining
+        self.file.seek(self.start + self.position)
+        data = self.file.read(size)
+        self.position += len(data)
+        return data
+
+
+class CacheFillStream:
+    def __init__(self, stream, cache, name, file_info):
+        self.stream = stream
+        self.cache = cache
+        self.name = name
+        self.file_info = file_info
+
+    def close(self):
+        self.stream.close()
+
+    def iter_chunks(self, chunk_size=1024 * 1024):
+        temp = self.cache.create_temporary_file()
+        complete = False
+        try:
+            for chunk in self.stream.iter_chunks(chunk_size):
+                temp.write(chunk)
+                yield chunk
+            complete = True
+        finally:
+            temp.close()
+            if complete:
+                self.cache.commit(self.name, temp.name, self.file_info)
+            else:
+                os.unlink(temp.name)
+
+
+class CachingStorageManager:
+    def __init__(self, storage_manager, cache_dir, max_size, max_object_size):
+        self.storage_manager = storage_manager
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.max_object_size = max_object_size
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=2)
+        self.filling = set()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.size = sum(size for _, size, _ in self.__scan())
+
+    def __getattr__(self, name):
+        return getattr(self.storage_manager, name)
+
+    def __evict(self):
+        entries = sorted(self.__scan(), key=lambda entry: entry[2])
+        size = sum(size for _, size, _ in entries)
+        for path, entry_size, _ in entries:
+            if size <= self.max_size * 0.9:
+                break
+            for file_path in [f"{path}.json", path]:
+                try:
+                    os.unlink(file_path)
+                except FileNotFoundError:
+                    pass
+            size -= entry_size
+            self.evictions += 1
+        self.size = size
+
+    def __fill(self, name, file_name, ticket=None):
+        try:
+            file_object = self.storage_manager.download_file(file_name, ticket=ticket)
+            fill = CacheFillStream(
+                file_object["stream"], self, name, self.__get_file_info(file_object)
+            )
+            for _ in fill.iter_chunks():
+                pass
+        except Exception as ex:
+            app.logger.warning(f"Filling download cache for {file_name} failed: {ex}")
+        finally:
+            with self.lock:
+                self.filling.discard(name)
+
+    def __get_file_info(self, file_object):
+        return {
+            "content_length": file_object["total_length"],
+            "etag": file_object.get("etag"),
+            "last_modified": (
+                file_object["last_modified"].isoformat()
+                if file_object.get("last_modified")
+                else None
+            ),
+        }
+
+    def __get_name(self, file_name, ticket=None):
+        bucket_name, key = self.storage_manager.get_object_location(file_name, ticket)
+        return hashlib.sha256(f"{bucket_name}/{key}".encode()).hexdigest()
+
+    def __get_path(self, name):
+        return os.path.join(self.cache_dir, name[:2], name)
+
+    def __open(self, name):
+        path = self.__get_path(name)
+        if not (file_info := self.__read_metadata(name)):
+            return None, None
+        try:
+            file = open(path, "rb")
+        except FileNotFoundError:
+            return None, None
+        os.utime(path)
+        return file, file_info
+
+    def __read_metadata(self, name):
+        try:
+            with open(f"{self.__get_path(name)}.json") as metadata:
+                file_info = json.load(metadata)
+        except (FileNotFoundError, ValueError):
+            return None
+        if file_info.get("last_modified"):
+            file_info["last_modified"] = datetime.fromisoformat(
+                file_info["last_modified"]
+            )
+        return file_info
+
+    def __remove(self, name):
+        path = self.__get_path(name)
+        for file_path in [f"{path}.json", path]:
+            try:
+                os.unlink(file_path)
+            except FileNotFoundError:
+                pass
+
+    def __scan(self):
+        for directory in os.scandir(self.cache_dir):
+            if not directory.is_dir():
+                continue
+            for entry in os.scandir(directory.path):
+                if entry.name.endswith(".json"):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                yield entry.path, stat.st_size, stat.st_mtime
+
+    def add_exif_data(self, mediafile, headers=None):
+        name = self.__get_name(mediafile["filename"])
+        try:
+            return self.storage_manager.add_exif_data(mediafile, headers)
+        finally:
+            self.__remove(name)
+
+    def commit(self, name, temp_path, file_info):
+        path = self.__get_path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(temp_path, path)
+        with tempfile.NamedTemporaryFile(
+            "w", dir=self.cache_dir, prefix="tmp", delete=False
+        ) as metadata:
+            json.dump(file_info, metadata)
+        os.replace(metadata.name, f"{path}.json")
+        with self.lock:
+            self.size += file_info["content_length"]
+            if self.size > self.max_size:
+                self.__evict()
+
+    def create_temporary_file(self):
+        return tempfile.NamedTemporaryFile(
+            dir=self.cache_dir, prefix="tmp", delete=False
+        )
+
+    def delete_files(self, files, on_batch_deleted=None):
+        result = self.storage_manager.delete_files(files, on_batch_deleted)
+        for file in result["deleted"]:
+            self.__remove(self.__get_name(file))
+        return result
+
+    def download_file(self, file_name, range=None, ticket=None):
+        name = self.__get_name(file_name, ticket)
+        file, file_info = self.__open(name)
+        if file:
+            with self.lock:
+                self.hits += 1
+            total_length = file_info["content_length"]
+            try:
+                start, end = (
+                    get_byte_range(range, total_length)
+                    if range
+                    else (0, total_length - 1)
+                )
+            except InvalidRangeException:
+                file.close()
+                raise
+            return {
+                "stream": CachedFileStream(file, start, end - start + 1),
+                "content_length": end - start + 1,
+                "content_range": (
+                    f"bytes {start}-{end}/{total_length}" if range else None
+                ),
+                "total_length": total_length,
+                "etag": file_info.get("etag"),
+                "last_modified": file_info.get("last_modified"),
+            }
+        with self.lock:
+            self.misses += 1
+        file_object = self.storage_manager.download_file(file_name, range, ticket)
+        if file_object["total_length"] > self.max_object_size:
+            return file_object
+        if range:
+            with self.lock:
+                if name in self.filling:
+                    return file_object
+                self.filling.add(name)
+            self.executor.submit(self.__fill, name, file_name, ticket)
+            return file_object
+        file_object["stream"] = CacheFillStream(
+            file_object["stream"], self, name, self.__get_file_info(file_object)
+        )
+        return file_object
+
+    def get_cache_stats(self):
+        with self.lock:
+            hits, misses, evictions = self.hits, self.misses, self.evictions
+            size = self.size
+        lookups = hits + misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / lookups if lookups else 0,
+            "evictions": evictions,
+            "size": size,
+            "max_size": self.max_size,
+        }
+
+    def head_file(self, file_name, ticket=None):
+        if file_info := self.__read_metadata(self.__get_name(file_name, ticket)):
+            return file_info
+        return self.storage_manager.head_file(file_name, ticket)
@@ -0,0 +1,157 @@
+import hashlib
+import math
+import re
+import sqlite3
+import threading
+
+from contextlib import contextmanager
+
+
+class BloomFilter:
+    def __init__(self, capacity, error_rate=0.01):
+        self.size = max(int(-capacity * math.log(error_rate) / math.log(2) ** 2), 8)
+        self.hash_count = max(int(round(self.size / capacity * math.log(2))), 1)
+        self.bits = bytearray(self.size // 8 + 1)
+
+    def __contains__(self, item):
+        return all(
+            self.bits[position >> 3] & (1 << (position & 7))
+            for position in self.__get_positions(item)
+        )
+
+    def __get_positions(self, item):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8]), int.from_bytes(digest[8:]) | 1
+        for i in range(self.hash_count):
+            yield (first + i * second) % self.size
+
+    def add(self, item):
+        for position in self.__get_positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+
+class DedupIndex:
+    key_pattern = re.compile(r"^([0-9a-f]{32})-")
+
+    def __init__(self, path, capacity):
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(
+            path, check_same_thread=False, isolation_level=None, timeout=60
+        )
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS files "
+            "(id INTEGER PRIMARY KEY AUTOINCREMENT, bucket TEXT NOT NULL, "
+            "md5 TEXT NOT NULL, key TEXT NOT NULL, UNIQUE (bucket, md5, key))"
+        )
+        self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS files_bucket_key ON files (bucket, key)"
+        )
+        self.bloom_filter = BloomFilter(capacity)
+        self.last_id = 0
+        self.data_version = None
+        self.__sync()
+
+    def __get_md5(self, key):
+        if match := self.key_pattern.match(key):
+            return match.group(1)
+        return None
+
+    def __is_content_md5(self, md5sum, etag):
+        etag = etag.strip('"')
+        return "-" in etag or etag == md5sum
+
+    @contextmanager
+    def __transaction(self):
+        self.connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self.connection.execute("ROLLBACK")
+            raise
+        self.connection.execute("COMMIT")
+
+    def __sync(self):
+        data_version = self.connection.execute("PRAGMA data_version").fetchone()[0]
+        if data_version == self.data_version:
+            return
+        self.data_version = data_version
+        rows = self.connection.execute(
+            "SELECT id, bucket, md5 FROM files WHERE id > ? ORDER BY id",
+            (self.last_id,),
+        )
+        for id, bucket_name, md5sum in rows:
+            self.bloom_filter.add(f"{bucket_name}/{md5sum}")
+            self.last_id = id
+
+    def add(self, bucket_name, key, content_md5sum=None):
+        if not (md5sum := self.__get_md5(key)):
+            return
+        if content_md5sum and content_md5sum != md5sum:
+            self.remove(bucket_name, [key])
+            return
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR IGNORE INTO files (bucket, md5, key) VALUES (?, ?, ?)",
+                (bucket_name, md5sum, key),
+            )
+            self.bloom_filter.add(f"{bucket_name}/{md5sum}")
+
+    def find(self, bucket_name, md5sum):
+        with self.lock:
+            if f"{bucket_name}/{md5sum}" not in self.bloom_filter:
+                self.__sync()
+                if f"{bucket_name}/{md5sum}" not in self.bloom_filter:
+                    return None
+            row = self.connection.execute(
+                "SELECT key FROM files WHERE bucket = ? AND md5 = ? ORDER BY key LIMIT 1",
+                (bucket_name, md5sum),
+            ).fetchone()
+        return row[0] if row else None
+
+    def rebuild(self, bucket_name, client):
+        paginator = client.get_paginator("list_objects_v2")
+        with self.lock:
+            self.connection.execute(
+                "CREATE TEMP TABLE IF NOT EXISTS listed_keys (key TEXT PRIMARY KEY)"
+            )
+            self.connection.execute("DELETE FROM listed_keys")
+            last_id = self.connection.execute(
+                "SELECT COALESCE(MAX(id), 0) FROM files"
+            ).fetchone()[0]
+        count = 0
+        for page in paginator.paginate(Bucket=bucket_name):
+            rows = [
+                (bucket_name, md5sum, item["Key"])
+                for item in page.get("Contents", [])
+                if (md5sum := self.__get_md5(item["Key"]))
+                and self.__is_content_md5(md5sum, item.get("ETag", ""))
+            ]
+            with self.lock, self.__transaction():
+                self.connection.executemany(
+                    "INSERT OR IGNORE INTO files (bucket, md5, key) VALUES (?, ?, ?)",
+                    rows,
+                )
+                self.connection.executemany(
+                    "INSERT OR IGNORE INTO listed_keys (key) VALUES (?)",
+                    [(key,) for _, _, key in rows],
+                )
+            count += len(rows)
+        with self.lock:
+            with self.__transaction():
+                self.connection.execute(
+                    "DELETE FROM files WHERE bucket = ? AND id <= ? "
+                    "AND key NOT IN (SELECT key FROM listed_keys)",
+                    (bucket_name, last_id),
+                )
+                self.connection.execute("DELETE FROM listed_keys")
+            self.data_version = None
+            self.__sync()
+        return count
+
+    def remove(self, bucket_name, keys):
+        with self.lock:
+            self.connection.executemany(
+                "DELETE FROM files WHERE bucket = ? AND key = ?",
+                [(bucket_name, key) for key in keys],
+            )
@@ -0,0 +1,68 @@
+import copy
+import threading
+import time
+
+from collections import OrderedDict
+
+
+class DocumentCache:
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.keys_by_id = dict()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def __remove(self, key):
+        self.entries.pop(key, None)
+        if keys := self.keys_by_id.get(key[0]):
+            keys.discard(key)
+            if not keys:
+                del self.keys_by_id[key[0]]
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry and entry[0] > time.monotonic():
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return copy.deepcopy(entry[1])
+            if entry:
+                self.__remove(key)
+            self.misses += 1
+        return None
+
+    def get_stats(self):
+        with self.lock:
+            hits, misses = self.hits, self.misses
+            invalidations, size = self.invalidations, len(self.entries)
+        lookups = hits + misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / lookups if lookups else 0,
+            "invalidations": invalidations,
+            "size": size,
+            "max_size": self.max_entries,
+        }
+
+    def invalidate(self, ids):
+        with self.lock:
+            for id in ids:
+                for key in list(self.keys_by_id.get(id, [])):
+                    self.__remove(key)
+                    self.invalidations += 1
+
+    def set(self, key, document, ttl=None):
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        if not self.max_entries or ttl <= 0:
+            return
+        with self.lock:
+            self.__remove(key)
+            self.entries[key] = (time.monotonic() + ttl, copy.deepcopy(document))
+            self.keys_by_id.setdefault(key[0], set()).add(key)
+            while len(self.entries) > self.max_entries:
+                self.__remove(next(iter(self.entries)))
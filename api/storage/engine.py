@@ -0,0 +1,750 @@
+import app
+import io
+import os
+import re
+import requests
+import time
+
+from abc import ABC, abstractmethod
+from cloudevents.conversion import to_dict
+from cloudevents.http import CloudEvent
+from dateutil import parser
+from elody.error_codes import ErrorCode, get_error_code, get_read, get_write
+from elody.exceptions import DuplicateFileException, NotFoundException
+from elody.util import get_mimetype_from_filename
+from humanfriendly import parse_size
+from metrics import instrument_session, observe_stage, time_stage
+from PIL import Image, ExifTags, TiffImagePlugin
+from requests.adapters import HTTPAdapter
+from storage.document_cache import DocumentCache
+from storage.exceptions import (
+    InvalidRangeException,
+    UnsupportedImageException,
+    UnsupportedOperationException,
+)
+from storage.exif import rewrite_exif
+from storage.hashing import get_digest_algorithms
+from storage.ingest import IngestStream
+from storage.metadata import get_image_metadata
+from urllib.parse import urlparse
+
+storage_engines = dict()
+
+
+def get_byte_range(range, total_length):
+    start, end = range.removeprefix("bytes=").split("-")
+    if not start:
+        start, end = max(total_length - int(end), 0), total_length - 1
+    else:
+        start = int(start)
+        end = min(int(end), total_length - 1) if end else total_length - 1
+    if start > end:
+        raise InvalidRangeException(
+            f"{get_error_code(ErrorCode.INVALID_INPUT, get_read())} Range {range} not satisfiable"
+        )
+    return start, end
+
+
+def get_storage_engine_class(name):
+    if name not in storage_engines:
+        raise Exception(f"Unknown storage engine {name}")
+    return storage_engines[name]
+
+
+def is_immutable_key(key):
+    if get_mimetype_from_filename(key).startswith("image"):
+        return False
+    return re.match("[0-9a-f]{32}-", key.split("/")[-1]) is not None
+
+
+def register_storage_engine(name):
+    def decorator(storage_engine):
+        storage_engines[name] = storage_engine
+        return storage_engine
+
+    return decorator
+
+
+def validate_md5(md5sum):
+    if not re.fullmatch("[0-9a-f]{32}", md5sum):
+        raise Exception(
+            f"{get_error_code(ErrorCode.INVALID_FORMAT, get_write())} {md5sum} is not a hexadecimal md5 digest"
+        )
+
+
+class StorageEngine(ABC):
+    def __init__(self):
+        self.collection_api_url = os.getenv("COLLECTION_API_URL")
+        self.storage_api_url = os.getenv("STORAGE_API_URL")
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_maxsize=int(os.getenv("COLLECTION_API_POOL_SIZE", 20))
+        )
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        instrument_session(self.session)
+        self.mediafile_cache = DocumentCache(
+            int(os.getenv("DOCUMENT_CACHE_SIZE", 10000)),
+            float(os.getenv("MEDIAFILE_CACHE_TTL", 30)),
+        )
+        self.ticket_cache = DocumentCache(
+            int(os.getenv("DOCUMENT_CACHE_SIZE", 10000)),
+            float(os.getenv("TICKET_CACHE_TTL", 60)),
+        )
+        self.duplicate_file_check = os.getenv("DUPLICATE_FILE_CHECK", True)
+        self.unique_check_concurrency = int(os.getenv("UNIQUE_CHECK_CONCURRENCY", 16))
+        self.delete_batch_size = min(int(os.getenv("DELETE_BATCH_SIZE", 1000)), 1000)
+        self.exif_header_size = parse_size(os.getenv("EXIF_HEADER_SIZE", "4 MiB"))
+        self.streaming_exif_rewrite = os.getenv("STREAMING_EXIF_REWRITE", True) in [
+            "True",
+            "true",
+            True,
+        ]
+        self.content_digests = get_digest_algorithms(
+            os.getenv("CONTENT_DIGESTS", "md5").split(",")
+        )
+        self.hash_buffer_size = parse_size(os.getenv("HASH_BUFFER_SIZE", "4 MiB"))
+        self.__check_feature_flags()
+
+    def __check_feature_flags(self):
+        if os.getenv("PRESIGNED_URLS", False) in ["True", "true", True] and (
+            type(self).get_download_url is StorageEngine.get_download_url
+        ):
+            raise self.__get_unsupported_exception("Presigned URLs")
+
+    def __get_unsupported_exception(self, feature):
+        return UnsupportedOperationException(
+            f"{get_error_code(ErrorCode.INVALID_INPUT, get_write())} {feature} is not supported by the {self.__class__.__name__}"
+        )
+
+    def __get_checksums(self, ingest):
+        if len(self.content_digests) > 1:
+            return ingest.get_digests()
+        return None
+
+    def __get_exif_for_mediafile(self, mediafile):
+        artist = f'source: {self.__get_item_metadata_value(mediafile, "source")}'
+        if photographer := self.__get_item_metadata_value(mediafile, "photographer"):
+            artist = f"photographer: {photographer}, {artist}"
+        rights = f'license: {self.__get_item_metadata_value(mediafile, "rights")}'
+        if copyrights := self.__get_item_metadata_value(mediafile, "copyright"):
+            rights = f"rightsholder: {copyrights}, {rights}"
+        return artist, rights
+
+    def __get_exif_data_from_header(self, ingest):
+        try:
+            return self._get_technical_metadata(ingest.get_header())
+        except (OSError, SyntaxError, ValueError) as ex:
+            app.logger.warning(f"Could not extract EXIF data from file header: {ex}")
+            return list()
+
+    def __get_item_metadata_value(self, item, key):
+        for entry in item["metadata"]:
+            if entry["key"] == key:
+                return entry["value"]
+        return False
+
+    def __get_mediafile_ids(self, mediafile):
+        ids = [mediafile.get("_id"), mediafile.get("_key")]
+        return [id for id in ids + mediafile.get("identifiers", []) if id]
+
+    def __get_raw_id(self, item):
+        return item.get("_key", item["_id"])
+
+    def __get_tenant(self, headers=None):
+        return self.__get_headers(headers).get("apikey")
+
+    def __get_headers(self, headers=None):
+        if headers:
+            return headers
+        if apikey := os.getenv("STATIC_APIKEY"):
+            return {
+                "Authorization": f'Bearer {os.getenv("STATIC_JWT")}',
+                "apikey": apikey,
+            }
+        return {"Authorization": f'Bearer {os.getenv("STATIC_JWT")}'}
+
+    def __handle_duplicate_file(
+        self, mediafile, mimetype, md5sum, filename, message, headers=None
+    ):
+        try:
+            found_mediafile = self._get_mediafile(md5sum, headers=headers, cached=False)
+        except NotFoundException:
+            self.__update_mediafile_information(
+                mediafile, md5sum, filename, mimetype, headers=headers
+            )
+            message = (
+                f"{message} No existing mediafile for file found, not deleting new one."
+            )
+            raise DuplicateFileException(
+                f"{get_error_code(ErrorCode.DUPLICATE_FILE, get_write())} {message}"
+            )
+        mediafile_id = self.__get_raw_id(mediafile)
+        if self.__get_raw_id(found_mediafile) != mediafile_id:
+            self.session.delete(
+                f"{self.collection_api_url}/mediafiles/{mediafile_id}",
+                headers=self.__get_headers(headers),
+            )
+            self.invalidate_mediafile(mediafile)
+            message = f"{message} Existing mediafile for file found, deleting new one."
+        if self.is_metadata_updated(found_mediafile, mediafile):
+            message = f"{message} Metadata not up-to-date, updating."
+            payload = {"metadata": mediafile.get("metadata", [])}
+            self.session.patch(
+                f"{self.collection_api_url}/mediafiles/{md5sum}",
+                json=payload,
+                headers=self.__get_headers(headers),
+            )
+            self.invalidate_mediafile(found_mediafile)
+        raise DuplicateFileException(
+            f"{get_error_code(ErrorCode.DUPLICATE_FILE, get_write())} {message}"
+        )
+
+    def __promote(self, ingest, staging_key, copy_source, key, ticket=None):
+        if copy_source:
+            return self._copy_object(copy_source, key, ticket, ingest)
+        return self._promote_staging_object(staging_key, key, ticket, ingest)
+
+    def __replace_file(self, file_name, stream):
+        ingest, staging_key = self._stream_to_staging(stream, file_name)
+        try:
+            self._promote_staging_object(
+                staging_key, self._get_key(file_name), ingest=ingest
+            )
+        finally:
+            self._remove_staging_object(staging_key)
+
+    def __rewrite_exif_in_memory(self, file_name, tags):
+        image = self.download_file(file_name)["stream"]
+        img = Image.open(image)
+        exif = img.getexif()
+        exif.update(tags)
+        buf = io.BytesIO()
+        img.save(buf, img.format, exif=exif)
+        buf.seek(0)
+        self.__replace_file(file_name, buf)
+        return exif
+
+    def __rewrite_exif_streaming(self, file_name, tags):
+        file_object = self.download_file(file_name)
+        try:
+            stream, exif = rewrite_exif(
+                file_object["stream"],
+                tags,
+                file_object["content_length"],
+                lambda start, end: self.download_file(
+                    file_name, f"bytes={start}-{end - 1}"
+                )["stream"].read(),
+                self.exif_header_size,
+            )
+        except UnsupportedImageException as ex:
+            file_object["stream"].close()
+            app.logger.info(f"Falling back to in-memory EXIF rewrite: {ex}")
+            return None
+        try:
+            self.__replace_file(file_name, stream)
+        finally:
+            stream.close()
+        return exif
+
+    def __signal_file_uploaded(self, mediafile, mimetype, url, headers, ticket=None):
+        attributes = {"type": "dams.file_uploaded", "source": "dams"}
+        data = {
+            "mediafile": mediafile,
+            "mimetype": mimetype,
+            "url": url,
+            "headers": headers,
+            "ticket": ticket,
+        }
+        event = to_dict(CloudEvent(attributes, data))
+        app.rabbit.send(event, routing_key="dams.file_uploaded")
+
+    def __stage_upload(self, file, key, ticket=None, md5sum=None):
+        if md5sum:
+            validate_md5(md5sum)
+        copy_source = self._find_copy_source(md5sum, ticket) if md5sum else None
+        if copy_source and (ingest := self._open_copy_source(copy_source, md5sum)):
+            return ingest, None, copy_source
+        with time_stage("store"):
+            ingest, staging_key = self._stream_to_staging(file, key, ticket)
+        if md5sum and ingest.get_md5() != md5sum:
+            self._remove_staging_object(staging_key, ticket)
+            raise Exception(
+                f"{get_error_code(ErrorCode.INVALID_INPUT, get_write())} Uploaded content has md5 {ingest.get_md5()}, expected {md5sum}"
+            )
+        return ingest, staging_key, None
+
+    def __update_mediafile_information(
+        self,
+        mediafile,
+        md5sum,
+        new_key,
+        mimetype,
+        exif_data=None,
+        headers=None,
+        checksums=None,
+        etag=None,
+    ):
+        new_key = new_key.split("/")[-1]
+        mediafile["identifiers"].append(md5sum)
+        if checksums:
+            mediafile["checksums"] = checksums
+        if etag:
+            mediafile["etag"] = etag
+        mediafile["original_filename"] = mediafile["filename"]
+        mediafile["filename"] = new_key
+        mediafile["original_file_location"] = f"/download/{new_key}"
+        mediafile["thumbnail_file_location"] = (
+            f"/iiif/3/{new_key}/full/,150/0/default.jpg"
+        )
+        mediafile["mimetype"] = mimetype
+        if exif_data:
+            mediafile["technical_metadata"] = exif_data
+        self.session.put(
+            f"{self.collection_api_url}/mediafiles/{self.__get_raw_id(mediafile)}",
+            json=mediafile,
+            headers=self.__get_headers(headers),
+        )
+        self.invalidate_mediafile(mediafile)
+
+    def _copy_object(self, copy_source, key, ticket=None, ingest=None):
+        raise self.__get_unsupported_exception("Server-side copies")
+
+    def _find_copy_source(self, md5sum, ticket=None):
+        return None
+
+    @abstractmethod
+    def _find_existing_file(self, md5sum, ticket=None):
+        pass
+
+    def _get_mediafile(self, mediafile_id, fatal=True, headers=None, cached=True):
+        cache_key, url, headers = self._get_mediafile_request(mediafile_id, headers)
+        if cached and (mediafile := self.mediafile_cache.get(cache_key)):
+            return mediafile
+        return self._read_mediafile_response(
+            self.session.get(url, headers=headers), cache_key, fatal
+        )
+
+    def _get_mediafile_request(self, mediafile_id, headers=None):
+        return (
+            (mediafile_id, self.__get_tenant(headers)),
+            f"{self.collection_api_url}/mediafiles/{mediafile_id}",
+            self.__get_headers(headers),
+        )
+
+    def _get_ticket_request(self, ticket_id, api_key_hash=None, headers=None):
+        request_url = f"{self.collection_api_url}/tickets/{ticket_id}"
+        if api_key_hash:
+            request_url = f"{request_url}?api_key_hash={api_key_hash}"
+        return (
+            (ticket_id, self.__get_tenant(headers), api_key_hash),
+            request_url,
+            self.__get_headers(headers),
+        )
+
+    def _open_copy_source(self, copy_source, md5sum):
+        raise self.__get_unsupported_exception("Server-side copies")
+
+    @abstractmethod
+    def _promote_staging_object(self, staging_key, key, ticket=None, ingest=None):
+        pass
+
+    @abstractmethod
+    def _remove_staging_object(self, staging_key, ticket=None):
+        pass
+
+    @abstractmethod
+    def _stream_to_staging(self, file, key, ticket=None):
+        pass
+
+    def abort_upload_session(self, session_id, ticket=None):
+        raise self.__get_unsupported_exception("Upload sessions")
+
+    def add_exif_data(self, mediafile, headers=None):
+        if "image" not in mediafile["mimetype"]:
+            return
+        artist, rights = self.__get_exif_for_mediafile(mediafile)
+        tags = {0x013B: artist, 0x8298: rights}
+        exif = None
+        if self.streaming_exif_rewrite:
+            exif = self.__rewrite_exif_streaming(mediafile["filename"], tags)
+        if exif is None:
+            exif = self.__rewrite_exif_in_memory(mediafile["filename"], tags)
+        self.session.patch(
+            f'{self.collection_api_url}/mediafiles/{mediafile["identifiers"][0]}',
+            json={"exif": str(exif)},
+            headers=self.__get_headers(headers),
+        )
+        self.invalidate_mediafile(mediafile)
+
+    def check_file_exists(self, filename, md5sum, ticket=None):
+        if self.duplicate_file_check in ["True", True, "true"]:
+            if existing_file := self._find_existing_file(md5sum, ticket):
+                error_message = (
+                    f"Duplicate file {filename} matches existing file {existing_file}."
+                )
+                raise DuplicateFileException(
+                    f"{get_error_code(ErrorCode.DUPLICATE_FILE, get_write())} {error_message}",
+                    existing_file,
+                    md5sum,
+                )
+
+    @abstractmethod
+    def check_health(self):
+        pass
+
+    def collect_garbage(self):
+        raise self.__get_unsupported_exception("Blob garbage collection")
+
+    def complete_upload_session(
+        self, session_id, ticket=None, headers=None, md5sum=None
+    ):
+        raise self.__get_unsupported_exception("Upload sessions")
+
+    def create_upload_session(self, key, mediafile_id, ticket=None, headers=None):
+        raise self.__get_unsupported_exception("Upload sessions")
+
+    def create_ingest_stream(self, file=None):
+        return IngestStream(
+            file, self.exif_header_size, self.content_digests, self.hash_buffer_size
+        )
+
+    @abstractmethod
+    def delete_files(self, files, on_batch_deleted=None):
+        pass
+
+    @abstractmethod
+    def download_file(self, file_name, range=None, ticket=None):
+        pass
+
+    def finalize_upload(
+        self,
+        ingest,
+        staging_key,
+        mediafile_id,
+        mediafile,
+        key,
+        ticket,
+        headers,
+        copy_source=None,
+    ):
+        try:
+            md5sum = ingest.get_md5()
+            for algorithm, duration in ingest.get_hash_timings().items():
+                observe_stage(algorithm, duration)
+            with time_stage("mimetype"):
+                mimetype = ingest.get_mimetype(key)
+            with time_stage("exif"):
+                exif_data = (
+                    self.__get_exif_data_from_header(ingest)
+                    if mimetype.startswith("image")
+                    else list()
+                )
+            if mediafile:
+                mediafile = self._get_mediafile(
+                    mediafile_id, fatal=ticket is None, headers=headers, cached=False
+                )
+            if mediafile:
+                mediafile["file_creation_date"] = (
+                    self._check_keys_and_extract_creation_dates(exif_data)
+                )
+            try:
+                with time_stage("duplicate_check"):
+                    self.check_file_exists(key, md5sum, ticket)
+            except DuplicateFileException as ex:
+                if mediafile:
+                    self.__handle_duplicate_file(
+                        mediafile,
+                        mimetype,
+                        ex.md5sum,
+                        ex.filename,
+                        ex.message,
+                        headers,
+                    )
+            key = self._get_key(key, md5sum=md5sum, ticket=ticket)
+            with time_stage("promote"):
+                etag = self.__promote(ingest, staging_key, copy_source, key, ticket)
+        finally:
+            if staging_key:
+                self._remove_staging_object(staging_key, ticket)
+        if mediafile:
+            with time_stage("mediafile_update"):
+                self.__update_mediafile_information(
+                    mediafile,
+                    md5sum,
+                    key,
+                    mimetype,
+                    exif_data,
+                    headers,
+                    self.__get_checksums(ingest),
+                    etag,
+                )
+            mediafile = self._get_mediafile(
+                mediafile_id, fatal=ticket is None, headers=headers
+            )
+            download_url = urlparse(mediafile["original_file_location"])
+            with time_stage("event"):
+                self.__signal_file_uploaded(
+                    mediafile,
+                    mimetype,
+                    f"{self.storage_api_url.replace('/storage/v1/', '')}{download_url.path}?{download_url.query}",
+                    self.__get_headers(headers),
+                    ticket,
+                )
+
+    @abstractmethod
+    def find_existing_files(self, md5sums, ticket=None):
+        pass
+
+    def expire_upload_sessions(self, bucket_name=None):
+        raise self.__get_unsupported_exception("Upload sessions")
+
+    def get_document_cache_stats(self):
+        return {
+            "mediafiles": self.mediafile_cache.get_stats(),
+            "tickets": self.ticket_cache.get_stats(),
+        }
+
+    def get_download_url(self, file_name, ticket=None):
+        raise self.__get_unsupported_exception("Presigned URLs")
+
+    @abstractmethod
+    def get_file_info(self, file_name, ticket=None):
+        pass
+
+    def get_ticket(self, ticket_id, api_key_hash=None, headers=None):
+        cache_key, url, headers = self._get_ticket_request(
+            ticket_id, api_key_hash, headers
+        )
+        if not (ticket := self.ticket_cache.get(cache_key)):
+            ticket = self._read_ticket_response(
+                self.session.get(url, headers=headers), ticket_id, cache_key
+            )
+        return self._check_ticket(ticket)
+
+    def get_upload_session(self, session_id, ticket=None):
+        raise self.__get_unsupported_exception("Upload sessions")
+
+    def get_upload_session_part_url(self, session_id, part_number, ticket=None):
+        raise self.__get_unsupported_exception("Upload sessions")
+
+    def get_keys_for_files(self, files):
+        for file in files:
+            if isinstance(file, str):
+                yield file
+                continue
+            for field in ["filename", "transcode_filename", "thumbnail_filename"]:
+                if file.get(field):
+                    yield file[field]
+
+    @abstractmethod
+    def get_object_location(self, file_name, ticket=None):
+        pass
+
+    def get_stream_generator(self, stream, chunk_size=1024 * 1024):
+        return stream.iter_chunks(chunk_size)
+
+    @abstractmethod
+    def head_file(self, file_name, ticket=None):
+        pass
+
+    def invalidate_mediafile(self, mediafile):
+        self.mediafile_cache.invalidate(self.__get_mediafile_ids(mediafile))
+
+    def is_metadata_updated(self, old_mediafile, new_mediafile):
+        old_metadata = old_mediafile.get("metadata", [])
+        new_metadata = new_mediafile.get("metadata", [])
+        if len(old_metadata) != len(new_metadata):
+            return True
+        unmatched = list(old_metadata)
+        for item in new_metadata:
+            try:
+                unmatched.remove(item)
+            except ValueError:
+                return True
+        return len(unmatched) > 0
+
+    def _check_ticket(self, ticket):
+        if ticket.get("is_expired", True):
+            raise Exception(
+                f"{get_error_code(ErrorCode.TICKET_EXPIRED, get_write())} Ticket is expired"
+            )
+        return ticket
+
+    def _get_bucket_name(self, ticket=None):
+        if ticket:
+            return ticket["bucket"]
+        if bucket := os.getenv("MINIO_BUCKET"):
+            return bucket
+        raise Exception(
+            f"{get_error_code(ErrorCode.NO_BUCKET_SPECIFIED, get_write())} No bucket for upload was specified"
+        )
+
+    def _get_key(self, key, md5sum=None, ticket=None, transcode=False):
+        input_key = ticket["location"] if ticket else key
+        split_key = input_key.split("/")
+        if transcode:
+            split_key[-1] = f"transcode-{split_key[-1]}"
+        if md5sum:
+            split_key[-1] = f"{md5sum}-{split_key[-1]}"
+        return "/".join(split_key)
+
+    def _get_exif_data(self, file):
+        image = Image.open(file)
+        exif_data = image.getexif()._get_merged_dict()
+        file.seek(0)
+        data = []
+        if exif_data is None:
+            return None
+        for key, value in exif_data.items():
+            if key in ExifTags.TAGS:
+                value = self._handle_value_to_be_serializable(value)
+                data.append({"key": ExifTags.TAGS[key], "value": value})
+        return data
+
+    def _get_technical_metadata(self, file):
+        try:
+            exif, properties = get_image_metadata(file.getvalue())
+        except UnsupportedImageException:
+            return self._get_exif_data(file)
+        data = [
+            {
+                "key": ExifTags.TAGS[key],
+                "value": self._handle_value_to_be_serializable(value),
+            }
+            for key, value in exif._get_merged_dict().items()
+            if key in ExifTags.TAGS
+        ]
+        data.extend({"key": key, "value": value} for key, value in properties.items())
+        return data
+
+    def _handle_value_to_be_serializable(self, value):
+        if isinstance(value, TiffImagePlugin.IFDRational):
+            return str(value)
+        elif isinstance(value, bytes):
+            return "(Binary data suppressed)"
+        elif isinstance(value, (tuple, list)):
+            return [self._handle_value_to_be_serializable(v) for v in value]
+        elif isinstance(value, dict):
+            return {
+                k: self._handle_value_to_be_serializable(v) for k, v in value.items()
+            }
+        else:
+            return value
+
+    def _check_keys_and_extract_creation_dates(self, exif_data):
+        keys_to_check = [
+            "exif_datetime",
+            "Xmp.xmp.CreateDate",
+            "Xmp.xmp.MetadataDate",
+            "Xmp.dc.date",
+            "DateTimeDigitized",
+            "DateTimeOriginal",
+        ]
+        for item in exif_data:
+            if item["key"] in keys_to_check:
+                date_str = item["value"]
+                try:
+                    date_obj = parser.parse(date_str)
+                    iso_date_str = date_obj.isoformat()
+                    return iso_date_str
+                except ValueError:
+                    return date_str
+        return None
+
+    def _read_mediafile_response(self, response, cache_key, fatal=True):
+        if response.status_code == 200:
+            mediafile = response.json()
+            self.mediafile_cache.set(cache_key, mediafile)
+            return mediafile
+        elif not fatal:
+            return None
+        elif response.status_code == 404:
+            raise NotFoundException(
+                f"{get_error_code(ErrorCode.MEDIAFILE_NOT_FOUND, get_write())} Could not get mediafile with provided id"
+            )
+        else:
+            raise Exception(
+                f"{get_error_code(ErrorCode.MEDIAFILE_NOT_FOUND, get_write())} Something went wrong while getting mediafile"
+            )
+
+    def _read_ticket_response(self, response, ticket_id, cache_key):
+        if response.status_code != 200:
+            raise NotFoundException(
+                f"{get_error_code(ErrorCode.TICKET_NOT_FOUND, get_write())} Ticket with id {ticket_id} not found"
+            )
+        ticket = response.json()
+        expiry = ticket.get("exp")
+        if not ticket.get("is_expired", True) and isinstance(expiry, (int, float)):
+            self.ticket_cache.set(cache_key, ticket, expiry - time.time())
+        return ticket
+
+    def rebuild_blob_index(self, bucket_names=None, concurrency=16):
+        raise self.__get_unsupported_exception("The blob index")
+
+    def rebuild_dedup_index(self, bucket_name=None):
+        raise self.__get_unsupported_exception("The deduplication index")
+
+    def scrub(self, bucket_name=None, prefixes=("",), concurrency=16, rate=100):
+        raise self.__get_unsupported_exception("Integrity scrubbing")
+
+    def upload_file(self, file, mediafile_id, key, ticket, headers=None, md5sum=None):
+        mediafile = self._get_mediafile(
+            mediafile_id, fatal=ticket is None, headers=headers
+        )
+        ingest, staging_key, copy_source = self.__stage_upload(
+            file, key, ticket, md5sum
+        )
+        self.finalize_upload(
+            ingest,
+            staging_key,
+            mediafile_id,
+            mediafile,
+            key,
+            ticket,
+            headers,
+            copy_source,
+        )
+
+    def upload_session_part(self, session_id, part_number, stream, ticket=None):
+        raise self.__get_unsupported_exception("Upload sessions")
+
+    def upload_transcode(
+        self, file, mediafile_id, key, ticket, headers=None, md5sum=None
+    ):
+        mediafile = self._get_mediafile(mediafile_id, headers=headers)
+        ingest, staging_key, copy_source = self.__stage_upload(
+            file, key, ticket, md5sum
+        )
+        try:
+            md5sum = ingest.get_md5()
+            key = self._get_key(key, md5sum=md5sum, transcode=True, ticket=ticket)
+            mimetype = ingest.get_mimetype(key)
+            self.check_file_exists(key, md5sum)
+            etag = self.__promote(ingest, staging_key, copy_source, key, ticket)
+        finally:
+            if staging_key:
+                self._remove_staging_object(staging_key, ticket)
+        mediafile["identifiers"].append(md5sum)
+        new_key = key.split("/")[-1]
+        data = {
+            "filename": key,
+            "md5sum": md5sum,
+            "transcode_file_location": f"/download/{new_key}",
+            "thumbnail_file_location": f"/iiif/3/{new_key}/full/,150/0/default.jpg",
+            "mimetype": mimetype,
+        }
+        if checksums := self.__get_checksums(ingest):
+            data["checksums"] = checksums
+        if etag:
+            data["etag"] = etag
+        try:
+            self.session.post(
+                f"{self.collection_api_url}/mediafiles/{mediafile_id}/derivatives",
+                json=data,
+                headers=self.__get_headers(headers),
+            )
+        except Exception as ex:
+            raise Exception(str(ex))
+        finally:
+            self.invalidate_mediafile(mediafile)
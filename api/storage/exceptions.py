@@ -0,0 +1,14 @@
+class IntegrityException(Exception):
+    pass
+
+
+class InvalidRangeException(Exception):
+    pass
+
+
+class UnsupportedImageException(Exception):
+    pass
+
+
+class UnsupportedOperationException(Exception):
+    pass
@@ -0,0 +1,187 @@
+import struct
+import zlib
+
+from PIL import Image
+from storage.exceptions import UnsupportedImageException
+
+JPEG_SIGNATURE = b"\xff\xd8"
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+TIFF_SIGNATURES = [b"II*\x00", b"MM\x00*"]
+
+
+class MetadataRewriteStream:
+    def __init__(self, head, stream, tail=b""):
+        self.stream = stream
+        self.parts = [memoryview(bytes(head)), stream, memoryview(tail)]
+
+    def close(self):
+        self.stream.close()
+
+    def read(self, size=-1):
+        data = bytearray()
+        while self.parts and (size is None or size < 0 or len(data) < size):
+            part = self.parts[0]
+            missing = -1 if size is None or size < 0 else size - len(data)
+            if isinstance(part, memoryview):
+                chunk = part if missing < 0 else part[:missing]
+                self.parts[0] = part[len(chunk) :]
+            else:
+                chunk = part.read(missing)
+            if not chunk:
+                self.parts.pop(0)
+                continue
+            data += chunk
+        return bytes(data)
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return False
+
+
+class RangeReader:
+    def __init__(self, read_range, size):
+        self.read_range = read_range
+        self.size = size
+        self.position = 0
+
+    def read(self, size=-1):
+        end = self.size if size is None or size < 0 else self.position + size
+        end = min(end, self.size)
+        if end <= self.position:
+            return b""
+        data = self.read_range(self.position, end)
+        self.position += len(data)
+        return data
+
+    def seek(self, offset, whence=0):
+        if whence == 1:
+            offset += self.position
+        elif whence == 2:
+            offset += self.size
+        self.position = offset
+        return self.position
+
+    def tell(self):
+        return self.position
+
+
+def read_exact(stream, size):
+    data = bytearray()
+    while len(data) < size:
+        if not (chunk := stream.read(size - len(data))):
+            raise UnsupportedImageException("Unexpected end of image")
+        data += chunk
+    return bytes(data)
+
+
+def rewrite_exif(stream, tags, size, read_range, max_header_size):
+    signature = read_exact(stream, 8)
+    try:
+        if signature.startswith(JPEG_SIGNATURE):
+            return __rewrite_jpeg(signature, stream, tags, max_header_size)
+        if signature == PNG_SIGNATURE:
+            return __rewrite_png(signature, stream, tags, max_header_size)
+        if signature[:4] in TIFF_SIGNATURES:
+            return __rewrite_tiff(signature, stream, tags, size, read_range)
+    except struct.error as ex:
+        raise UnsupportedImageException(f"Malformed image: {ex}")
+    raise UnsupportedImageException("Unsupported image format")
+
+
+def __get_exif(data, tags):
+    exif = Image.Exif()
+    exif.load(data)
+    exif.update(tags)
+    return exif
+
+
+def __rewrite_jpeg(signature, stream, tags, max_header_size):
+    stream = MetadataRewriteStream(signature[2:], stream)
+    app0_segments = bytearray()
+    segments = bytearray()
+    exif_data = None
+    while True:
+        marker = read_exact(stream, 2)
+        if marker[0] != 0xFF:
+            raise UnsupportedImageException("Invalid JPEG marker")
+        if not 0xE0 <= marker[1] <= 0xEF:
+            break
+        length = read_exact(stream, 2)
+        data = read_exact(stream, max(struct.unpack(">H", length)[0] - 2, 0))
+        if marker[1] == 0xE1 and data.startswith(b"Exif\x00\x00"):
+            if exif_data is None:
+                exif_data = data
+        elif marker[1] == 0xE0 and not segments:
+            app0_segments += marker + length + data
+        else:
+            segments += marker + length + data
+        if len(app0_segments) + len(segments) > max_header_size:
+            raise UnsupportedImageException("JPEG header exceeds maximum size")
+    exif = __get_exif(exif_data or b"", tags)
+    head = JPEG_SIGNATURE + app0_segments + __get_jpeg_exif_segment(exif) + segments
+    return MetadataRewriteStream(head + marker, stream), exif
+
+
+def __get_jpeg_exif_segment(exif):
+    data = exif.tobytes()
+    if len(data) > 65533:
+        raise UnsupportedImageException("EXIF data does not fit in a JPEG segment")
+    return b"\xff\xe1" + struct.pack(">H", len(data) + 2) + data
+
+
+def __rewrite_png(signature, stream, tags, max_header_size):
+    head = bytearray(signature)
+    exif = None
+    while True:
+        length, chunk_type = struct.unpack(">I4s", read_exact(stream, 8))
+        if chunk_type in [b"IDAT", b"IEND"]:
+            if exif is None:
+                exif = __get_exif(b"", tags)
+            data = exif.tobytes()[6:]
+            head += struct.pack(">I4s", len(data), b"eXIf") + data
+            head += struct.pack(">I", zlib.crc32(b"eXIf" + data))
+            head += struct.pack(">I4s", length, chunk_type)
+            return MetadataRewriteStream(head, stream), exif
+        data = read_exact(stream, length + 4)
+        if chunk_type == b"eXIf":
+            exif = __get_exif(data[:-4], tags)
+        else:
+            head += struct.pack(">I4s", length, chunk_type) + data
+        if len(head) > max_header_size:
+            raise UnsupportedImageException("PNG header exceeds maximum size")
+
+
+def __rewrite_tiff(signature, stream, tags, size, read_range):
+    endian = "<" if signature.startswith(b"II") else ">"
+    offset = struct.unpack(f"{endian}I", signature[4:])[0]
+    entry_count = struct.unpack(f"{endian}H", read_range(offset, offset + 2))[0]
+    ifd = read_range(offset + 2, offset + 2 + entry_count * 12 + 4)
+    entries = {
+        struct.unpack(f"{endian}H", ifd[index : index + 2])[0]: ifd[index : index + 12]
+        for index in range(0, entry_count * 12, 12)
+    }
+    padding = size % 2
+    ifd_offset = size + padding
+    value_offset = ifd_offset + 2 + len(entries | tags) * 12 + 4
+    values = bytearray()
+    for tag, value in tags.items():
+        value = value.encode("ascii", "replace") + b"\x00"
+        entry = struct.pack(f"{endian}HHI", tag, 2, len(value))
+        if len(value) <= 4:
+            entries[tag] = entry + value.ljust(4, b"\x00")
+            continue
+        entries[tag] = entry + struct.pack(f"{endian}I", value_offset + len(values))
+        values += value + b"\x00" * (len(value) % 2)
+    if value_offset + len(values) >= 2**32:
+        raise UnsupportedImageException("TIFF exceeds maximum size")
+    tail = bytearray(b"\x00" * padding)
+    tail += struct.pack(f"{endian}H", len(entries))
+    tail += b"".join(entry for _, entry in sorted(entries.items()))
+    tail += ifd[-4:] + values
+    head = signature[:4] + struct.pack(f"{endian}I", ifd_offset)
+    exif = Image.Exif()
+    exif.load_from_fp(RangeReader(read_range, size))
+    exif.update(tags)
+    return MetadataRewriteStream(head, stream, bytes(tail)), exif
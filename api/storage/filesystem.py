@@ -0,0 +1,189 @@
+import app
+import hashlib
+import os
+import re
+import tempfile
+
+from datetime import datetime, timezone
+from elody.error_codes import ErrorCode, get_error_code, get_write
+from elody.exceptions import FileNotFoundException
+from elody.util import get_mimetype_from_filename
+from humanfriendly import parse_size
+from storage.cache import CachedFileStream
+from storage.engine import StorageEngine, get_byte_range, register_storage_engine
+from urllib.parse import quote, unquote
+
+
+@register_storage_engine("filesystem")
+class FilesystemStorageManager(StorageEngine):
+    key_pattern = re.compile(r"^([0-9a-f]{32})-")
+
+    def __init__(self):
+        super().__init__()
+        self.root = os.getenv("FILESYSTEM_STORAGE_ROOT", "/data/storage")
+        self.staging_dir = os.path.join(self.root, ".staging")
+        self.chunk_size = parse_size(os.getenv("FILESYSTEM_CHUNK_SIZE", "1 MiB"))
+        self.fsync = os.getenv("FILESYSTEM_FSYNC", True) in ["True", "true", True]
+        os.makedirs(self.staging_dir, exist_ok=True)
+
+    def __get_directory(self, bucket_name, shard):
+        return os.path.join(self.root, self.__quote(bucket_name), shard[:2], shard[2:4])
+
+    def __get_file_info(self, stat):
+        return {
+            "content_length": stat.st_size,
+            "etag": f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"',
+            "last_modified": datetime.fromtimestamp(stat.st_mtime, timezone.utc),
+        }
+
+    def __get_path(self, file_name, ticket=None):
+        bucket_name, key = self.get_object_location(file_name, ticket)
+        return self._get_path_for_key(bucket_name, key)
+
+    def _get_path_for_key(self, bucket_name, key):
+        if match := self.key_pattern.match(key.split("/")[-1]):
+            shard = match.group(1)
+        else:
+            shard = hashlib.md5(key.encode()).hexdigest()
+        return os.path.join(self.__get_directory(bucket_name, shard), self.__quote(key))
+
+    def __get_not_found_exception(self, file_name, ticket=None):
+        message = f"File {file_name} not found with key {self._get_key(file_name, ticket=ticket)}"
+        return FileNotFoundException(
+            f"{get_error_code(ErrorCode.FILE_NOT_FOUND, get_write())} {message}"
+        )
+
+    def __quote(self, name):
+        quoted = quote(name, safe="")
+        if not quoted or quoted.startswith("."):
+            raise Exception(
+                f"{get_error_code(ErrorCode.INVALID_INPUT, get_write())} Invalid name {name}"
+            )
+        return quoted
+
+    def _find_existing_file(self, md5sum, ticket=None):
+        directory = self.__get_directory(self._get_bucket_name(ticket), md5sum)
+        try:
+            names = sorted(os.listdir(directory))
+        except FileNotFoundError:
+            return None
+        for name in names:
+            if (key := unquote(name)).startswith(md5sum):
+                return key
+        return None
+
+    def _open_file(self, file_name, range=None, ticket=None):
+        file = open(self.__get_path(file_name, ticket), "rb")
+        file_info = self.__get_file_info(os.fstat(file.fileno()))
+        total_length = file_info["content_length"]
+        try:
+            start, end = (
+                get_byte_range(range, total_length) if range else (0, total_length - 1)
+            )
+        except Exception:
+            file.close()
+            raise
+        return {
+            "stream": CachedFileStream(file, start, end - start + 1),
+            "content_length": end - start + 1,
+            "content_range": f"bytes {start}-{end}/{total_length}" if range else None,
+            "total_length": total_length,
+            "etag": file_info["etag"],
+            "last_modified": file_info["last_modified"],
+        }
+
+    def _promote_staging_object(self, staging_key, key, ticket=None, ingest=None):
+        path = self._get_path_for_key(self._get_bucket_name(ticket), key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(staging_key, path)
+
+    def _remove_staging_object(self, staging_key, ticket=None):
+        try:
+            os.unlink(staging_key)
+        except FileNotFoundError:
+            pass
+
+    def _stream_to_staging(self, file, key, ticket=None):
+        ingest = self.create_ingest_stream(file)
+        with tempfile.NamedTemporaryFile(
+            dir=self.staging_dir, prefix=f"{key.split('/')[-1][:64]}-", delete=False
+        ) as staging_file:
+            try:
+                while chunk := ingest.read(self.chunk_size):
+                    staging_file.write(chunk)
+                if self.fsync:
+                    staging_file.flush()
+                    os.fsync(staging_file.fileno())
+            except Exception:
+                os.unlink(staging_file.name)
+                raise
+        return ingest, staging_file.name
+
+    def check_health(self):
+        if not os.access(self.root, os.W_OK):
+            raise Exception(f"Storage root {self.root} is not writable")
+        return True
+
+    def delete_files(self, files, on_batch_deleted=None):
+        keys = list(dict.fromkeys(self.get_keys_for_files(files)))
+        bucket_name = self._get_bucket_name()
+        result = {"deleted": list(), "errors": list()}
+        for i in range(0, len(keys), self.delete_batch_size):
+            batch = keys[i : i + self.delete_batch_size]
+            batch_result = {"deleted": list(), "errors": list()}
+            for key in batch:
+                try:
+                    os.unlink(self._get_path_for_key(bucket_name, key))
+                except FileNotFoundError:
+                    pass
+                except Exception as ex:
+                    batch_result["errors"].append(
+                        {
+                            "key": key,
+                            "code": ex.__class__.__name__,
+                            "message": str(ex),
+                        }
+                    )
+                    continue
+                batch_result["deleted"].append(key)
+            if on_batch_deleted:
+                on_batch_deleted(batch, batch_result)
+            result["deleted"].extend(batch_result["deleted"])
+            result["errors"].extend(batch_result["errors"])
+        return result
+
+    def download_file(self, file_name, range=None, ticket=None):
+        try:
+            return self._open_file(file_name, range, ticket)
+        except FileNotFoundError:
+            exception = self.__get_not_found_exception(file_name, ticket)
+            app.logger.error(str(exception))
+            raise exception
+
+    def find_existing_files(self, md5sums, ticket=None):
+        if self.duplicate_file_check not in ["True", True, "true"]:
+            return dict()
+        existing_files = {
+            md5sum: self._find_existing_file(md5sum, ticket)
+            for md5sum in dict.fromkeys(md5sums)
+        }
+        return {md5sum: key for md5sum, key in existing_files.items() if key}
+
+    def get_file_info(self, file_name, ticket=None):
+        file_info = {"ContentType": get_mimetype_from_filename(file_name)}
+        if ticket:
+            file_info["ContentLength"] = self.head_file(file_name, ticket)[
+                "content_length"
+            ]
+            file_info["AcceptRanges"] = "bytes"
+        return file_info
+
+    def get_object_location(self, file_name, ticket=None):
+        return self._get_bucket_name(ticket), self._get_key(file_name, ticket=ticket)
+
+    def head_file(self, file_name, ticket=None):
+        try:
+            stat = os.stat(self.__get_path(file_name, ticket))
+        except FileNotFoundError:
+            raise self.__get_not_found_exception(file_name, ticket)
+        return self.__get_file_info(stat)
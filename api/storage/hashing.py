@@ -0,0 +1,77 @@
+import blake3
+import hashlib
+import os
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from elody.error_codes import ErrorCode, get_error_code, get_write
+from humanfriendly import parse_size
+
+DIGEST_ALGORITHMS = {
+    "blake3": lambda: blake3.blake3(max_threads=blake3.blake3.AUTO),
+    "md5": hashlib.md5,
+    "sha256": hashlib.sha256,
+}
+
+hash_executor = ThreadPoolExecutor(
+    int(os.getenv("HASH_THREADS", max(os.cpu_count() or 1, 2))),
+    thread_name_prefix="hash",
+)
+
+
+class ContentHasher:
+    def __init__(self, algorithms=("md5",), buffer_size=parse_size("4 MiB")):
+        self.hashes = {
+            algorithm: DIGEST_ALGORITHMS[algorithm]() for algorithm in algorithms
+        }
+        self.timings = dict.fromkeys(algorithms, 0)
+        self.buffer_size = buffer_size
+        self.buffer = bytearray()
+        self.pending = list()
+        self.digests = None
+
+    def __submit(self, data):
+        self.__wait()
+        self.pending = [
+            hash_executor.submit(self.__update, algorithm, data)
+            for algorithm in self.hashes
+        ]
+
+    def __update(self, algorithm, data):
+        start = time.perf_counter()
+        self.hashes[algorithm].update(data)
+        self.timings[algorithm] += time.perf_counter() - start
+
+    def __wait(self):
+        for future in self.pending:
+            future.result()
+        self.pending = list()
+
+    def get_digests(self):
+        if self.digests is None:
+            self.__wait()
+            for algorithm in self.hashes:
+                self.__update(algorithm, self.buffer)
+            self.buffer = bytearray()
+            self.digests = {
+                algorithm: hash.hexdigest() for algorithm, hash in self.hashes.items()
+            }
+        return self.digests
+
+    def update(self, chunk):
+        if self.buffer or len(chunk) < self.buffer_size or not isinstance(chunk, bytes):
+            self.buffer += chunk
+            if len(self.buffer) < self.buffer_size:
+                return
+            chunk, self.buffer = self.buffer, bytearray()
+        self.__submit(chunk)
+
+
+def get_digest_algorithms(algorithms):
+    algorithms = list(dict.fromkeys(["md5", *algorithms]))
+    for algorithm in algorithms:
+        if algorithm not in DIGEST_ALGORITHMS:
+            raise Exception(
+                f"{get_error_code(ErrorCode.INVALID_INPUT, get_write())} Unsupported digest algorithm {algorithm}"
+            )
+    return algorithms
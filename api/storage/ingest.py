@@ -0,0 +1,89 @@
+import io
+import magic
+
+from elody.util import get_mimetype_from_filename
+from humanfriendly import parse_size
+from storage.hashing import ContentHasher
+
+MIMETYPE_HEADER_SIZE = parse_size("8 KiB")
+
+
+class IngestStream:
+    def __init__(
+        self,
+        file=None,
+        header_size=parse_size("4 MiB"),
+        digests=("md5",),
+        hash_buffer_size=parse_size("4 MiB"),
+    ):
+        self.file = file
+        self.header_size = header_size
+        self.header = bytearray()
+        self.hasher = ContentHasher(digests, hash_buffer_size)
+        self.size = 0
+
+    def read(self, size=-1):
+        chunk = self.file.read(size)
+        if not chunk:
+            return b""
+        self.update(chunk)
+        return chunk
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return False
+
+    def get_digests(self):
+        return self.hasher.get_digests()
+
+    def get_hash_timings(self):
+        return self.hasher.timings
+
+    def get_header(self):
+        return io.BytesIO(self.header)
+
+    def get_md5(self):
+        return self.get_digests()["md5"]
+
+    def get_mimetype(self, key):
+        mime = magic.Magic(mime=True).from_buffer(
+            bytes(self.header[:MIMETYPE_HEADER_SIZE])
+        )
+        if mime == "application/octet-stream":
+            mime = get_mimetype_from_filename(key)
+        return mime
+
+    def update(self, chunk):
+        self.hasher.update(chunk)
+        self.size += len(chunk)
+        if (missing := self.header_size - len(self.header)) > 0:
+            self.header += chunk[:missing]
+
+
+class ObjectIngestStream(IngestStream):
+    def __init__(self, read_header, size, digests, header_size=parse_size("4 MiB")):
+        super().__init__(header_size=header_size)
+        self.read_header = read_header
+        self.size = size
+        self.digests = digests
+
+    def __load_header(self, size):
+        size = min(size, self.header_size, self.size)
+        if len(self.header) < size:
+            self.header = bytearray(self.read_header(size))
+
+    def get_digests(self):
+        return self.digests
+
+    def get_hash_timings(self):
+        return dict()
+
+    def get_header(self):
+        self.__load_header(self.header_size)
+        return super().get_header()
+
+    def get_mimetype(self, key):
+        self.__load_header(MIMETYPE_HEADER_SIZE)
+        return super().get_mimetype(key)
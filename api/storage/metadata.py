@@ -0,0 +1,87 @@
+import struct
+
+from PIL import Image
+from storage.exceptions import UnsupportedImageException
+from storage.exif import JPEG_SIGNATURE, PNG_SIGNATURE, TIFF_SIGNATURES
+
+JPEG_COLOR_SPACES = {1: "Grayscale", 3: "YCbCr", 4: "CMYK"}
+PNG_COLOR_SPACES = {
+    0: "Grayscale",
+    2: "RGB",
+    3: "Palette",
+    4: "Grayscale",
+    6: "RGB",
+}
+TIFF_COLOR_SPACES = {
+    0: "Grayscale",
+    1: "Grayscale",
+    2: "RGB",
+    3: "Palette",
+    5: "CMYK",
+    6: "YCbCr",
+    8: "CIELab",
+}
+
+
+def get_image_metadata(data):
+    try:
+        if data.startswith(JPEG_SIGNATURE):
+            return __get_jpeg_metadata(data)
+        if data.startswith(PNG_SIGNATURE):
+            return __get_png_metadata(data)
+        if data[:4] in TIFF_SIGNATURES:
+            return __get_tiff_metadata(data)
+    except struct.error as ex:
+        raise UnsupportedImageException(f"Malformed image header: {ex}")
+    raise UnsupportedImageException("Unsupported image format")
+
+
+def __get_jpeg_metadata(data):
+    exif = Image.Exif()
+    offset = 2
+    while offset + 4 <= len(data) and data[offset] == 0xFF:
+        marker, length = struct.unpack(">BH", data[offset + 1 : offset + 4])
+        segment = data[offset + 4 : offset + 2 + length]
+        if marker == 0xE1 and segment.startswith(b"Exif\x00\x00") and not exif:
+            exif.load(segment)
+        elif 0xC0 <= marker <= 0xCF and marker not in [0xC4, 0xC8, 0xCC]:
+            height, width, components = struct.unpack(">HHB", segment[1:6])
+            return exif, {
+                "width": width,
+                "height": height,
+                "color_space": JPEG_COLOR_SPACES.get(components),
+            }
+        elif marker == 0xDA:
+            break
+        offset += 2 + length
+    raise UnsupportedImageException("No JPEG frame header found within the header")
+
+
+def __get_png_metadata(data):
+    width, height, _, color_type = struct.unpack(">IIBB", data[16:26])
+    exif = Image.Exif()
+    offset = 8
+    while offset + 8 <= len(data):
+        length, chunk_type = struct.unpack(">I4s", data[offset : offset + 8])
+        if chunk_type in [b"IDAT", b"IEND"]:
+            break
+        if chunk_type == b"eXIf":
+            exif.load(data[offset + 8 : offset + 8 + length])
+        offset += 12 + length
+    return exif, {
+        "width": width,
+        "height": height,
+        "color_space": PNG_COLOR_SPACES.get(color_type),
+    }
+
+
+def __get_tiff_metadata(data):
+    exif = Image.Exif()
+    exif.load(data)
+    if 256 not in exif or 257 not in exif:
+        raise UnsupportedImageException("No TIFF image directory found in the header")
+    return exif, {
+        "width": exif[256],
+        "height": exif[257],
+        "color_space": TIFF_COLOR_SPACES.get(exif.get(262)),
+    }
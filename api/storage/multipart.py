@@ -0,0 +1,92 @@
+import base64
+import hashlib
+
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+
+class MultipartUpload:
+    def __init__(self, client, bucket_name, key, upload_id=None):
+        self.client = client
+        self.bucket_name = bucket_name
+        self.key = key
+        self.upload_id = upload_id
+        self.parts = dict()
+
+    def abort(self):
+        if self.upload_id:
+            self.client.abort_multipart_upload(
+                Bucket=self.bucket_name, Key=self.key, UploadId=self.upload_id
+            )
+
+    def complete(self):
+        parts = [
+            {"ETag": etag, "PartNumber": part_number}
+            for part_number, etag in sorted(self.parts.items())
+        ]
+        return self.client.complete_multipart_upload(
+            Bucket=self.bucket_name,
+            Key=self.key,
+            UploadId=self.upload_id,
+            MultipartUpload={"Parts": parts},
+        )
+
+    def create(self):
+        response = self.client.create_multipart_upload(
+            Bucket=self.bucket_name, Key=self.key
+        )
+        self.upload_id = response["UploadId"]
+        return self.upload_id
+
+    def upload_part(self, part_number, data):
+        response = self.client.upload_part(
+            Bucket=self.bucket_name,
+            Key=self.key,
+            UploadId=self.upload_id,
+            PartNumber=part_number,
+            Body=data,
+            ContentMD5=get_content_md5(data),
+        )
+        self.parts[part_number] = response["ETag"]
+        return response["ETag"]
+
+
+def get_content_md5(data):
+    return base64.b64encode(hashlib.md5(data).digest()).decode()
+
+
+def read_part(stream, part_size):
+    buffer = bytearray()
+    while len(buffer) < part_size:
+        if not (chunk := stream.read(part_size - len(buffer))):
+            break
+        buffer += chunk
+    return bytes(buffer)
+
+
+def stream_to_object(client, bucket_name, key, stream, part_size, concurrency=4):
+    data = read_part(stream, part_size)
+    if len(data) < part_size:
+        client.put_object(
+            Bucket=bucket_name, Key=key, Body=data, ContentMD5=get_content_md5(data)
+        )
+        return
+    upload = MultipartUpload(client, bucket_name, key)
+    upload.create()
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            in_flight = set()
+            part_number = 1
+            while data:
+                if len(in_flight) >= concurrency:
+                    done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        future.result()
+                in_flight.add(executor.submit(upload.upload_part, part_number, data))
+                part_number += 1
+                data = read_part(stream, part_size)
+            for future in wait(in_flight).done:
+                future.result()
+        upload.complete()
+    except Exception:
+        upload.abort()
+        raise
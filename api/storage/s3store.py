@@ -1,361 +1,725 @@
 import app
 import boto3
-import hashlib
-import io
-import magic
+import json
 import os
-import requests
+import re
 
+from botocore.config import Config
+from concurrent.futures import ThreadPoolExecutor
 from botocore.exceptions import ClientError
-from cloudevents.conversion import to_dict
-from cloudevents.http import CloudEvent
-from dateutil import parser
-from elody.error_codes import ErrorCode, get_error_code, get_write
-from elody.exceptions import (
-    DuplicateFileException,
-    FileNotFoundException,
-    NotFoundException,
-)
+from elody.error_codes import ErrorCode, get_error_code, get_read, get_write
+from datetime import datetime, timedelta, timezone
+from elody.exceptions import FileNotFoundException, NotFoundException
 from elody.util import get_mimetype_from_filename
 from humanfriendly import parse_size
-from PIL import Image, ExifTags, TiffImagePlugin
-from urllib.parse import urlparse
+from metrics import instrument_s3_client
+from storage.blob_index import BlobIndex
+from storage.dedup_index import DedupIndex
+from storage.engine import StorageEngine, register_storage_engine, validate_md5
+from storage.exceptions import IntegrityException, InvalidRangeException
+from storage.ingest import ObjectIngestStream
+from storage.multipart import MultipartUpload, read_part, stream_to_object
+from storage.scrubber import Scrubber
+from uuid import uuid4
 
+COPY_OBJECT_MAX_SIZE = parse_size("5 GiB")
 
-class S3StorageManager:
+
+@register_storage_engine("s3")
+class S3StorageManager(StorageEngine):
     def __init__(self):
-        self.s3 = boto3.resource(
+        super().__init__()
+        self.client = boto3.client(
             "s3",
             endpoint_url=os.getenv("MINIO_ENDPOINT"),
             aws_access_key_id=os.getenv("MINIO_ACCESS_KEY"),
             aws_secret_access_key=os.getenv("MINIO_SECRET_KEY"),
+            config=Config(
+                max_pool_connections=int(os.getenv("S3_MAX_POOL_CONNECTIONS", 50))
+            ),
+        )
+        instrument_s3_client(self.client)
+        self.presign_client = boto3.client(
+            "s3",
+            endpoint_url=os.getenv(
+                "MINIO_PUBLIC_ENDPOINT", os.getenv("MINIO_ENDPOINT")
+            ),
+            aws_access_key_id=os.getenv("MINIO_ACCESS_KEY"),
+            aws_secret_access_key=os.getenv("MINIO_SECRET_KEY"),
+            config=Config(signature_version="s3v4"),
+        )
+        self.presigned_url_expiry = int(os.getenv("PRESIGNED_URL_EXPIRY", 300))
+        self.delete_concurrency = int(os.getenv("DELETE_CONCURRENCY", 8))
+        self.dedup_index = (
+            DedupIndex(path, int(os.getenv("DEDUP_INDEX_CAPACITY", 10000000)))
+            if (path := os.getenv("DEDUP_INDEX_PATH"))
+            else None
+        )
+        self.staging_prefix = os.getenv("STAGING_PREFIX", "staging/")
+        self.upload_part_size = parse_size(os.getenv("UPLOAD_PART_SIZE", "8 MiB"))
+        self.upload_part_concurrency = int(os.getenv("UPLOAD_PART_CONCURRENCY", 4))
+        self.upload_session_prefix = os.getenv("UPLOAD_SESSION_PREFIX", "sessions/")
+        self.upload_session_max_part_size = parse_size(
+            os.getenv("UPLOAD_SESSION_MAX_PART_SIZE", "64 MiB")
+        )
+        self.upload_session_ttl = timedelta(
+            seconds=float(os.getenv("UPLOAD_SESSION_TTL", 86400))
         )
-        self.collection_api_url = os.getenv("COLLECTION_API_URL")
-        self.storage_api_url = os.getenv("STORAGE_API_URL")
-        self.headers = None
-        self.session = requests.Session()
-        self.duplicate_file_check = os.getenv("DUPLICATE_FILE_CHECK", True)
-
-    def set_headers(self, headers):
-        self.headers = headers
-        self.session.headers.pop("Authorization", None)
-        self.session.headers.pop("apikey", None)
-        self.session.headers.update(headers)
-
-    def __calculate_md5(self, file):
-        hash_obj = hashlib.md5()
-        while chunk := file.read(parse_size("8 KiB")):
-            hash_obj.update(chunk)
-        file.seek(0)
-        return hash_obj.hexdigest()
-
-    def __get_exif_for_mediafile(self, mediafile):
-        artist = f'source: {self.__get_item_metadata_value(mediafile, "source")}'
-        if photographer := self.__get_item_metadata_value(mediafile, "photographer"):
-            artist = f"photographer: {photographer}, {artist}"
-        rights = f'license: {self.__get_item_metadata_value(mediafile, "rights")}'
-        if copyrights := self.__get_item_metadata_value(mediafile, "copyright"):
-            rights = f"rightsholder: {copyrights}, {rights}"
-        return artist, rights
-
-    def __get_file_mimetype(self, file, key):
-        file.seek(0)
-        mime = magic.Magic(mime=True).from_buffer(file.read(parse_size("8 KiB")))
-        file.seek(0)
-        if mime == "application/octet-stream":
-            mime = get_mimetype_from_filename(key)
-        return mime
-
-    def __get_item_metadata_value(self, item, key):
-        for entry in item["metadata"]:
-            if entry["key"] == key:
-                return entry["value"]
-        return False
-
-    def __get_raw_id(self, item):
-        return item.get("_key", item["_id"])
-
-    def __handle_duplicate_file(self, mediafile, mimetype, md5sum, filename, message):
+        self.verify_etags = os.getenv("VERIFY_ETAGS", True) in ["True", "true", True]
+        self.blob_index = (
+            BlobIndex(path) if (path := os.getenv("BLOB_INDEX_PATH")) else None
+        )
+        self.blob_bucket = os.getenv("BLOB_BUCKET")
+        self.blob_prefix = os.getenv("BLOB_PREFIX", "blobs/")
+        self.blob_reference_prefix = os.getenv("BLOB_REFERENCE_PREFIX", "blob-refs/")
+        self.blob_gc_grace_period = float(os.getenv("BLOB_GC_GRACE_PERIOD", 3600))
+
+    def __copy(self, copy_source, bucket_name, key, ingest=None):
+        checksums = ingest.get_digests() if ingest else dict()
+        if ingest and ingest.size <= COPY_OBJECT_MAX_SIZE:
+            etag = self.client.copy_object(
+                CopySource=copy_source,
+                Bucket=bucket_name,
+                Key=key,
+                Metadata=checksums,
+                MetadataDirective="REPLACE",
+            )["CopyObjectResult"]["ETag"]
+        else:
+            self.client.copy(
+                copy_source, bucket_name, key, ExtraArgs={"Metadata": checksums}
+            )
+            etag = self.client.head_object(Bucket=bucket_name, Key=key)["ETag"]
+        etag = etag.strip('"')
+        if self.verify_etags and checksums and "-" not in etag:
+            if etag != checksums["md5"]:
+                self.client.delete_object(Bucket=bucket_name, Key=key)
+                raise IntegrityException(
+                    f"{get_error_code(ErrorCode.FILE_CORRUPTED, get_write())} Stored object {key} has ETag {etag}, expected md5 {checksums['md5']}"
+                )
+        return etag
+
+    def __delete_batch(self, bucket_name, keys, on_batch_deleted=None):
         try:
-            found_mediafile = self._get_mediafile(md5sum)
-        except NotFoundException:
-            self.__update_mediafile_information(mediafile, md5sum, filename, mimetype)
-            message = (
-                f"{message} No existing mediafile for file found, not deleting new one."
+            response = self.client.delete_objects(
+                Bucket=bucket_name,
+                Delete={"Objects": [{"Key": key} for key in keys], "Quiet": False},
+            )
+            result = {
+                "deleted": [item["Key"] for item in response.get("Deleted", [])],
+                "errors": [
+                    {
+                        "key": item["Key"],
+                        "code": item.get("Code"),
+                        "message": item.get("Message"),
+                    }
+                    for item in response.get("Errors", [])
+                ],
+            }
+        except ClientError as ex:
+            error = ex.response.get("Error", {})
+            result = {
+                "deleted": list(),
+                "errors": [
+                    {
+                        "key": key,
+                        "code": error.get("Code"),
+                        "message": error.get("Message", str(ex)),
+                    }
+                    for key in keys
+                ],
+            }
+        if self.dedup_index and result["deleted"]:
+            self.dedup_index.remove(bucket_name, result["deleted"])
+        if on_batch_deleted:
+            on_batch_deleted(keys, result)
+        return result
+
+    def __delete_blob_references(self, bucket_name, keys):
+        prefix = self.blob_reference_prefix
+        result = {"deleted": list(), "errors": list()}
+        for i in range(0, len(keys), self.delete_batch_size):
+            batch_result = self.__delete_batch(
+                bucket_name,
+                [f"{prefix}{key}" for key in keys[i : i + self.delete_batch_size]],
             )
-            raise DuplicateFileException(
-                f"{get_error_code(ErrorCode.DUPLICATE_FILE, get_write())} {message}"
+            result["deleted"].extend(
+                key[len(prefix) :] for key in batch_result["deleted"]
             )
-        mediafile_id = self.__get_raw_id(mediafile)
-        if self.__get_raw_id(found_mediafile) != mediafile_id:
-            self.session.delete(f"{self.collection_api_url}/mediafiles/{mediafile_id}")
-            message = f"{message} Existing mediafile for file found, deleting new one."
-        if self.is_metadata_updated(found_mediafile, mediafile):
-            message = f"{message} Metadata not up-to-date, updating."
-            payload = {"metadata": mediafile.get("metadata", [])}
-            self.session.patch(
-                f"{self.collection_api_url}/mediafiles/{md5sum}", json=payload
+            result["errors"].extend(
+                error | {"key": error["key"][len(prefix) :]}
+                for error in batch_result["errors"]
             )
-        raise DuplicateFileException(
-            f"{get_error_code(ErrorCode.DUPLICATE_FILE, get_write())} {message}"
+        result["deleted"] = self.blob_index.remove_references(
+            bucket_name, result["deleted"]
         )
+        return result
 
-    def __signal_file_uploaded(self, mediafile, mimetype, url, headers, ticket=None):
-        attributes = {"type": "dams.file_uploaded", "source": "dams"}
-        data = {
-            "mediafile": mediafile,
-            "mimetype": mimetype,
-            "url": url,
-            "headers": headers,
-            "ticket": ticket,
-        }
-        event = to_dict(CloudEvent(attributes, data))
-        app.rabbit.send(event, routing_key="dams.file_uploaded")
+    def __delete_blobs(self, md5sums):
+        locations = {md5sum: self.__get_blob_location(md5sum) for md5sum in md5sums}
+        bucket_name = next(iter(locations.values()))[0]
+        result = self.__delete_batch(
+            bucket_name, [key for _, key in locations.values()]
+        )
+        deleted = set(result["deleted"])
+        return [md5sum for md5sum, (_, key) in locations.items() if key in deleted]
 
-    def __update_mediafile_information(
-        self, mediafile, md5sum, new_key, mimetype, exif_data=None
-    ):
-        new_key = new_key.split("/")[-1]
-        mediafile["identifiers"].append(md5sum)
-        mediafile["original_filename"] = mediafile["filename"]
-        mediafile["filename"] = new_key
-        mediafile["original_file_location"] = f"/download/{new_key}"
-        mediafile["thumbnail_file_location"] = (
-            f"/iiif/3/{new_key}/full/,150/0/default.jpg"
+    def __find_existing_key(self, bucket_name, md5sum):
+        if self.blob_index and (key := self.blob_index.find(bucket_name, md5sum)):
+            return key
+        if self.dedup_index:
+            return self.dedup_index.find(bucket_name, md5sum)
+        objects = self.client.list_objects_v2(
+            Bucket=bucket_name, Prefix=md5sum, MaxKeys=1
         )
-        mediafile["mimetype"] = mimetype
-        if exif_data:
-            mediafile["technical_metadata"] = exif_data
-        self.session.put(
-            f"{self.collection_api_url}/mediafiles/{self.__get_raw_id(mediafile)}",
-            json=mediafile,
+        if len(objects.get("Contents", [])):
+            return objects.get("Contents", [])[0]["Key"]
+        return None
+
+    def __get_blob_location(self, md5sum):
+        return (
+            self.blob_bucket or self._get_bucket_name(),
+            f"{self.blob_prefix}{md5sum}",
         )
 
-    def _get_mediafile(self, mediafile_id, fatal=True):
-        req = self.session.get(f"{self.collection_api_url}/mediafiles/{mediafile_id}")
-        if req.status_code == 200:
-            return req.json()
-        elif not fatal:
-            return None
-        elif req.status_code == 404:
+    def __get_open_upload_session(self, session_id, ticket=None):
+        session = self.__get_upload_session(session_id, ticket)
+        if session.get("completed"):
+            raise Exception(
+                f"{get_error_code(ErrorCode.INVALID_INPUT, get_write())} Upload session {session_id} is already completed"
+            )
+        return session
+
+    def __get_upload_session(self, session_id, ticket=None):
+        bucket_name = self._get_bucket_name(ticket)
+        try:
+            session = self.__load_upload_session(bucket_name, session_id)
+        except ClientError:
+            session = None
+        if not session or session.get("ticket_id") != (
+            ticket.get("_id") if ticket else None
+        ):
             raise NotFoundException(
-                f"{get_error_code(ErrorCode.MEDIAFILE_NOT_FOUND, get_write())} Could not get mediafile with provided id"
+                f"{get_error_code(ErrorCode.ITEM_NOT_FOUND, get_write())} Upload session {session_id} not found"
             )
-        else:
-            raise Exception(
-                f"{get_error_code(ErrorCode.MEDIAFILE_NOT_FOUND, get_write())} Something went wrong while getting mediafile"
+        if self.__get_upload_session_expiry(session) < datetime.now(timezone.utc):
+            self.__remove_upload_session(bucket_name, session)
+            raise NotFoundException(
+                f"{get_error_code(ErrorCode.ITEM_NOT_FOUND, get_write())} Upload session {session_id} expired"
             )
+        return session
 
-    def add_exif_data(self, mediafile):
-        if "image" not in mediafile["mimetype"]:
-            return
-        image = self.download_file(mediafile["filename"])["stream"]
-        img = Image.open(image)
-        exif = img.getexif()
-        exif[0x013B], exif[0x8298] = self.__get_exif_for_mediafile(mediafile)
-        buf = io.BytesIO()
-        img.save(buf, img.format, exif=exif)
-        buf.seek(0)
-        self.s3.Bucket(self.__get_bucket_name()).upload_fileobj(
-            Fileobj=buf, Key=self.__get_key(mediafile["filename"])
+    def __get_upload_session_expiry(self, session):
+        return datetime.fromisoformat(session["created_at"]) + self.upload_session_ttl
+
+    def __get_upload_session_ingest(self, session, ticket=None):
+        staging_object = {
+            "Bucket": self._get_bucket_name(ticket),
+            "Key": session["staging_key"],
+        }
+        if self.verify_etags and self.content_digests == ["md5"]:
+            file_info = self.client.head_object(**staging_object)
+            etag = file_info["ETag"].strip('"')
+            if "-" in etag and file_info["ContentLength"] <= COPY_OBJECT_MAX_SIZE:
+                etag = self.client.copy_object(
+                    CopySource=staging_object,
+                    **staging_object,
+                    MetadataDirective="REPLACE",
+                )["CopyObjectResult"]["ETag"].strip('"')
+            if "-" not in etag:
+                return self._open_copy_source(staging_object, etag)
+        ingest = self.create_ingest_stream(
+            self.client.get_object(**staging_object)["Body"]
         )
-        self.session.patch(
-            f'{self.collection_api_url}/mediafiles/{mediafile["identifiers"][0]}',
-            json={"exif": str(exif)},
+        while ingest.read(self.upload_part_size):
+            pass
+        return ingest
+
+    def __get_upload_session_parts(self, session, ticket=None):
+        if session.get("completed"):
+            return list()
+        bucket_name = self._get_bucket_name(ticket)
+        parts = list()
+        marker = 0
+        while True:
+            response = self.client.list_parts(
+                Bucket=bucket_name,
+                Key=session["staging_key"],
+                UploadId=session["upload_id"],
+                PartNumberMarker=marker,
+            )
+            parts.extend(response.get("Parts", []))
+            if not response.get("IsTruncated"):
+                return parts
+            marker = response["NextPartNumberMarker"]
+
+    def __has_blob_reference(self, bucket_name, key):
+        try:
+            self.client.head_object(
+                Bucket=bucket_name, Key=f"{self.blob_reference_prefix}{key}"
+            )
+        except ClientError as ex:
+            if ex.response.get("Error", {}).get("Code") in ["404", "NoSuchKey"]:
+                return False
+            raise
+        return True
+
+    def __list_blob_references(self, bucket_name, concurrency):
+        prefix = self.blob_reference_prefix
+
+        def get_md5(key):
+            try:
+                file_info = self.client.head_object(Bucket=bucket_name, Key=key)
+            except ClientError as ex:
+                if ex.response.get("Error", {}).get("Code") in ["404", "NoSuchKey"]:
+                    return None
+                raise
+            return file_info.get("Metadata", {}).get("md5")
+
+        paginator = self.client.get_paginator("list_objects_v2")
+        with ThreadPoolExecutor(concurrency) as executor:
+            for page in paginator.paginate(Bucket=bucket_name, Prefix=prefix):
+                keys = [item["Key"] for item in page.get("Contents", [])]
+                yield [
+                    (key[len(prefix) :], md5sum)
+                    for key, md5sum in zip(keys, executor.map(get_md5, keys))
+                    if md5sum
+                ]
+
+    def __list_blobs(self):
+        bucket_name, prefix = self.__get_blob_location("")
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=bucket_name, Prefix=prefix):
+            yield [
+                (md5sum, item["Size"], item["ETag"].strip('"'))
+                for item in page.get("Contents", [])
+                if re.fullmatch("[0-9a-f]{32}", md5sum := item["Key"][len(prefix) :])
+            ]
+
+    def __load_upload_session(self, bucket_name, session_id):
+        document = self.client.get_object(
+            Bucket=bucket_name, Key=f"{self.upload_session_prefix}{session_id}"
         )
+        return json.loads(document["Body"].read())
 
-    def check_file_exists(self, filename, md5sum, ticket=None):
-        if self.duplicate_file_check in ["True", True, "true"]:
-            bucket_name = self.__get_bucket_name(ticket)
-            client = self.s3.Bucket(bucket_name).meta.client
-            objects = client.list_objects_v2(Bucket=bucket_name, Prefix=md5sum)
-            if len(objects.get("Contents", [])):
-                existing_file = objects.get("Contents", [])[0]["Key"]
-                error_message = (
-                    f"Duplicate file {filename} matches existing file {existing_file}."
-                )
-                raise DuplicateFileException(
-                    f"{get_error_code(ErrorCode.DUPLICATE_FILE, get_write())} {error_message}",
-                    existing_file,
-                    md5sum,
+    def __put_blob_reference(self, bucket_name, key, md5sum):
+        self.client.put_object(
+            Bucket=bucket_name,
+            Key=f"{self.blob_reference_prefix}{key}",
+            Body=b"",
+            Metadata={"md5": md5sum},
+        )
+
+    def __put_upload_session(self, bucket_name, session):
+        self.client.put_object(
+            Bucket=bucket_name,
+            Key=f"{self.upload_session_prefix}{session['id']}",
+            Body=json.dumps(session).encode(),
+            ContentType="application/json",
+        )
+
+    def __remove_upload_session(self, bucket_name, session):
+        if session.get("completed"):
+            self.client.delete_object(Bucket=bucket_name, Key=session["staging_key"])
+        else:
+            try:
+                MultipartUpload(
+                    self.client,
+                    bucket_name,
+                    session["staging_key"],
+                    session["upload_id"],
+                ).abort()
+            except ClientError as ex:
+                if ex.response.get("Error", {}).get("Code") != "NoSuchUpload":
+                    raise
+        self.client.delete_object(
+            Bucket=bucket_name, Key=f"{self.upload_session_prefix}{session['id']}"
+        )
+
+    def _copy_object(self, copy_source, key, ticket=None, ingest=None):
+        bucket_name = self._get_bucket_name(ticket)
+        if self.blob_index and ingest:
+            md5sum = ingest.get_md5()
+            self.__put_blob_reference(bucket_name, key, md5sum)
+            if etag := self.blob_index.add_existing_reference(bucket_name, key, md5sum):
+                return etag
+            try:
+                etag = self.__copy(
+                    copy_source, *self.__get_blob_location(md5sum), ingest
                 )
+            except Exception:
+                self.__delete_blob_references(bucket_name, [key])
+                raise
+            self.blob_index.add_reference(bucket_name, key, md5sum, ingest.size, etag)
+            return etag
+        etag = self.__copy(copy_source, bucket_name, key, ingest)
+        if self.dedup_index:
+            self.dedup_index.add(bucket_name, key, ingest.get_md5() if ingest else None)
+        return etag
+
+    def _find_copy_source(self, md5sum, ticket=None):
+        bucket_name = self._get_bucket_name(ticket)
+        if self.blob_index and self.blob_index.find(bucket_name, md5sum):
+            bucket_name, key = self.__get_blob_location(md5sum)
+            return {"Bucket": bucket_name, "Key": key}
+        if key := self.__find_existing_key(bucket_name, md5sum):
+            return {"Bucket": bucket_name, "Key": key}
+        return None
+
+    def _find_existing_file(self, md5sum, ticket=None):
+        return self.__find_existing_key(self._get_bucket_name(ticket), md5sum)
+
+    def _open_copy_source(self, copy_source, md5sum):
+        file_info = self.client.head_object(**copy_source)
+        metadata = file_info.get("Metadata", {})
+        if metadata.get("md5", file_info["ETag"].strip('"')) != md5sum:
+            return None
+        digests = {"md5": md5sum} | {
+            algorithm: digest
+            for algorithm, digest in metadata.items()
+            if algorithm in self.content_digests and algorithm != "md5"
+        }
+        return ObjectIngestStream(
+            lambda size: self.client.get_object(
+                **copy_source, Range=f"bytes=0-{size - 1}"
+            )["Body"].read(),
+            file_info["ContentLength"],
+            digests,
+            self.exif_header_size,
+        )
+
+    def _promote_staging_object(self, staging_key, key, ticket=None, ingest=None):
+        return self._copy_object(
+            {"Bucket": self._get_bucket_name(ticket), "Key": staging_key},
+            key,
+            ticket,
+            ingest,
+        )
+
+    def _remove_staging_object(self, staging_key, ticket=None):
+        self.client.delete_objects(
+            Bucket=self._get_bucket_name(ticket),
+            Delete={"Objects": [{"Key": staging_key}], "Quiet": True},
+        )
+
+    def _stream_to_staging(self, file, key, ticket=None):
+        ingest = self.create_ingest_stream(file)
+        staging_key = f"{self.staging_prefix}{uuid4()}-{key.split('/')[-1]}"
+        bucket_name = self._get_bucket_name(ticket)
+        stream_to_object(
+            self.client,
+            bucket_name,
+            staging_key,
+            ingest,
+            self.upload_part_size,
+            self.upload_part_concurrency,
+        )
+        return ingest, staging_key
+
+    def abort_upload_session(self, session_id, ticket=None):
+        session = self.__get_upload_session(session_id, ticket)
+        self.__remove_upload_session(self._get_bucket_name(ticket), session)
 
     def check_health(self):
-        self.s3.buckets.all()
+        self.client.list_buckets()
         return True
 
-    def delete_files(self, files):
-        payload = {"Objects": [{"Key": file} for file in files], "Quiet": True}
-        self.s3.Bucket(self.__get_bucket_name()).delete_objects(Delete=payload)
+    def collect_garbage(self):
+        if not self.blob_index:
+            raise Exception(
+                f"{get_error_code(ErrorCode.INVALID_INPUT, get_write())} Garbage collection needs the content addressed layout, set BLOB_INDEX_PATH"
+            )
+        return self.blob_index.collect_garbage(
+            self.blob_gc_grace_period, self.__delete_blobs
+        )
+
+    def complete_upload_session(
+        self, session_id, ticket=None, headers=None, md5sum=None
+    ):
+        if md5sum:
+            validate_md5(md5sum)
+        session = self.__get_upload_session(session_id, ticket)
+        mediafile = self._get_mediafile(
+            session["mediafile_id"], fatal=ticket is None, headers=headers
+        )
+        bucket_name = self._get_bucket_name(ticket)
+        if not session.get("completed"):
+            parts = self.__get_upload_session_parts(session, ticket)
+            if not parts:
+                raise Exception(
+                    f"{get_error_code(ErrorCode.CONTENT_NOT_FOUND, get_write())} Upload session {session_id} has no parts"
+                )
+            upload = MultipartUpload(
+                self.client, bucket_name, session["staging_key"], session["upload_id"]
+            )
+            upload.parts = {part["PartNumber"]: part["ETag"] for part in parts}
+            upload.complete()
+            session["completed"] = True
+            self.__put_upload_session(bucket_name, session)
+        ingest = self.__get_upload_session_ingest(session, ticket)
+        if md5sum and ingest.get_md5() != md5sum:
+            raise Exception(
+                f"{get_error_code(ErrorCode.INVALID_INPUT, get_write())} Uploaded content has md5 {ingest.get_md5()}, expected {md5sum}"
+            )
+        self.finalize_upload(
+            ingest,
+            None,
+            session["mediafile_id"],
+            mediafile,
+            session["key"],
+            ticket,
+            headers,
+            {"Bucket": bucket_name, "Key": session["staging_key"]},
+        )
+        self.__remove_upload_session(bucket_name, session)
+
+    def create_upload_session(self, key, mediafile_id, ticket=None, headers=None):
+        self._get_mediafile(mediafile_id, fatal=ticket is None, headers=headers)
+        bucket_name = self._get_bucket_name(ticket)
+        session_id = str(uuid4())
+        staging_key = f"{self.staging_prefix}{session_id}-{key.split('/')[-1]}"
+        session = {
+            "id": session_id,
+            "key": key,
+            "mediafile_id": mediafile_id,
+            "ticket_id": ticket.get("_id") if ticket else None,
+            "staging_key": staging_key,
+            "upload_id": MultipartUpload(
+                self.client, bucket_name, staging_key
+            ).create(),
+            "created_at": datetime.now(timezone.utc).isoformat(),
+        }
+        self.__put_upload_session(bucket_name, session)
+        return self.get_upload_session(session_id, ticket)
+
+    def delete_files(self, files, on_batch_deleted=None):
+        keys = list(dict.fromkeys(self.get_keys_for_files(files)))
+        bucket_name = self._get_bucket_name()
+        result = {"deleted": list(), "errors": list()}
+        if self.blob_index and (
+            references := [
+                key for key in keys if self.blob_index.resolve(bucket_name, key)
+            ]
+        ):
+            blob_result = self.__delete_blob_references(bucket_name, references)
+            result["deleted"].extend(blob_result["deleted"])
+            result["errors"].extend(blob_result["errors"])
+            if on_batch_deleted:
+                on_batch_deleted(references, blob_result)
+            keys = [key for key in keys if key not in set(references)]
+        batches = [
+            keys[i : i + self.delete_batch_size]
+            for i in range(0, len(keys), self.delete_batch_size)
+        ]
+        with ThreadPoolExecutor(self.delete_concurrency) as executor:
+            for batch_result in executor.map(
+                lambda batch: self.__delete_batch(bucket_name, batch, on_batch_deleted),
+                batches,
+            ):
+                result["deleted"].extend(batch_result["deleted"])
+                result["errors"].extend(batch_result["errors"])
+        return result
 
     def download_file(self, file_name, range=None, ticket=None):
-        bucket_name = self.__get_bucket_name(ticket)
-        client = self.s3.Bucket(bucket_name).meta.client
+        bucket_name, key = self.get_object_location(file_name, ticket)
         try:
             if range:
-                file_obj = client.get_object(
-                    Bucket=bucket_name,
-                    Key=self.__get_key(file_name, ticket=ticket),
-                    Range=range,
+                file_obj = self.client.get_object(
+                    Bucket=bucket_name, Key=key, Range=range
                 )
             else:
-                file_obj = client.get_object(
-                    Bucket=bucket_name, Key=self.__get_key(file_name, ticket=ticket)
+                file_obj = self.client.get_object(Bucket=bucket_name, Key=key)
+        except ClientError as ex:
+            if ex.response.get("Error", {}).get("Code") == "InvalidRange":
+                raise InvalidRangeException(
+                    f"{get_error_code(ErrorCode.INVALID_INPUT, get_read())} Range {range} not satisfiable for file {file_name}"
                 )
-        except ClientError:
-            message = f"File {file_name} not found with key {self.__get_key(file_name, ticket=ticket)}"
+            message = f"File {file_name} not found with key {key}"
             app.logger.error(message)
             raise FileNotFoundException(f"{get_error_code(ErrorCode.FILE_NOT_FOUND, get_write())} {message}")
-        return {"stream": file_obj["Body"], "content_length": file_obj["ContentLength"]}
+        return {
+            "stream": file_obj["Body"],
+            "content_length": file_obj["ContentLength"],
+            "content_range": file_obj.get("ContentRange"),
+            "total_length": (
+                int(file_obj["ContentRange"].split("/")[-1])
+                if file_obj.get("ContentRange")
+                else file_obj["ContentLength"]
+            ),
+            "etag": file_obj.get("ETag"),
+            "last_modified": file_obj.get("LastModified"),
+        }
+
+    def expire_upload_sessions(self, bucket_name=None):
+        bucket_name = bucket_name or self._get_bucket_name()
+        cutoff = datetime.now(timezone.utc) - self.upload_session_ttl
+        expired = list()
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(
+            Bucket=bucket_name, Prefix=self.upload_session_prefix
+        ):
+            for item in page.get("Contents", []):
+                if item["LastModified"] >= cutoff:
+                    continue
+                session_id = item["Key"].removeprefix(self.upload_session_prefix)
+                try:
+                    session = self.__load_upload_session(bucket_name, session_id)
+                except ClientError:
+                    continue
+                if self.__get_upload_session_expiry(session) < datetime.now(
+                    timezone.utc
+                ):
+                    self.__remove_upload_session(bucket_name, session)
+                    expired.append(session_id)
+        return expired
+
+    def find_existing_files(self, md5sums, ticket=None):
+        if self.duplicate_file_check not in ["True", True, "true"]:
+            return dict()
+        md5sums = list(dict.fromkeys(md5sums))
+        if self.dedup_index:
+            existing_files = zip(
+                md5sums, [self._find_existing_file(md5, ticket) for md5 in md5sums]
+            )
+        else:
+            with ThreadPoolExecutor(self.unique_check_concurrency) as executor:
+                existing_files = zip(
+                    md5sums,
+                    executor.map(
+                        lambda md5sum: self._find_existing_file(md5sum, ticket),
+                        md5sums,
+                    ),
+                )
+        return {md5sum: key for md5sum, key in existing_files if key}
+
+    def get_download_url(self, file_name, ticket=None):
+        bucket_name, key = self.get_object_location(file_name, ticket)
+        return self.presign_client.generate_presigned_url(
+            "get_object",
+            Params={
+                "Bucket": bucket_name,
+                "Key": key,
+                "ResponseContentType": get_mimetype_from_filename(file_name),
+            },
+            ExpiresIn=self.presigned_url_expiry,
+        )
 
     def get_file_info(self, file_name, ticket=None):
         content_type = get_mimetype_from_filename(file_name)
         if ticket:
-            bucket_name = self.__get_bucket_name(ticket)
-            client = self.s3.Bucket(bucket_name).meta.client
-            file_info = client.head_object(
-                Bucket=bucket_name, Key=self.__get_key(file_name, ticket=ticket)
-            )
+            bucket_name, key = self.get_object_location(file_name, ticket)
+            file_info = self.client.head_object(Bucket=bucket_name, Key=key)
             file_info["ContentType"] = content_type
             return file_info
         return {"ContentType": content_type}
 
-    def get_stream_generator(self, stream):
-        return stream.iter_chunks()
+    def get_upload_session_part_url(self, session_id, part_number, ticket=None):
+        if not 1 <= part_number <= 10000:
+            raise Exception(
+                f"{get_error_code(ErrorCode.INVALID_INPUT, get_write())} Part number must be between 1 and 10000"
+            )
+        session = self.__get_open_upload_session(session_id, ticket)
+        return {
+            "part_number": part_number,
+            "url": self.presign_client.generate_presigned_url(
+                "upload_part",
+                Params={
+                    "Bucket": self._get_bucket_name(ticket),
+                    "Key": session["staging_key"],
+                    "UploadId": session["upload_id"],
+                    "PartNumber": part_number,
+                },
+                ExpiresIn=self.presigned_url_expiry,
+            ),
+            "expires_in": self.presigned_url_expiry,
+        }
 
-    def is_metadata_updated(self, old_mediafile, new_mediafile):
-        old_metadata = old_mediafile.get("metadata", [])
-        new_metadata = new_mediafile.get("metadata", [])
-        if len(old_metadata) != len(new_metadata):
-            return True
-        unmatched = list(old_metadata)
-        for item in new_metadata:
-            try:
-                unmatched.remove(item)
-            except ValueError:
-                return True
-        return len(unmatched) > 0
+    def get_upload_session(self, session_id, ticket=None):
+        session = self.__get_upload_session(session_id, ticket)
+        return {
+            "id": session["id"],
+            "key": session["key"],
+            "mediafile_id": session["mediafile_id"],
+            "created_at": session["created_at"],
+            "expires_at": self.__get_upload_session_expiry(session).isoformat(),
+            "completed": session.get("completed", False),
+            "max_part_size": self.upload_session_max_part_size,
+            "parts": [
+                {
+                    "part_number": part["PartNumber"],
+                    "size": part["Size"],
+                    "etag": part["ETag"],
+                }
+                for part in self.__get_upload_session_parts(session, ticket)
+            ],
+        }
 
-    def __get_bucket_name(self, ticket=None):
-        if ticket:
-            return ticket["bucket"]
-        if bucket := os.getenv("MINIO_BUCKET"):
-            return bucket
-        raise Exception(f"{get_error_code(ErrorCode.NO_BUCKET_SPECIFIED, get_write())} No bucket for upload was specified")
-
-    def __get_key(self, key, md5sum=None, ticket=None, transcode=False):
-        input_key = ticket["location"] if ticket else key
-        split_key = input_key.split("/")
-        if transcode:
-            split_key[-1] = f"transcode-{split_key[-1]}"
-        if md5sum:
-            split_key[-1] = f"{md5sum}-{split_key[-1]}"
-        return "/".join(split_key)
-
-    def _get_exif_data(self, file):
-        image = Image.open(file)
-        exif_data = image.getexif()._get_merged_dict()
-        file.seek(0)
-        data = []
-        if exif_data is None:
-            return None
-        for key, value in exif_data.items():
-            if key in ExifTags.TAGS:
-                value = self._handle_value_to_be_serializable(value)
-                data.append({"key": ExifTags.TAGS[key], "value": value})
-        return data
-
-    def _handle_value_to_be_serializable(self, value):
-        if isinstance(value, TiffImagePlugin.IFDRational):
-            return str(value)
-        elif isinstance(value, bytes):
-            return "(Binary data suppressed)"
-        elif isinstance(value, (tuple, list)):
-            return [self._handle_value_to_be_serializable(v) for v in value]
-        elif isinstance(value, dict):
-            return {
-                k: self._handle_value_to_be_serializable(v) for k, v in value.items()
-            }
-        else:
-            return value
-
-    def _check_keys_and_extract_creation_dates(self, exif_data):
-        keys_to_check = [
-            "exif_datetime",
-            "Xmp.xmp.CreateDate",
-            "Xmp.xmp.MetadataDate",
-            "Xmp.dc.date",
-            "DateTimeDigitized",
-            "DateTimeOriginal",
-        ]
-        for item in exif_data:
-            if item["key"] in keys_to_check:
-                date_str = item["value"]
-                try:
-                    date_obj = parser.parse(date_str)
-                    iso_date_str = date_obj.isoformat()
-                    return iso_date_str
-                except ValueError:
-                    return date_str
-        return None
+    def get_object_location(self, file_name, ticket=None):
+        bucket_name = self._get_bucket_name(ticket)
+        key = self._get_key(file_name, ticket=ticket)
+        if self.blob_index and (md5sum := self.blob_index.resolve(bucket_name, key)):
+            return self.__get_blob_location(md5sum)
+        return bucket_name, key
 
-    def upload_file(self, file, mediafile_id, key, ticket):
-        mediafile = self._get_mediafile(mediafile_id, fatal=ticket is None)
-        md5sum = self.__calculate_md5(file)
-        mimetype = self.__get_file_mimetype(file, key)
-        exif_data = (
-            self._get_exif_data(file) if mimetype.startswith("image") else list()
-        )
-        mediafile["file_creation_date"] = self._check_keys_and_extract_creation_dates(
-            exif_data
-        )
+    def head_file(self, file_name, ticket=None):
+        bucket_name, key = self.get_object_location(file_name, ticket)
         try:
-            self.check_file_exists(key, md5sum, ticket)
-        except DuplicateFileException as ex:
-            if mediafile:
-                self.__handle_duplicate_file(
-                    mediafile, mimetype, ex.md5sum, ex.filename, ex.message
-                )
-        key = self.__get_key(key, md5sum=md5sum, ticket=ticket)
-        self.s3.Bucket(self.__get_bucket_name(ticket)).upload_fileobj(
-            Fileobj=file, Key=key
-        )
-        if mediafile:
-            self.__update_mediafile_information(
-                mediafile, md5sum, key, mimetype, exif_data
-            )
-            mediafile = self._get_mediafile(mediafile_id, fatal=ticket is None)
-            download_url = urlparse(mediafile["original_file_location"])
-            self.__signal_file_uploaded(
-                mediafile,
-                mimetype,
-                f"{self.storage_api_url.replace('/storage/v1/', '')}{download_url.path}?{download_url.query}",
-                self.headers,
-                ticket,
+            file_info = self.client.head_object(Bucket=bucket_name, Key=key)
+        except ClientError:
+            message = f"File {file_name} not found with key {key}"
+            raise FileNotFoundException(
+                f"{get_error_code(ErrorCode.FILE_NOT_FOUND, get_write())} {message}"
             )
+        return {
+            "content_length": file_info["ContentLength"],
+            "etag": file_info.get("ETag"),
+            "last_modified": file_info.get("LastModified"),
+        }
 
-    def upload_transcode(self, file, mediafile_id, key, ticket):
-        mediafile = self._get_mediafile(mediafile_id)
-        md5sum = self.__calculate_md5(file)
-        key = self.__get_key(key, md5sum=md5sum, transcode=True, ticket=ticket)
-        mimetype = self.__get_file_mimetype(file, key)
-        self.check_file_exists(key, md5sum)
-        self.s3.Bucket(self.__get_bucket_name(ticket)).upload_fileobj(
-            Fileobj=file, Key=key
+    def rebuild_blob_index(self, bucket_names=None, concurrency=16):
+        if not self.blob_index:
+            raise Exception(
+                f"{get_error_code(ErrorCode.INVALID_INPUT, get_write())} Rebuilding the blob index needs the content addressed layout, set BLOB_INDEX_PATH"
+            )
+        return self.blob_index.rebuild(
+            bucket_names or [self._get_bucket_name()],
+            self.__list_blobs,
+            lambda bucket_name: self.__list_blob_references(bucket_name, concurrency),
+            self.__has_blob_reference,
         )
-        mediafile["identifiers"].append(md5sum)
-        new_key = key.split("/")[-1]
-        data = {
-            "filename": key,
-            "md5sum": md5sum,
-            "transcode_file_location": f"/download/{new_key}",
-            "thumbnail_file_location": f"/iiif/3/{new_key}/full/,150/0/default.jpg",
-            "mimetype": mimetype,
-        }
-        try:
-            self.session.post(
-                f"{self.collection_api_url}/mediafiles/{mediafile_id}/derivatives",
-                json=data,
+
+    def rebuild_dedup_index(self, bucket_name=None):
+        bucket_name = bucket_name or self._get_bucket_name()
+        return self.dedup_index.rebuild(bucket_name, self.client)
+
+    def scrub(self, bucket_name=None, prefixes=("",), concurrency=16, rate=100):
+        return Scrubber(
+            self.client,
+            bucket_name or self._get_bucket_name(),
+            concurrency,
+            rate,
+            (
+                self.staging_prefix,
+                self.upload_session_prefix,
+                self.blob_reference_prefix,
+            ),
+        ).scrub(prefixes)
+
+    def upload_session_part(self, session_id, part_number, stream, ticket=None):
+        if not 1 <= part_number <= 10000:
+            raise Exception(
+                f"{get_error_code(ErrorCode.INVALID_INPUT, get_write())} Part number must be between 1 and 10000"
+            )
+        session = self.__get_open_upload_session(session_id, ticket)
+        data = read_part(stream, self.upload_session_max_part_size + 1)
+        if len(data) > self.upload_session_max_part_size:
+            raise Exception(
+                f"{get_error_code(ErrorCode.INVALID_INPUT, get_write())} Part exceeds maximum size of {self.upload_session_max_part_size} bytes"
             )
-        except Exception as ex:
-            raise Exception(str(ex))
+        bucket_name = self._get_bucket_name(ticket)
+        etag = MultipartUpload(
+            self.client,
+            bucket_name,
+            session["staging_key"],
+            session["upload_id"],
+        ).upload_part(part_number, data)
+        return {"part_number": part_number, "size": len(data), "etag": etag}
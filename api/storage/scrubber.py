@@ -0,0 +1,106 @@
+import re
+import threading
+import time
+
+from botocore.exceptions import ClientError
+from concurrent.futures import ThreadPoolExecutor
+
+
+class RateLimiter:
+    def __init__(self, rate):
+        self.interval = 1 / rate if rate else 0
+        self.lock = threading.Lock()
+        self.next_time = time.monotonic()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.monotonic()
+            delay = self.next_time - now
+            self.next_time = max(self.next_time, now) + self.interval
+        if delay > 0:
+            time.sleep(delay)
+
+
+class Scrubber:
+    key_pattern = re.compile(r"^([0-9a-f]{32})(?:-|$)")
+
+    def __init__(
+        self, client, bucket_name, concurrency=16, rate=100, exclude_prefixes=()
+    ):
+        self.client = client
+        self.bucket_name = bucket_name
+        self.concurrency = concurrency
+        self.rate_limiter = RateLimiter(rate)
+        self.exclude_prefixes = tuple(exclude_prefixes)
+        self.slots = threading.BoundedSemaphore(concurrency * 2)
+        self.lock = threading.Lock()
+        self.result = {
+            "checked": 0,
+            "verified": 0,
+            "unverifiable": 0,
+            "mismatched": list(),
+            "errors": list(),
+        }
+
+    def __check(self, item):
+        try:
+            key = item["Key"]
+            md5sum = self.__get_md5(key)
+            etag = item["ETag"].strip('"')
+            if not md5sum or etag != md5sum:
+                self.rate_limiter.wait()
+                file_info = self.client.head_object(Bucket=self.bucket_name, Key=key)
+                md5sum = file_info.get("Metadata", {}).get("md5") or md5sum
+                etag = file_info["ETag"].strip('"')
+            if not md5sum or "-" in etag:
+                self.__record("unverifiable")
+            elif etag == md5sum:
+                self.__record("verified")
+            else:
+                self.__record("mismatched", {"key": key, "md5": md5sum, "etag": etag})
+        except ClientError as ex:
+            if ex.response.get("Error", {}).get("Code") not in ["404", "NoSuchKey"]:
+                self.__record("errors", {"key": key, "message": str(ex)})
+        except Exception as ex:
+            self.__record("errors", {"key": item.get("Key"), "message": str(ex)})
+        finally:
+            self.slots.release()
+
+    def __get_md5(self, key):
+        if match := self.key_pattern.match(key.split("/")[-1]):
+            return match.group(1)
+        return None
+
+    def __list_prefix(self, executor, prefix):
+        arguments = {"Bucket": self.bucket_name, "Prefix": prefix}
+        while True:
+            self.rate_limiter.wait()
+            page = self.client.list_objects_v2(**arguments)
+            for item in page.get("Contents", []):
+                if item["Key"].startswith(self.exclude_prefixes):
+                    continue
+                self.slots.acquire()
+                executor.submit(self.__check, item)
+            if not page.get("IsTruncated"):
+                return
+            arguments["ContinuationToken"] = page["NextContinuationToken"]
+
+    def __record(self, status, details=None):
+        with self.lock:
+            self.result["checked"] += 1
+            if details:
+                self.result[status].append(details)
+            else:
+                self.result[status] += 1
+
+    def scrub(self, prefixes=("",)):
+        with ThreadPoolExecutor(self.concurrency) as executor:
+            with ThreadPoolExecutor(len(prefixes)) as listers:
+                for future in [
+                    listers.submit(self.__list_prefix, executor, prefix)
+                    for prefix in prefixes
+                ]:
+                    future.result()
+        return self.result
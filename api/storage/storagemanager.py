@@ -1,7 +1,12 @@
 import os
+import storage.filesystem
+import storage.s3store
+import storage.tiered
 
 from elody.util import Singleton
-from storage.s3store import S3StorageManager
+from humanfriendly import parse_size
+from storage.cache import CachingStorageManager
+from storage.engine import get_storage_engine_class
 
 
 class StorageManager(metaclass=Singleton):
@@ -10,10 +15,14 @@ class StorageManager(metaclass=Singleton):
         self.__init_storage_managers()
 
     def __init_storage_managers(self):
-        if self.storage_engine == "s3":
-            self.storage_manager = S3StorageManager()
+        self.storage_manager = get_storage_engine_class(self.storage_engine)()
+        if cache_dir := os.getenv("DOWNLOAD_CACHE_DIR"):
+            self.storage_manager = CachingStorageManager(
+                self.storage_manager,
+                cache_dir,
+                parse_size(os.getenv("DOWNLOAD_CACHE_SIZE", "10 GiB")),
+                parse_size(os.getenv("DOWNLOAD_CACHE_MAX_OBJECT_SIZE", "1 GiB")),
+            )
 
-    def get_storage_engine(self, headers=None):
-        if headers:
-            self.storage_manager.set_headers(headers)
+    def get_storage_engine(self):
         return self.storage_manager
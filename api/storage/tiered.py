@@ -0,0 +1,249 @@
+import app
+import fcntl
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+from elody.exceptions import FileNotFoundException
+from humanfriendly import parse_size
+from storage.engine import register_storage_engine
+from storage.filesystem import FilesystemStorageManager
+from storage.multipart import stream_to_object
+from storage.s3store import S3StorageManager
+from uuid import uuid4
+
+
+@register_storage_engine("tiered")
+class TieredStorageManager(FilesystemStorageManager):
+    def __init__(self):
+        super().__init__()
+        self.remote = S3StorageManager()
+        self.journal_dir = os.path.join(self.root, ".replication")
+        self.local_size = parse_size(os.getenv("TIERED_LOCAL_SIZE", "100 GiB"))
+        self.replication_interval = float(os.getenv("TIERED_REPLICATION_INTERVAL", 5))
+        self.replication_event = threading.Event()
+        self.replicated = 0
+        self.replication_errors = 0
+        self.demoted = 0
+        os.makedirs(self.journal_dir, exist_ok=True)
+        if os.getenv("TIERED_REPLICATION_WORKER", True) in ["True", "true", True]:
+            threading.Thread(
+                target=self.__run_replication, name="replication", daemon=True
+            ).start()
+
+    def __demote(self):
+        with self.__lock("demote.lock", fcntl.LOCK_EX):
+            entries = sorted(self.__scan(), key=lambda entry: entry[2])
+            size = sum(size for _, size, _ in entries)
+            pending = self.__get_pending()
+            for path, entry_size, _ in entries:
+                if size <= self.local_size * 0.9:
+                    break
+                if self.__get_path_id(path) in pending:
+                    continue
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+                size -= entry_size
+                self.demoted += 1
+            return size
+
+    def __get_journal_entries(self, path_id=None):
+        return sorted(
+            entry
+            for entry in os.listdir(self.journal_dir)
+            if entry.endswith(".json") and (not path_id or entry.startswith(path_id))
+        )
+
+    def __get_local_size(self):
+        try:
+            with open(os.path.join(self.journal_dir, "size")) as size_file:
+                return int(size_file.read())
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def __get_path_id(self, path):
+        return hashlib.sha256(os.path.relpath(path, self.root).encode()).hexdigest()
+
+    def __get_pending(self):
+        return {entry.split("-")[0] for entry in self.__get_journal_entries()}
+
+    def __lock(self, name, operation):
+        lock_file = open(os.path.join(self.journal_dir, name), "a")
+        try:
+            fcntl.flock(lock_file, operation)
+        except Exception:
+            lock_file.close()
+            raise
+        return lock_file
+
+    def __remove_journal_entries(self, bucket_name, key):
+        path_id = self.__get_path_id(self._get_path_for_key(bucket_name, key))
+        for entry in self.__get_journal_entries(path_id):
+            try:
+                os.unlink(os.path.join(self.journal_dir, entry))
+            except FileNotFoundError:
+                pass
+
+    def __replicate(self, entry):
+        journal_path = os.path.join(self.journal_dir, entry)
+        try:
+            with open(journal_path) as journal_file:
+                replication = json.load(journal_file)
+        except FileNotFoundError:
+            return
+        bucket_name, key = replication["bucket"], replication["key"]
+        try:
+            file = open(self._get_path_for_key(bucket_name, key), "rb")
+        except FileNotFoundError:
+            os.unlink(journal_path)
+            return
+        with file:
+            stream_to_object(
+                self.remote.client,
+                bucket_name,
+                key,
+                file,
+                self.remote.upload_part_size,
+                self.remote.upload_part_concurrency,
+            )
+        if self.remote.dedup_index:
+            self.remote.dedup_index.add(bucket_name, key)
+        try:
+            os.unlink(journal_path)
+        except FileNotFoundError:
+            self.remote.client.delete_object(Bucket=bucket_name, Key=key)
+            return
+        self.replicated += 1
+
+    def __run_replication(self):
+        while True:
+            try:
+                self.replicate_pending()
+            except Exception as ex:
+                app.logger.error(f"Replication to S3 failed with: {ex}")
+            self.replication_event.wait(self.replication_interval)
+            self.replication_event.clear()
+
+    def __scan(self):
+        for directory, directories, files in os.walk(self.root):
+            if directory == self.root:
+                directories[:] = [
+                    name for name in directories if not name.startswith(".")
+                ]
+                continue
+            for name in files:
+                path = os.path.join(directory, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                yield path, stat.st_size, stat.st_atime
+
+    def __set_local_size(self, size):
+        with tempfile.NamedTemporaryFile(
+            "w", dir=self.journal_dir, prefix="tmp", suffix=".tmp", delete=False
+        ) as size_file:
+            size_file.write(str(size))
+        os.replace(size_file.name, os.path.join(self.journal_dir, "size"))
+
+    def __write_journal_entry(self, bucket_name, key):
+        path_id = self.__get_path_id(self._get_path_for_key(bucket_name, key))
+        with tempfile.NamedTemporaryFile(
+            "w", dir=self.journal_dir, prefix="tmp", suffix=".tmp", delete=False
+        ) as journal_file:
+            json.dump({"bucket": bucket_name, "key": key}, journal_file)
+            if self.fsync:
+                journal_file.flush()
+                os.fsync(journal_file.fileno())
+        os.replace(
+            journal_file.name,
+            os.path.join(
+                self.journal_dir, f"{path_id}-{time.time_ns()}-{uuid4()}.json"
+            ),
+        )
+
+    def _find_existing_file(self, md5sum, ticket=None):
+        return super()._find_existing_file(
+            md5sum, ticket
+        ) or self.remote._find_existing_file(md5sum, ticket)
+
+    def _promote_staging_object(self, staging_key, key, ticket=None, ingest=None):
+        bucket_name = self._get_bucket_name(ticket)
+        with self.__lock("demote.lock", fcntl.LOCK_SH):
+            self.__write_journal_entry(bucket_name, key)
+            super()._promote_staging_object(staging_key, key, ticket, ingest)
+        self.replication_event.set()
+
+    def check_health(self):
+        return super().check_health() and self.remote.check_health()
+
+    def delete_files(self, files, on_batch_deleted=None):
+        bucket_name = self._get_bucket_name()
+        for key in self.get_keys_for_files(files):
+            self.__remove_journal_entries(bucket_name, key)
+        local_result = super().delete_files(files)
+        result = self.remote.delete_files(files, on_batch_deleted)
+        failed = {error["key"] for error in local_result["errors"]}
+        result["deleted"] = [key for key in result["deleted"] if key not in failed]
+        result["errors"].extend(local_result["errors"])
+        return result
+
+    def download_file(self, file_name, range=None, ticket=None):
+        try:
+            file_object = self._open_file(file_name, range, ticket)
+        except FileNotFoundError:
+            return self.remote.download_file(file_name, range, ticket)
+        fileno = file_object["stream"].file.fileno()
+        os.utime(fileno, ns=(time.time_ns(), os.fstat(fileno).st_mtime_ns))
+        return file_object
+
+    def find_existing_files(self, md5sums, ticket=None):
+        existing_files = super().find_existing_files(md5sums, ticket)
+        if missing := [
+            md5sum for md5sum in dict.fromkeys(md5sums) if md5sum not in existing_files
+        ]:
+            existing_files.update(self.remote.find_existing_files(missing, ticket))
+        return existing_files
+
+    def get_replication_stats(self):
+        return {
+            "pending": len(self.__get_journal_entries()),
+            "replicated": self.replicated,
+            "errors": self.replication_errors,
+            "demoted": self.demoted,
+            "size": self.__get_local_size(),
+            "max_size": self.local_size,
+        }
+
+    def head_file(self, file_name, ticket=None):
+        try:
+            return super().head_file(file_name, ticket)
+        except FileNotFoundException:
+            return self.remote.head_file(file_name, ticket)
+
+    def replicate_pending(self):
+        try:
+            lock = self.__lock("replication.lock", fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return
+        with lock:
+            entries = self.__get_journal_entries()
+            for entry in entries:
+                try:
+                    self.__replicate(entry)
+                except Exception as ex:
+                    self.replication_errors += 1
+                    app.logger.warning(f"Replicating {entry} failed, retrying: {ex}")
+            if entries or self.__get_local_size() is None:
+                size = sum(size for _, size, _ in self.__scan())
+                if size > self.local_size:
+                    size = self.__demote()
+                self.__set_local_size(size)
+
+    def scrub(self, bucket_name=None, prefixes=("",), concurrency=16, rate=100):
+        return self.remote.scrub(bucket_name, prefixes, concurrency, rate)
@@ -0,0 +1,143 @@
+import asyncio
+import hashlib
+import os
+import threading
+
+from app import policy_factory
+from asgi import app
+from datetime import timedelta
+from starlette.testclient import TestClient
+from storage.asyncstore import AsyncS3StorageManager
+from storage.storagemanager import StorageManager
+from tests.base_case import BaseCase, bucket, s3
+from types import SimpleNamespace
+from unittest.mock import patch, AsyncMock, MagicMock
+
+ticket = {"_id": "ticket", "bucket": bucket, "location": "test.bin"}
+
+
+@patch(
+    "storage.asyncstore.AsyncS3StorageManager.get_ticket",
+    new=AsyncMock(return_value=ticket),
+)
+@patch(
+    "storage.asyncstore.AsyncS3StorageManager.get_mediafile",
+    new=AsyncMock(return_value=None),
+)
+@patch("resources.async_base_resource.start_job", new=MagicMock(return_value="job"))
+@patch("resources.async_base_resource.finish_job", new=MagicMock())
+@patch("resources.async_base_resource.fail_job", new=MagicMock())
+class AsgiTest(BaseCase):
+    def setUp(self):
+        super().setUp()
+        self.data = os.urandom(10000)
+        self.client = TestClient(app)
+        self.client.__enter__()
+        self.addCleanup(self.client.__exit__, None, None, None)
+
+    def test_download_with_ticket(self):
+        s3.Bucket(bucket).put_object(Key="test.bin", Body=self.data)
+
+        response = self.client.get("/download-with-ticket/test.bin?ticket_id=ticket")
+
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(self.data, response.content)
+        self.assertIn("ETag", response.headers)
+
+    def test_download_range_with_ticket(self):
+        s3.Bucket(bucket).put_object(Key="test.bin", Body=self.data)
+
+        response = self.client.get(
+            "/download-with-ticket/test.bin?ticket_id=ticket",
+            headers={"Range": "bytes=10-19"},
+        )
+
+        self.assertEqual(206, response.status_code)
+        self.assertEqual("bytes 10-19/10000", response.headers["Content-Range"])
+        self.assertEqual(self.data[10:20], response.content)
+
+    def test_download_missing_file(self):
+        response = self.client.get("/download-with-ticket/test.bin?ticket_id=ticket")
+
+        self.assertEqual(404, response.status_code)
+
+    def test_upload_with_ticket(self):
+        response = self.client.post(
+            "/upload-with-ticket/test.bin?ticket_id=ticket", content=self.data
+        )
+
+        self.assertEqual(201, response.status_code, response.text)
+        md5sum = hashlib.md5(self.data).hexdigest()
+        body = s3.Object(bucket, f"{md5sum}-test.bin").get()["Body"].read()
+        self.assertEqual(self.data, body)
+        self.assertEqual(
+            [f"{md5sum}-test.bin"],
+            [item.key for item in s3.Bucket(bucket).objects.all()],
+        )
+
+    def test_head_download_is_served_by_flask(self):
+        s3.Bucket(bucket).put_object(Key="test.bin", Body=self.data)
+
+        with patch.object(AsyncS3StorageManager, "download_file") as download_file:
+            response = self.client.head("/download/test.bin")
+
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(b"", response.content)
+        download_file.assert_not_called()
+
+    def test_requests_outside_async_routes_are_served_by_flask(self):
+        response = self.client.get("/spec/dams-storage-api.json")
+
+        self.assertEqual(200, response.status_code)
+
+    def test_user_context_is_local_to_each_request(self):
+        barrier = threading.Barrier(2)
+        seen = dict()
+
+        def authenticate(email):
+            policy_factory._user_context = SimpleNamespace(email=email)
+            barrier.wait()
+            seen[email] = policy_factory.get_user_context().email
+
+        threads = [
+            threading.Thread(target=authenticate, args=(email,))
+            for email in ["first@example.com", "second@example.com"]
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(
+            {
+                "first@example.com": "first@example.com",
+                "second@example.com": "second@example.com",
+            },
+            seen,
+        )
+
+
+class AsyncStorageTest(BaseCase):
+    def setUp(self):
+        super().setUp()
+        self.engine = StorageManager().get_storage_engine()
+        self.storage = AsyncS3StorageManager(self.engine)
+        self.addCleanup(asyncio.run, self.storage.close())
+        self.addCleanup(self.engine.ticket_cache.invalidate, ["ticket"])
+
+    @patch.dict(os.environ, {"STATIC_APIKEY": "static"})
+    def test_ticket_is_shared_with_the_storage_engine(self):
+        response = MagicMock(
+            status_code=200,
+            json=lambda: {**ticket, "is_expired": False, "exp": 2**32},
+            elapsed=timedelta(),
+        )
+        get = AsyncMock(return_value=response)
+
+        with patch.object(self.storage.http, "get", get):
+            asyncio.run(self.storage.get_ticket("ticket"))
+        with patch.object(self.engine, "session") as session:
+            self.engine.get_ticket("ticket")
+
+        self.assertEqual("static", get.call_args.kwargs["headers"]["apikey"])
+        session.get.assert_not_called()
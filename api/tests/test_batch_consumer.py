@@ -0,0 +1,112 @@
+import json
+
+from tests.base_case import BaseCase, bucket, s3
+from resources import queues
+from resources.batch_consumer import BatchConsumer
+from unittest.mock import patch, MagicMock
+
+
+class BatchConsumerTest(BaseCase):
+    def setUp(self):
+        super().setUp()
+        self.connection = MagicMock()
+        self.connection.add_callback_threadsafe.side_effect = (
+            lambda callback: callback()
+        )
+        self.channel = MagicMock()
+
+    def consumer(self, handler, batch_size=10):
+        handler.__name__ = "remove_file_from_storage"
+        return BatchConsumer(handler, ["dams.mediafile_deleted"], batch_size, 1, 20, 1)
+
+    def messages(self, *bodies):
+        messages = list()
+        for index, body in enumerate(bodies):
+            method = MagicMock(
+                delivery_tag=index,
+                redelivered=False,
+                routing_key="dams.mediafile_deleted",
+            )
+            messages.append((method, None, body))
+        return messages
+
+    def mediafile_deleted(self, filename):
+        return json.dumps(
+            {"data": {"mediafile": {"filename": filename}, "linked_entities": []}}
+        ).encode()
+
+    @patch.dict("os.environ", {"MQ_EXCHANGE": "dams", "DURABLE_EXCHANGE": "true"})
+    @patch("resources.batch_consumer.BlockingConnection")
+    def test_queue_and_exchange_are_declared_from_config(self, connection):
+        channel = connection.return_value.channel.return_value
+        channel.is_open = False
+        consumer = self.consumer(lambda messages: [])
+
+        getattr(consumer, "_BatchConsumer__consume")()
+
+        channel.exchange_declare.assert_called_once_with(
+            exchange="dams", exchange_type="topic", passive=False, durable=True
+        )
+        channel.queue_declare.assert_called_once_with(
+            "basic.remove.file.from.storage", durable=True
+        )
+        channel.queue_bind.assert_called_once_with(
+            exchange="dams",
+            queue="basic.remove.file.from.storage",
+            routing_key="dams.mediafile_deleted",
+        )
+
+    def test_batch_is_ready_at_batch_size(self):
+        consumer = self.consumer(lambda messages: [], batch_size=2)
+
+        consumer.add(*self.messages(b"{}")[0])
+        self.assertFalse(consumer.is_ready())
+        consumer.add(*self.messages(b"{}")[0])
+
+        self.assertTrue(consumer.is_ready())
+
+    def test_messages_are_acked_or_rejected_per_message(self):
+        consumer = self.consumer(lambda messages: [None, "failed"])
+
+        consumer.handle(
+            self.connection, self.channel, self.messages(b"{}", b"{}", b"invalid")
+        )
+
+        self.channel.basic_ack.assert_called_once_with(0)
+        self.assertEqual(
+            [((1,), {"requeue": True}), ((2,), {"requeue": True})],
+            [
+                (call.args, call.kwargs)
+                for call in self.channel.basic_reject.call_args_list
+            ],
+        )
+
+    def test_all_messages_are_rejected_when_handler_fails(self):
+        consumer = self.consumer(MagicMock(side_effect=Exception("failed")))
+
+        consumer.handle(self.connection, self.channel, self.messages(b"{}", b"{}"))
+
+        self.channel.basic_ack.assert_not_called()
+        self.assertEqual(2, self.channel.basic_reject.call_count)
+
+    def test_files_of_all_messages_are_deleted_in_one_batch(self):
+        for key in ["a.jpg", "b.jpg", "c.jpg"]:
+            s3.Bucket(bucket).put_object(Key=key, Body=b"data")
+        handler = getattr(queues, "__delete_files_in_batch")
+        consumer = self.consumer(MagicMock(side_effect=handler))
+
+        consumer.handle(
+            self.connection,
+            self.channel,
+            self.messages(
+                self.mediafile_deleted("a.jpg"),
+                self.mediafile_deleted("b.jpg"),
+                json.dumps({"data": {}}).encode(),
+            ),
+        )
+
+        consumer.handler.assert_called_once()
+        self.assertEqual(3, self.channel.basic_ack.call_count)
+        self.assertEqual(
+            ["c.jpg"], [item.key for item in s3.Bucket(bucket).objects.all()]
+        )
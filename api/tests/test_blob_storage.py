@@ -0,0 +1,137 @@
+import hashlib
+import os
+import tempfile
+
+from tests.base_case import BaseCase, bucket, s3
+from io import BytesIO
+from storage.engine import get_storage_engine_class
+from unittest.mock import patch
+
+other_bucket = f"{bucket}-other"
+
+
+@patch("storage.s3store.S3StorageManager._get_mediafile", return_value=None)
+class BlobStorageTest(BaseCase):
+    def setUp(self):
+        super().setUp()
+        s3.create_bucket(Bucket=other_bucket)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.storage = self.__create_storage("blobs.db")
+        self.data = os.urandom(5000)
+        self.md5sum = hashlib.md5(self.data).hexdigest()
+
+    def tearDown(self):
+        s3.Bucket(other_bucket).objects.all().delete()
+        s3.Bucket(other_bucket).delete()
+        super().tearDown()
+
+    def __create_storage(self, index_name):
+        with patch.dict(
+            os.environ,
+            {
+                "BLOB_INDEX_PATH": os.path.join(self.directory, index_name),
+                "BLOB_GC_GRACE_PERIOD": "0",
+            },
+        ):
+            return get_storage_engine_class("s3")()
+
+    def __download(self, key, ticket_bucket):
+        ticket = {"bucket": ticket_bucket, "location": key}
+        return self.storage.download_file(key, ticket=ticket)["stream"].read()
+
+    def __upload(self, key, ticket_bucket, md5sum=None):
+        ticket = {"bucket": ticket_bucket, "location": key}
+        self.storage.upload_file(
+            BytesIO(self.data), "mediafile", key, ticket, md5sum=md5sum
+        )
+        return f"{self.md5sum}-{key}"
+
+    def test_identical_content_is_stored_once(self, _):
+        first = self.__upload("first.bin", bucket)
+        second = self.__upload("second.bin", other_bucket)
+
+        self.assertEqual(
+            [f"blob-refs/{first}", f"blobs/{self.md5sum}"],
+            [obj.key for obj in s3.Bucket(bucket).objects.all()],
+        )
+        self.assertEqual(
+            [f"blob-refs/{second}"],
+            [obj.key for obj in s3.Bucket(other_bucket).objects.all()],
+        )
+        self.assertEqual(self.data, self.__download(first, bucket))
+        self.assertEqual(self.data, self.__download(second, other_bucket))
+        self.assertEqual(1, self.storage.scrub(rate=0)["verified"])
+
+    def test_failed_copy_leaves_no_reference(self, _):
+        with patch.object(
+            self.storage.client, "copy_object", side_effect=Exception("copy failed")
+        ):
+            with self.assertRaises(Exception):
+                self.__upload("first.bin", bucket)
+
+        self.assertEqual(
+            [],
+            [obj.key for obj in s3.Bucket(bucket).objects.filter(Prefix="blob-refs/")],
+        )
+
+    def test_duplicate_upload_only_adds_a_reference(self, _):
+        self.__upload("first.bin", bucket)
+
+        with patch.object(self.storage.client, "copy_object") as copy_object:
+            second = self.__upload("second.bin", other_bucket, self.md5sum)
+
+        copy_object.assert_not_called()
+        self.assertEqual(self.data, self.__download(second, other_bucket))
+
+    def test_blob_is_collected_after_last_reference(self, _):
+        first = self.__upload("first.bin", bucket)
+        self.__upload("second.bin", bucket)
+        self.__upload("third.bin", other_bucket)
+
+        result = self.storage.delete_files([first, f"{self.md5sum}-second.bin"])
+
+        self.assertEqual(2, len(result["deleted"]))
+        self.assertEqual([], self.storage.collect_garbage())
+        self.assertEqual(1, len(list(s3.Bucket(bucket).objects.all())))
+
+        with patch.object(self.storage, "_get_bucket_name", return_value=other_bucket):
+            self.storage.delete_files([f"{self.md5sum}-third.bin"])
+
+        self.assertEqual([self.md5sum], self.storage.collect_garbage())
+        self.assertEqual([], list(s3.Bucket(bucket).objects.all()))
+
+    def test_orphaned_blob_is_kept_during_grace_period(self, _):
+        key = self.__upload("first.bin", bucket)
+        self.storage.blob_gc_grace_period = 3600
+
+        self.storage.delete_files([key])
+
+        self.assertEqual([], self.storage.collect_garbage())
+        self.assertEqual(1, len(list(s3.Bucket(bucket).objects.all())))
+
+    def test_lost_index_is_rebuilt_from_references(self, _):
+        first = self.__upload("first.bin", bucket)
+        second = self.__upload("second.bin", other_bucket)
+        self.storage = self.__create_storage("rebuilt.db")
+
+        self.assertEqual(2, self.storage.rebuild_blob_index([bucket, other_bucket]))
+
+        self.assertEqual(self.data, self.__download(first, bucket))
+        self.assertEqual(self.data, self.__download(second, other_bucket))
+        self.assertEqual([], self.storage.collect_garbage())
+        self.storage.delete_files([first])
+        with patch.object(self.storage, "_get_bucket_name", return_value=other_bucket):
+            self.storage.delete_files([second])
+        self.assertEqual([self.md5sum], self.storage.collect_garbage())
+        self.assertEqual([], list(s3.Bucket(bucket).objects.all()))
+
+    def test_rebuild_drops_references_without_marker(self, _):
+        key = self.__upload("first.bin", bucket)
+        s3.Object(bucket, f"blob-refs/{key}").delete()
+
+        self.assertEqual(0, self.storage.rebuild_blob_index([bucket]))
+
+        self.assertEqual((bucket, key), self.storage.get_object_location(key))
+        self.assertEqual([self.md5sum], self.storage.collect_garbage())
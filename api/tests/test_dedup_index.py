@@ -0,0 +1,66 @@
+import hashlib
+import os
+import tempfile
+
+from tests.base_case import BaseCase, bucket, s3
+from storage.dedup_index import DedupIndex
+from unittest.mock import patch, MagicMock
+
+md5sum = hashlib.md5(b"data").hexdigest()
+other_md5sum = "fedcba9876543210fedcba9876543210"
+
+
+class DedupIndexTest(BaseCase):
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "dedup.db")
+        self.index = DedupIndex(self.path, 1000)
+        self.client = s3.meta.client
+
+    def test_rebuild_indexes_listed_files(self):
+        for i in range(3):
+            s3.Bucket(bucket).put_object(Key=f"{md5sum}-{i}.bin", Body=b"data")
+        s3.Bucket(bucket).put_object(Key="plain.bin", Body=b"data")
+
+        self.assertEqual(3, self.index.rebuild(bucket, self.client))
+        self.assertEqual(f"{md5sum}-0.bin", self.index.find(bucket, md5sum))
+
+    def test_rebuild_skips_files_whose_content_no_longer_matches_the_key(self):
+        s3.Bucket(bucket).put_object(Key=f"{md5sum}-rewritten.bin", Body=b"other")
+
+        self.assertEqual(0, self.index.rebuild(bucket, self.client))
+        self.assertIsNone(self.index.find(bucket, md5sum))
+
+    def test_add_removes_files_whose_content_no_longer_matches_the_key(self):
+        self.index.add(bucket, f"{md5sum}-rewritten.bin")
+
+        self.index.add(bucket, f"{md5sum}-rewritten.bin", other_md5sum)
+
+        self.assertIsNone(self.index.find(bucket, md5sum))
+
+    def test_rebuild_removes_stale_keys(self):
+        self.index.add(bucket, f"{other_md5sum}-deleted.bin")
+
+        self.index.rebuild(bucket, self.client)
+
+        self.assertIsNone(self.index.find(bucket, other_md5sum))
+
+    def test_rebuild_does_not_block_other_writers(self):
+        for i in range(3):
+            s3.Bucket(bucket).put_object(Key=f"{md5sum}-{i}.bin", Body=b"data")
+        other_index = DedupIndex(self.path, 1000)
+        paginator = self.client.get_paginator("list_objects_v2")
+
+        def paginate(**kwargs):
+            for page in paginator.paginate(**kwargs, PaginationConfig={"PageSize": 1}):
+                other_index.add(bucket, f"{other_md5sum}-{page['Contents'][0]['Key']}")
+                yield page
+
+        with patch.object(
+            self.client, "get_paginator", return_value=MagicMock(paginate=paginate)
+        ):
+            self.index.rebuild(bucket, self.client)
+
+        self.assertIsNotNone(self.index.find(bucket, other_md5sum))
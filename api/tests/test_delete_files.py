@@ -0,0 +1,102 @@
+from tests.base_case import BaseCase, bucket, s3
+from resources.queues import delete_files_in_background
+from storage.storagemanager import StorageManager
+from unittest.mock import patch, MagicMock
+
+
+class DeleteFilesTest(BaseCase):
+    def setUp(self):
+        super().setUp()
+        self.storage = StorageManager().get_storage_engine()
+
+    def keys(self):
+        return sorted(item.key for item in s3.Bucket(bucket).objects.all())
+
+    def test_delete_files_in_batches(self):
+        self.addCleanup(setattr, self.storage, "delete_batch_size", 1000)
+        self.storage.delete_batch_size = 3
+        keys = [f"file-{i}.bin" for i in range(10)]
+        for key in keys:
+            s3.Bucket(bucket).put_object(Key=key, Body=b"data")
+        batches = list()
+
+        result = self.storage.delete_files(
+            keys, lambda batch, _: batches.append(len(batch))
+        )
+
+        self.assertEqual(keys, sorted(result["deleted"]))
+        self.assertEqual([], result["errors"])
+        self.assertEqual([3, 3, 3, 1], sorted(batches, reverse=True))
+        self.assertEqual([], self.keys())
+
+    def test_delete_files_expands_mediafiles(self):
+        for key in ["file.jpg", "transcode-file.jpg", "other.jpg"]:
+            s3.Bucket(bucket).put_object(Key=key, Body=b"data")
+        mediafile = {"filename": "file.jpg", "transcode_filename": "transcode-file.jpg"}
+
+        result = self.storage.delete_files([mediafile])
+
+        self.assertEqual(["file.jpg", "transcode-file.jpg"], sorted(result["deleted"]))
+        self.assertEqual(["other.jpg"], self.keys())
+
+
+class DeleteMultipleTest(BaseCase):
+    def setUp(self):
+        super().setUp()
+        for key in ["first.bin", "second.bin"]:
+            s3.Bucket(bucket).put_object(Key=key, Body=b"data")
+
+    def keys(self):
+        return sorted(item.key for item in s3.Bucket(bucket).objects.all())
+
+    def test_delete_multiple(self):
+        response = self.app.delete("/delete", json=["first.bin", "second.bin"])
+
+        self.assertEqual(204, response.status_code)
+        self.assertEqual(b"", response.data)
+        self.assertEqual([], self.keys())
+
+    def test_delete_multiple_with_results(self):
+        response = self.app.delete(
+            "/delete?results=true", json=["first.bin", "second.bin"]
+        )
+
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(["first.bin", "second.bin"], sorted(response.json["deleted"]))
+        self.assertEqual([], response.json["errors"])
+
+    @patch("resources.base_resource.start_job", new=MagicMock(return_value="job"))
+    @patch("resources.base_resource.rabbit")
+    def test_delete_multiple_in_background(self, rabbit):
+        response = self.app.delete(
+            "/delete?background=true&user_email=user@example.com",
+            json=["first.bin", "second.bin"],
+        )
+
+        self.assertEqual(202, response.status_code)
+        self.assertEqual({"job_id": "job"}, response.json)
+        self.assertEqual(["first.bin", "second.bin"], self.keys())
+        event = rabbit.send.call_args.args[0]
+        self.assertEqual(
+            "dams.files_delete_requested", rabbit.send.call_args.kwargs["routing_key"]
+        )
+        self.assertEqual(
+            {
+                "files": ["first.bin", "second.bin"],
+                "job_id": "job",
+                "user_email": "user@example.com",
+            },
+            event["data"],
+        )
+
+        with patch("resources.queues.start_job") as start_job, patch(
+            "resources.queues.finish_job"
+        ) as finish_job, patch("resources.queues.fail_job") as fail_job:
+            start_job.return_value = "batch"
+            delete_files_in_background("dams.files_delete_requested", event, "message")
+
+        self.assertEqual([], self.keys())
+        fail_job.assert_not_called()
+        self.assertEqual(
+            ["batch", "job"], [call.args[0] for call in finish_job.call_args_list]
+        )
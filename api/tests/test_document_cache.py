@@ -0,0 +1,110 @@
+import os
+import time
+
+from tests.base_case import BaseCase
+from storage.document_cache import DocumentCache
+from storage.storagemanager import StorageManager
+from unittest import TestCase
+from unittest.mock import patch, MagicMock
+
+
+class DocumentCacheTest(TestCase):
+    def setUp(self):
+        self.cache = DocumentCache(2, 30)
+
+    def test_get_returns_copy_of_cached_document(self):
+        self.cache.set(("m1", "tenant"), {"identifiers": []})
+
+        self.cache.get(("m1", "tenant"))["identifiers"].append("md5")
+
+        self.assertEqual({"identifiers": []}, self.cache.get(("m1", "tenant")))
+        self.assertEqual(2, self.cache.get_stats()["hits"])
+
+    def test_documents_expire(self):
+        with patch("storage.document_cache.time.monotonic", return_value=0):
+            self.cache.set(("m1", "tenant"), {"_id": "m1"}, ttl=5)
+        with patch("storage.document_cache.time.monotonic", return_value=10):
+            self.assertIsNone(self.cache.get(("m1", "tenant")))
+
+    def test_least_recently_used_document_is_evicted(self):
+        self.cache.set(("m1", "tenant"), {"_id": "m1"})
+        self.cache.set(("m2", "tenant"), {"_id": "m2"})
+        self.cache.get(("m1", "tenant"))
+        self.cache.set(("m3", "tenant"), {"_id": "m3"})
+
+        self.assertIsNone(self.cache.get(("m2", "tenant")))
+        self.assertEqual({"_id": "m1"}, self.cache.get(("m1", "tenant")))
+
+    def test_invalidate_removes_document_for_all_tenants(self):
+        self.cache.set(("m1", "tenant-a"), {"_id": "m1"})
+        self.cache.set(("m1", "tenant-b"), {"_id": "m1"})
+
+        self.cache.invalidate(["m1"])
+
+        self.assertIsNone(self.cache.get(("m1", "tenant-a")))
+        self.assertIsNone(self.cache.get(("m1", "tenant-b")))
+        self.assertEqual(2, self.cache.get_stats()["invalidations"])
+
+
+@patch("app.rabbit", new=MagicMock())
+@patch("resources.base_resource.start_job", new=MagicMock(return_value="job"))
+@patch("resources.base_resource.finish_job", new=MagicMock())
+@patch("resources.base_resource.fail_job", new=MagicMock())
+class MediafileCacheTest(BaseCase):
+    def get_mediafile(self, title):
+        return {
+            "_id": "mediafile",
+            "identifiers": [],
+            "filename": "test.bin",
+            "metadata": [{"key": "title", "value": title}],
+            "original_file_location": "/download/test.bin",
+        }
+
+    def test_upload_writes_back_fresh_mediafile(self):
+        storage = StorageManager().get_storage_engine()
+        session = MagicMock()
+        session.get.return_value = MagicMock(
+            status_code=200, json=lambda: self.get_mediafile("edited")
+        )
+        storage.mediafile_cache.set(("mediafile", None), self.get_mediafile("outdated"))
+        self.addCleanup(storage.mediafile_cache.invalidate, ["mediafile"])
+
+        with patch.object(storage, "session", session), patch.object(
+            storage, "storage_api_url", "http://storage/"
+        ):
+            response = self.app.post(
+                "/upload/test.bin?id=mediafile",
+                data=os.urandom(100),
+                headers={"content-type": "application/octet-stream"},
+            )
+
+        self.assertEqual(201, response.status_code)
+        self.assertEqual(
+            [{"key": "title", "value": "edited"}],
+            session.put.call_args.kwargs["json"]["metadata"],
+        )
+
+
+class TicketCacheTest(TestCase):
+    def setUp(self):
+        self.storage = StorageManager().get_storage_engine()
+        self.session = MagicMock()
+        self.addCleanup(self.storage.ticket_cache.invalidate, ["ticket"])
+
+    def get_ticket_twice(self, ticket):
+        self.session.get.return_value = MagicMock(status_code=200, json=lambda: ticket)
+        with patch.object(self.storage, "session", self.session):
+            self.storage.get_ticket("ticket")
+            return self.storage.get_ticket("ticket")
+
+    def test_ticket_is_cached_until_it_expires(self):
+        ticket = {"is_expired": False, "exp": time.time() + 30}
+
+        self.assertEqual(ticket, self.get_ticket_twice(ticket))
+        self.assertEqual(1, self.session.get.call_count)
+
+    def test_ticket_without_expiry_is_not_cached(self):
+        ticket = {"is_expired": False}
+
+        self.assertEqual(ticket, self.get_ticket_twice(ticket))
+        self.assertEqual(2, self.session.get.call_count)
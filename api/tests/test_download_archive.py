@@ -0,0 +1,83 @@
+import io
+import os
+import threading
+import zipfile
+
+from tests.base_case import BaseCase, bucket, s3
+from storage.archive import stream_archive
+from unittest.mock import patch, MagicMock
+
+ticket = {
+    "bucket": bucket,
+    "location": "a.bin",
+    "locations": ["a.bin", "b.bin", "nested/a.bin"],
+}
+
+
+@patch(
+    "resources.base_resource.BaseResource._get_ticket",
+    new=MagicMock(return_value=ticket),
+)
+class DownloadArchiveTest(BaseCase):
+    def setUp(self):
+        super().setUp()
+        self.files = {key: os.urandom(3000) for key in ticket["locations"]}
+        for key, data in self.files.items():
+            s3.Bucket(bucket).put_object(Key=key, Body=data)
+
+    def test_download_archive_with_ticket(self):
+        response = self.app.get("/download-with-ticket?ticket_id=ticket")
+
+        self.assertEqual(200, response.status_code)
+        self.assertEqual("application/zip", response.mimetype)
+        archive = zipfile.ZipFile(io.BytesIO(response.data))
+        self.assertEqual(["a.bin", "b.bin", "a (1).bin"], archive.namelist())
+        self.assertEqual(self.files["a.bin"], archive.read("a.bin"))
+        self.assertEqual(self.files["b.bin"], archive.read("b.bin"))
+        self.assertEqual(self.files["nested/a.bin"], archive.read("a (1).bin"))
+
+    @patch.dict(os.environ, {"ARCHIVE_PREFETCH": "1", "ARCHIVE_PREFETCH_SIZE": "1000"})
+    def test_download_archive_with_small_prefetch_window(self):
+        response = self.app.get("/download-with-ticket?ticket_id=ticket")
+
+        archive = zipfile.ZipFile(io.BytesIO(response.data))
+        for name, key in zip(archive.namelist(), ticket["locations"]):
+            self.assertEqual(self.files[key], archive.read(name))
+
+    def test_download_archive_with_missing_file(self):
+        s3.Bucket(bucket).delete_objects(Delete={"Objects": [{"Key": "b.bin"}]})
+
+        response = self.app.get("/download-with-ticket?ticket_id=ticket")
+
+        self.assertEqual(404, response.status_code)
+
+    def test_running_prefetch_is_closed_when_client_disconnects(self):
+        started, release = threading.Event(), threading.Event()
+        streams = {key: MagicMock() for key in ["a.bin", "b.bin"]}
+
+        def download_file(file_name, ticket=None):
+            if file_name == "b.bin":
+                started.set()
+                release.wait(5)
+            return {"stream": streams[file_name]}
+
+        def get_stream_generator(stream):
+            yield from [b"da", b"ta"]
+
+        storage = MagicMock(
+            download_file=download_file, get_stream_generator=get_stream_generator
+        )
+        archive = stream_archive(
+            storage,
+            [("a.bin", None), ("b.bin", None)],
+            [{"content_length": 4}, {"content_length": 4}],
+            prefetch=1,
+            prefetch_size=2,
+        )
+
+        next(archive)
+        started.wait(5)
+        threading.Timer(0.1, release.set).start()
+        archive.close()
+
+        streams["b.bin"].close.assert_called_once()
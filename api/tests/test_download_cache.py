@@ -0,0 +1,82 @@
+import os
+import tempfile
+
+from concurrent.futures import ThreadPoolExecutor
+
+from tests.base_case import BaseCase, bucket, s3
+from storage.cache import CachingStorageManager
+from storage.storagemanager import StorageManager
+from unittest.mock import patch, MagicMock
+
+ticket = {"bucket": bucket, "location": "test.bin"}
+
+
+@patch(
+    "resources.base_resource.BaseResource._get_ticket",
+    new=MagicMock(return_value=ticket),
+)
+class DownloadCacheTest(BaseCase):
+    def setUp(self):
+        super().setUp()
+        self.data = os.urandom(10000)
+        s3.Bucket(bucket).put_object(Key="test.bin", Body=self.data)
+        storage_manager = StorageManager()
+        self.addCleanup(
+            setattr, storage_manager, "storage_manager", storage_manager.storage_manager
+        )
+        self.cache = CachingStorageManager(
+            storage_manager.storage_manager, tempfile.mkdtemp(), 100000, 100000
+        )
+        storage_manager.storage_manager = self.cache
+
+    def download(self, headers=None):
+        return self.app.get(
+            "/download-with-ticket/test.bin?ticket_id=ticket", headers=headers or {}
+        )
+
+    def test_download_is_served_from_cache(self):
+        self.assertEqual(self.data, self.download().data)
+        s3.Bucket(bucket).objects.all().delete()
+
+        response = self.download()
+
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(self.data, response.data)
+        self.assertEqual(1, self.cache.get_cache_stats()["hits"])
+        self.assertEqual(1, self.cache.get_cache_stats()["misses"])
+
+    def test_concurrent_hits_are_all_counted(self):
+        self.assertEqual(self.data, self.download().data)
+
+        def download(_):
+            file_object = self.cache.download_file("test.bin", ticket=ticket)
+            file_object["stream"].close()
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            list(executor.map(download, range(200)))
+
+        self.assertEqual(200, self.cache.get_cache_stats()["hits"])
+        self.assertEqual(1, self.cache.get_cache_stats()["misses"])
+
+    def test_exif_rewrite_invalidates_the_cached_file(self):
+        self.assertEqual(self.data, self.download().data)
+        rewritten = b"rewritten"
+
+        def add_exif_data(mediafile, headers=None):
+            s3.Bucket(bucket).put_object(Key="test.bin", Body=rewritten)
+
+        with patch.object(
+            self.cache.storage_manager, "add_exif_data", side_effect=add_exif_data
+        ):
+            self.cache.add_exif_data({"filename": "test.bin"})
+
+        self.assertEqual(rewritten, self.download().data)
+
+    def test_range_is_served_from_cache(self):
+        self.download().get_data()
+
+        response = self.download({"Range": "bytes=-100"})
+
+        self.assertEqual(206, response.status_code)
+        self.assertEqual("bytes 9900-9999/10000", response.headers["Content-Range"])
+        self.assertEqual(self.data[-100:], response.data)
@@ -0,0 +1,68 @@
+import hashlib
+
+from tests.base_case import BaseCase, bucket, s3
+from unittest.mock import patch, MagicMock
+
+md5sum = hashlib.md5(b"content").hexdigest()
+ticket = {"bucket": bucket, "location": "test.bin"}
+
+
+@patch(
+    "resources.base_resource.BaseResource._get_ticket",
+    new=MagicMock(return_value=ticket),
+)
+class DownloadConditionalTest(BaseCase):
+    def setUp(self):
+        super().setUp()
+        s3.Bucket(bucket).put_object(Key="test.bin", Body=b"content")
+
+    def download(self, headers=None):
+        return self.app.get(
+            "/download-with-ticket/test.bin?ticket_id=ticket", headers=headers or {}
+        )
+
+    def test_download_has_validators(self):
+        response = self.download()
+
+        self.assertEqual(200, response.status_code)
+        self.assertIn("ETag", response.headers)
+        self.assertIn("Last-Modified", response.headers)
+        self.assertEqual("no-cache", response.headers["Cache-Control"])
+
+    def test_content_addressed_download_is_immutable(self):
+        s3.Bucket(bucket).put_object(Key=f"{md5sum}-test.bin", Body=b"content")
+
+        response = self.app.get(f"/download/{md5sum}-test.bin")
+
+        self.assertEqual(200, response.status_code)
+        self.assertIn("immutable", response.headers["Cache-Control"])
+
+    def test_content_addressed_image_is_not_immutable(self):
+        s3.Bucket(bucket).put_object(Key=f"{md5sum}-test.png", Body=b"content")
+
+        response = self.app.get(f"/download/{md5sum}-test.png")
+
+        self.assertEqual(200, response.status_code)
+        self.assertEqual("no-cache", response.headers["Cache-Control"])
+
+    def test_download_if_none_match(self):
+        etag = self.download().headers["ETag"]
+
+        response = self.download({"If-None-Match": etag})
+
+        self.assertEqual(304, response.status_code)
+        self.assertEqual(b"", response.data)
+        self.assertEqual(etag, response.headers["ETag"])
+
+    def test_download_if_none_match_changed(self):
+        response = self.download({"If-None-Match": '"outdated"'})
+
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(b"content", response.data)
+
+    def test_download_if_modified_since(self):
+        last_modified = self.download().headers["Last-Modified"]
+
+        response = self.download({"If-Modified-Since": last_modified})
+
+        self.assertEqual(304, response.status_code)
@@ -0,0 +1,89 @@
+import email
+import os
+
+from tests.base_case import BaseCase, bucket, s3
+from unittest.mock import patch, MagicMock
+
+ticket = {"bucket": bucket, "location": "test.bin"}
+
+
+@patch(
+    "resources.base_resource.BaseResource._get_ticket",
+    new=MagicMock(return_value=ticket),
+)
+class DownloadRangeTest(BaseCase):
+    def setUp(self):
+        super().setUp()
+        self.data = os.urandom(10000)
+        s3.Bucket(bucket).put_object(Key="test.bin", Body=self.data)
+
+    def download(self, byte_range):
+        return self.app.get(
+            "/download-with-ticket/test.bin?ticket_id=ticket",
+            headers={"Range": byte_range},
+        )
+
+    def test_download_range(self):
+        response = self.download("bytes=10-19")
+
+        self.assertEqual(206, response.status_code)
+        self.assertEqual("bytes 10-19/10000", response.headers["Content-Range"])
+        self.assertEqual(self.data[10:20], response.data)
+
+    def test_download_open_ended_range(self):
+        response = self.download("bytes=9000-")
+
+        self.assertEqual(206, response.status_code)
+        self.assertEqual("bytes 9000-9999/10000", response.headers["Content-Range"])
+        self.assertEqual(self.data[9000:], response.data)
+
+    def test_download_suffix_range(self):
+        response = self.download("bytes=-500")
+
+        self.assertEqual(206, response.status_code)
+        self.assertEqual("bytes 9500-9999/10000", response.headers["Content-Range"])
+        self.assertEqual(self.data[-500:], response.data)
+
+    def test_download_unsatisfiable_range(self):
+        response = self.download("bytes=20000-")
+
+        self.assertEqual(416, response.status_code)
+        self.assertEqual("bytes */10000", response.headers["Content-Range"])
+
+    def get_parts(self, response):
+        message = email.message_from_bytes(
+            f"Content-Type: {response.headers['Content-Type']}\r\n\r\n".encode()
+            + response.data
+        )
+        return [part.get_payload(decode=True) for part in message.get_payload()]
+
+    def test_download_multiple_ranges(self):
+        response = self.download("bytes=0-9,100-109,-5")
+
+        self.assertEqual(206, response.status_code)
+        self.assertEqual(len(response.data), int(response.headers["Content-Length"]))
+        self.assertEqual(
+            [self.data[:10], self.data[100:110], self.data[-5:]],
+            self.get_parts(response),
+        )
+
+    def test_download_adjacent_ranges_are_merged(self):
+        response = self.download("bytes=0-9,10-19,100-109")
+
+        self.assertEqual(206, response.status_code)
+        self.assertEqual([self.data[:20], self.data[100:110]], self.get_parts(response))
+
+    def test_download_overlapping_ranges_are_merged(self):
+        response = self.download("bytes=0-9,-9995")
+
+        self.assertEqual(206, response.status_code)
+        self.assertEqual("bytes 0-9999/10000", response.headers["Content-Range"])
+        self.assertEqual(self.data, response.data)
+
+    @patch.dict(os.environ, {"MAX_BYTE_RANGES": "2"})
+    def test_download_too_many_ranges(self):
+        response = self.download("bytes=0-0,10-10,20-20")
+
+        self.assertEqual(200, response.status_code)
+        self.assertNotIn("Content-Range", response.headers)
+        self.assertEqual(self.data, response.data)
@@ -0,0 +1,100 @@
+import struct
+
+from tests.base_case import BaseCase, bucket, s3
+from io import BytesIO
+from PIL import Image
+from storage.storagemanager import StorageManager
+from unittest.mock import patch
+
+mediafile = {
+    "_id": "mediafile",
+    "filename": "test",
+    "identifiers": ["mediafile"],
+    "metadata": [
+        {"key": "source", "value": "archive"},
+        {"key": "rights", "value": "CC0"},
+        {"key": "photographer", "value": "John Doe"},
+    ],
+}
+
+
+@patch("requests.Session.patch")
+class ExifTest(BaseCase):
+    def setUp(self):
+        super().setUp()
+        self.storage = StorageManager().get_storage_engine()
+
+    def add_exif_data(self, image_format, mimetype, **kwargs):
+        original = self.create_image(image_format, **kwargs)
+        body = self.rewrite(original, mimetype)
+        return original, body, Image.open(BytesIO(body))
+
+    def create_image(self, image_format, **kwargs):
+        image = Image.new("RGB", size=(64, 64), color=(155, 0, 0))
+        file = BytesIO()
+        image.save(file, image_format, **kwargs)
+        return file.getvalue()
+
+    def rewrite(self, data, mimetype):
+        s3.Bucket(bucket).put_object(Key="test", Body=data)
+        self.storage.add_exif_data(mediafile | {"mimetype": mimetype})
+        return s3.Object(bucket, "test").get()["Body"].read()
+
+    def assert_exif(self, image):
+        exif = image.getexif()
+        self.assertEqual("photographer: John Doe, source: archive", exif[0x013B])
+        self.assertEqual("license: CC0", exif[0x8298])
+
+    def test_jpeg_is_rewritten_without_reencoding(self, session_patch):
+        exif = Image.Exif()
+        exif[0x010F] = "Camera"
+        original, body, image = self.add_exif_data(
+            "JPEG", "image/jpeg", exif=exif.tobytes()
+        )
+
+        self.assert_exif(image)
+        self.assertEqual("Camera", image.getexif()[0x010F])
+        self.assertEqual(
+            original[original.index(b"\xff\xdb") :], body[body.index(b"\xff\xdb") :]
+        )
+        session_patch.assert_called_once()
+
+    def test_jpeg_exif_after_other_app_segments_is_replaced(self, session_patch):
+        exif = Image.Exif()
+        exif[0x010F] = "Camera"
+        original = self.create_image("JPEG", exif=exif.tobytes())
+        app1 = original.index(b"\xff\xe1")
+        icc = b"ICC_PROFILE\x00\x01\x01"
+        app2 = b"\xff\xe2" + struct.pack(">H", len(icc) + 2) + icc
+
+        body = self.rewrite(original[:app1] + app2 + original[app1:], "image/jpeg")
+
+        image = Image.open(BytesIO(body))
+        self.assert_exif(image)
+        self.assertEqual("Camera", image.getexif()[0x010F])
+        self.assertEqual(1, body.count(b"Exif\x00\x00"))
+        self.assertIn(app2, body)
+
+    def test_png_is_rewritten_without_reencoding(self, session_patch):
+        original, body, image = self.add_exif_data("PNG", "image/png")
+
+        image.load()
+        self.assert_exif(image)
+        self.assertEqual(
+            original[original.index(b"IDAT") :], body[body.index(b"IDAT") :]
+        )
+
+    def test_tiff_is_rewritten_without_reencoding(self, session_patch):
+        original, body, image = self.add_exif_data("TIFF", "image/tiff")
+
+        self.assert_exif(image)
+        self.assertEqual(original[8:], body[8 : len(original)])
+        self.assertEqual((155, 0, 0), image.getpixel((10, 10)))
+        exif = session_patch.call_args.kwargs["json"]["exif"]
+        self.assertIn("256: 64", exif)
+        self.assertIn("315: 'photographer: John Doe, source: archive'", exif)
+
+    def test_unsupported_format_falls_back_to_reencoding(self, session_patch):
+        original, body, image = self.add_exif_data("WEBP", "image/webp")
+
+        self.assert_exif(image)
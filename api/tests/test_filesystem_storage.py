@@ -0,0 +1,113 @@
+import hashlib
+import os
+import tempfile
+
+from app import app
+from tests.base_case import BaseCase, bucket
+from io import BytesIO
+from storage.exceptions import UnsupportedOperationException
+from storage.filesystem import FilesystemStorageManager
+from storage.storagemanager import StorageManager
+from unittest.mock import patch, MagicMock
+
+ticket = {"bucket": bucket, "location": "test.bin"}
+
+
+@patch(
+    "resources.base_resource.BaseResource._get_ticket",
+    new=MagicMock(return_value=ticket),
+)
+@patch("storage.engine.StorageEngine._get_mediafile", new=MagicMock())
+class FilesystemStorageTest(BaseCase):
+    def setUp(self):
+        super().setUp()
+        self.data = os.urandom(10000)
+        self.md5sum = hashlib.md5(self.data).hexdigest()
+        self.root = tempfile.mkdtemp()
+        storage_manager = StorageManager()
+        self.addCleanup(
+            setattr, storage_manager, "storage_manager", storage_manager.storage_manager
+        )
+        with patch.dict(os.environ, {"FILESYSTEM_STORAGE_ROOT": self.root}):
+            self.storage = FilesystemStorageManager()
+        storage_manager.storage_manager = self.storage
+
+    def upload(self):
+        with patch("storage.engine.StorageEngine._get_mediafile", return_value=None):
+            self.storage.upload_file(BytesIO(self.data), None, "test.bin", ticket)
+
+    def test_upload_is_stored_in_sharded_directory(self):
+        self.upload()
+
+        path = os.path.join(
+            self.root,
+            bucket,
+            self.md5sum[:2],
+            self.md5sum[2:4],
+            f"{self.md5sum}-test.bin",
+        )
+        with open(path, "rb") as file:
+            self.assertEqual(self.data, file.read())
+        self.assertEqual([], os.listdir(self.storage.staging_dir))
+        self.assertEqual(
+            {self.md5sum: f"{self.md5sum}-test.bin"},
+            self.storage.find_existing_files([self.md5sum]),
+        )
+
+    def test_download_file(self):
+        self.upload()
+        ticket["location"] = f"{self.md5sum}-test.bin"
+        self.addCleanup(ticket.update, {"location": "test.bin"})
+
+        response = self.app.get("/download-with-ticket/test.bin?ticket_id=ticket")
+
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(self.data, response.data)
+        self.assertIn("ETag", response.headers)
+
+    def test_download_range(self):
+        self.upload()
+        ticket["location"] = f"{self.md5sum}-test.bin"
+        self.addCleanup(ticket.update, {"location": "test.bin"})
+
+        response = self.app.get(
+            "/download-with-ticket/test.bin?ticket_id=ticket",
+            headers={"Range": "bytes=100-199"},
+        )
+
+        self.assertEqual(206, response.status_code)
+        self.assertEqual("bytes 100-199/10000", response.headers["Content-Range"])
+        self.assertEqual(self.data[100:200], response.data)
+
+    def test_download_missing_file(self):
+        response = self.app.get("/download-with-ticket/test.bin?ticket_id=ticket")
+
+        self.assertEqual(404, response.status_code)
+
+    def test_delete_files(self):
+        self.upload()
+        key = f"{self.md5sum}-test.bin"
+
+        result = self.storage.delete_files([key])
+
+        self.assertEqual({"deleted": [key], "errors": []}, result)
+        self.assertEqual({}, self.storage.find_existing_files([self.md5sum]))
+
+    def test_presigned_urls_are_refused_at_startup(self):
+        environment = {"FILESYSTEM_STORAGE_ROOT": self.root, "PRESIGNED_URLS": "true"}
+
+        with patch.dict(os.environ, environment):
+            self.assertRaises(UnsupportedOperationException, FilesystemStorageManager)
+
+    def test_unsupported_upload_session_returns_not_implemented(self):
+        response = self.app.post(
+            "/upload-with-ticket/sessions?ticket_id=ticket&filename=test.bin"
+        )
+
+        self.assertEqual(501, response.status_code)
+
+    def test_unsupported_command_is_reported(self):
+        result = app.test_cli_runner().invoke(args=["rebuild-dedup-index"])
+
+        self.assertEqual(1, result.exit_code)
+        self.assertIn("not supported by the FilesystemStorageManager", result.output)
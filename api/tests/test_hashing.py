@@ -0,0 +1,52 @@
+import blake3
+import hashlib
+import os
+
+from tests.base_case import BaseCase, bucket
+from io import BytesIO
+from storage.hashing import ContentHasher, get_digest_algorithms
+from storage.engine import get_storage_engine_class
+from unittest.mock import patch, MagicMock
+
+ticket = {"bucket": bucket, "location": "test.bin"}
+
+
+class HashingTest(BaseCase):
+    def test_digests_match_for_any_chunking(self):
+        data = os.urandom(300000)
+        expected = {
+            "md5": hashlib.md5(data).hexdigest(),
+            "blake3": blake3.blake3(data).hexdigest(),
+        }
+        for chunk_size in [1000, 65536, 100000, 300000]:
+            for chunk_type in [bytes, bytearray]:
+                hasher = ContentHasher(["md5", "blake3"], 65536)
+                for start in range(0, len(data), chunk_size):
+                    hasher.update(chunk_type(data[start : start + chunk_size]))
+                self.assertEqual(expected, hasher.get_digests())
+
+    def test_md5_is_always_calculated(self):
+        self.assertEqual(["md5", "blake3"], get_digest_algorithms(["blake3"]))
+        with self.assertRaises(Exception):
+            get_digest_algorithms(["crc32"])
+
+    @patch.dict(os.environ, {"CONTENT_DIGESTS": "md5,blake3"})
+    def test_upload_stores_all_digests(self):
+        data = os.urandom(5000)
+        mediafile = {"_id": "mediafile", "filename": "test.bin", "identifiers": []}
+        storage = get_storage_engine_class("s3")()
+        storage.session = MagicMock()
+        storage.storage_api_url = "http://storage/"
+
+        with patch.object(
+            storage, "_get_mediafile", return_value=mediafile
+        ), patch.object(storage, "_StorageEngine__signal_file_uploaded"):
+            storage.upload_file(BytesIO(data), "mediafile", "test.bin", ticket)
+
+        self.assertEqual(
+            {
+                "md5": hashlib.md5(data).hexdigest(),
+                "blake3": blake3.blake3(data).hexdigest(),
+            },
+            mediafile["checksums"],
+        )
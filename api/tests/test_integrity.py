@@ -0,0 +1,87 @@
+import hashlib
+import os
+
+from tests.base_case import BaseCase, bucket, s3
+from io import BytesIO
+from storage.engine import get_storage_engine_class
+from storage.exceptions import IntegrityException
+from unittest.mock import patch, MagicMock
+
+ticket = {"bucket": bucket, "location": "test.bin"}
+
+
+class IntegrityTest(BaseCase):
+    def setUp(self):
+        super().setUp()
+        self.storage = get_storage_engine_class("s3")()
+        self.storage.session = MagicMock()
+        self.storage.storage_api_url = "http://storage/"
+        self.storage.upload_part_size = 5 * 1024 * 1024
+
+    def __upload(self, data):
+        mediafile = {"_id": "mediafile", "filename": "test.bin", "identifiers": []}
+        with patch.object(
+            self.storage, "_get_mediafile", return_value=mediafile
+        ), patch.object(self.storage, "_StorageEngine__signal_file_uploaded"):
+            self.storage.upload_file(BytesIO(data), "mediafile", "test.bin", ticket)
+        return mediafile
+
+    def test_upload_records_verified_etag(self):
+        for data in [os.urandom(5000), os.urandom(6 * 1024 * 1024)]:
+            md5sum = hashlib.md5(data).hexdigest()
+
+            mediafile = self.__upload(data)
+
+            self.assertEqual(md5sum, mediafile["etag"])
+            file_info = s3.Object(bucket, f"{md5sum}-test.bin")
+            self.assertEqual(f'"{md5sum}"', file_info.e_tag)
+            self.assertEqual({"md5": md5sum}, file_info.metadata)
+
+    def test_upload_fails_on_etag_mismatch(self):
+        data = os.urandom(5000)
+        copy_object = self.storage.client.copy_object
+
+        def corrupting_copy_object(**kwargs):
+            copy_object(**kwargs)
+            return {"CopyObjectResult": {"ETag": f'"{"0" * 32}"'}}
+
+        with patch.object(
+            self.storage.client, "copy_object", side_effect=corrupting_copy_object
+        ):
+            with self.assertRaises(IntegrityException):
+                self.__upload(data)
+
+        self.assertEqual([], list(s3.Bucket(bucket).objects.all()))
+
+    def test_scrub(self):
+        data = os.urandom(5000)
+        md5sum = hashlib.md5(data).hexdigest()
+        rewritten = os.urandom(5000)
+        objects = s3.Bucket(bucket)
+        objects.put_object(Key=f"{md5sum}-valid.bin", Body=data)
+        objects.put_object(Key=f"{md5sum}-corrupt.bin", Body=rewritten)
+        objects.put_object(
+            Key=f"{md5sum}-rewritten.bin",
+            Body=rewritten,
+            Metadata={"md5": hashlib.md5(rewritten).hexdigest()},
+        )
+        objects.put_object(Key="nested/unknown.bin", Body=data)
+        objects.put_object(Key="staging/upload.bin", Body=data)
+
+        for prefixes in [[""], [md5sum[0], "nested/"]]:
+            result = self.storage.scrub(prefixes=prefixes, rate=0)
+
+            self.assertEqual(4, result["checked"])
+            self.assertEqual(2, result["verified"])
+            self.assertEqual(1, result["unverifiable"])
+            self.assertEqual(
+                [
+                    {
+                        "key": f"{md5sum}-corrupt.bin",
+                        "md5": md5sum,
+                        "etag": hashlib.md5(rewritten).hexdigest(),
+                    }
+                ],
+                result["mismatched"],
+            )
+            self.assertEqual([], result["errors"])
@@ -0,0 +1,49 @@
+from tests.base_case import BaseCase
+from io import BytesIO
+from PIL import Image, TiffImagePlugin
+from storage.storagemanager import StorageManager
+
+
+class TechnicalMetadataTest(BaseCase):
+    def setUp(self):
+        super().setUp()
+        self.storage = StorageManager().get_storage_engine()
+        self.exif = Image.Exif()
+        self.exif[0x010F] = "Camera"
+        self.exif[0x011A] = TiffImagePlugin.IFDRational(300, 1)
+        self.exif[0x0132] = "2024:01:02 03:04:05"
+
+    def create_image(self, image_format, mode="RGB", **kwargs):
+        file = BytesIO()
+        image = Image.new(mode, size=(64, 48))
+        image.save(file, image_format, **kwargs)
+        file.seek(0)
+        return file
+
+    def assert_metadata(self, file, color_space):
+        metadata = self.storage._get_technical_metadata(file)
+
+        expected = self.storage._get_exif_data(file) + [
+            {"key": "width", "value": 64},
+            {"key": "height", "value": 48},
+            {"key": "color_space", "value": color_space},
+        ]
+        self.assertEqual(expected, metadata)
+
+    def test_jpeg_metadata(self):
+        file = self.create_image("JPEG", exif=self.exif.tobytes())
+
+        self.assert_metadata(file, "YCbCr")
+
+    def test_png_metadata(self):
+        self.assert_metadata(
+            self.create_image("PNG", "RGBA", exif=self.exif.tobytes()), "RGB"
+        )
+
+    def test_tiff_metadata(self):
+        self.assert_metadata(self.create_image("TIFF", "L"), "Grayscale")
+
+    def test_unsupported_format_falls_back_to_pil(self):
+        file = BytesIO(self.create_image("GIF").read())
+
+        self.assertEqual([], self.storage._get_technical_metadata(file))
@@ -0,0 +1,75 @@
+import os
+
+from tests.base_case import BaseCase, bucket, s3
+from io import BytesIO
+from prometheus_client import REGISTRY
+from storage.storagemanager import StorageManager
+from unittest.mock import patch, MagicMock
+
+ticket = {"bucket": bucket, "location": "test.bin"}
+
+
+def get_sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+@patch(
+    "resources.base_resource.BaseResource._get_ticket",
+    new=MagicMock(return_value=ticket),
+)
+class MetricsTest(BaseCase):
+    def test_download_is_measured(self):
+        data = os.urandom(5000)
+        s3.Bucket(bucket).put_object(Key="test.bin", Body=data)
+        labels = {"method": "GET", "endpoint": "downloadwithticket"}
+        sent = get_sample("storage_http_sent_bytes_total", **labels)
+        requests = get_sample(
+            "storage_http_request_duration_seconds_count", status="200", **labels
+        )
+        get_objects = get_sample(
+            "storage_s3_requests_total", operation="GetObject", status="200"
+        )
+
+        response = self.app.get("/download-with-ticket/test.bin?ticket_id=ticket")
+
+        self.assertEqual(data, response.data)
+        self.assertEqual(
+            sent + 5000, get_sample("storage_http_sent_bytes_total", **labels)
+        )
+        self.assertEqual(
+            requests + 1,
+            get_sample(
+                "storage_http_request_duration_seconds_count", status="200", **labels
+            ),
+        )
+        self.assertEqual(
+            get_objects + 1,
+            get_sample(
+                "storage_s3_requests_total", operation="GetObject", status="200"
+            ),
+        )
+
+    def test_upload_stages_are_measured(self):
+        stages = ["store", "md5", "mimetype", "duplicate_check", "promote"]
+        counts = [
+            get_sample("storage_stage_duration_seconds_count", stage=stage)
+            for stage in stages
+        ]
+
+        with patch("storage.engine.StorageEngine._get_mediafile", return_value=None):
+            StorageManager().get_storage_engine().upload_file(
+                BytesIO(os.urandom(5000)), None, "test.bin", ticket
+            )
+
+        for stage, count in zip(stages, counts):
+            self.assertEqual(
+                count + 1,
+                get_sample("storage_stage_duration_seconds_count", stage=stage),
+            )
+
+    def test_metrics_endpoint(self):
+        response = self.app.get("/metrics")
+
+        self.assertEqual(200, response.status_code)
+        self.assertIn(b"storage_http_request_duration_seconds", response.data)
+        self.assertIn(b"storage_active_transfers", response.data)
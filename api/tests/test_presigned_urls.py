@@ -0,0 +1,78 @@
+import hashlib
+import os
+import requests
+
+from tests.base_case import BaseCase, bucket, s3
+from unittest.mock import patch, MagicMock
+
+ticket = {"_id": "ticket", "bucket": bucket, "location": "test.bin"}
+
+
+@patch.dict(os.environ, {"PRESIGNED_URLS": "true"})
+@patch("app.rabbit", new=MagicMock())
+@patch("resources.base_resource.start_job", new=MagicMock(return_value="job"))
+@patch("resources.base_resource.finish_job", new=MagicMock())
+@patch("resources.base_resource.fail_job", new=MagicMock())
+@patch(
+    "resources.base_resource.BaseResource._get_ticket",
+    new=MagicMock(return_value=ticket),
+)
+@patch(
+    "storage.s3store.S3StorageManager._get_mediafile", new=MagicMock(return_value=None)
+)
+class PresignedUrlTest(BaseCase):
+    def create_session(self):
+        response = self.app.post("/upload-with-ticket/sessions?ticket_id=ticket")
+        self.assertEqual(201, response.status_code)
+        return response.json["id"]
+
+    def get_part_url(self, session_id, part_number):
+        return self.app.get(
+            f"/upload-with-ticket/sessions/{session_id}/parts/{part_number}?ticket_id=ticket"
+        )
+
+    def test_download_redirects_to_presigned_url(self):
+        data = os.urandom(1000)
+        s3.Bucket(bucket).put_object(Key="test.bin", Body=data)
+
+        response = self.app.get("/download-with-ticket/test.bin?ticket_id=ticket")
+
+        self.assertEqual(302, response.status_code)
+        self.assertEqual(data, requests.get(response.headers["Location"]).content)
+
+    def test_upload_part_to_presigned_url(self):
+        data = os.urandom(1000)
+        session_id = self.create_session()
+
+        response = self.get_part_url(session_id, 1)
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(1, response.json["part_number"])
+        self.assertEqual(200, requests.put(response.json["url"], data=data).status_code)
+        response = self.app.post(
+            f"/upload-with-ticket/sessions/{session_id}?ticket_id=ticket"
+        )
+
+        self.assertEqual(201, response.status_code)
+        self.assertEqual(
+            [f"{hashlib.md5(data).hexdigest()}-test.bin"],
+            [obj.key for obj in s3.Bucket(bucket).objects.all()],
+        )
+
+    def test_invalid_part_number(self):
+        session_id = self.create_session()
+
+        self.assertEqual(400, self.get_part_url(session_id, 10001).status_code)
+
+    def test_unknown_session(self):
+        self.assertEqual(404, self.get_part_url("unknown", 1).status_code)
+
+    @patch.dict(os.environ, {"PRESIGNED_URLS": "false"})
+    def test_presigned_urls_disabled(self):
+        s3.Bucket(bucket).put_object(Key="test.bin", Body=b"data")
+        session_id = self.create_session()
+
+        response = self.app.get("/download-with-ticket/test.bin?ticket_id=ticket")
+
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(b"data", response.data)
+        self.assertEqual(404, self.get_part_url(session_id, 1).status_code)
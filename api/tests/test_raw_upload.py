@@ -0,0 +1,68 @@
+import hashlib
+import io
+import os
+
+from app import app
+from flask import request
+from storage.multipart import read_part
+from tests.base_case import BaseCase, bucket, s3
+from unittest.mock import patch, MagicMock
+
+
+@patch("app.rabbit", new=MagicMock())
+@patch("resources.base_resource.start_job", new=MagicMock(return_value="job"))
+@patch("resources.base_resource.finish_job", new=MagicMock())
+@patch("resources.base_resource.fail_job", new=MagicMock())
+@patch(
+    "storage.s3store.S3StorageManager._get_mediafile", new=MagicMock(return_value=None)
+)
+class RawUploadTest(BaseCase):
+    def upload(self, data, **kwargs):
+        return self.app.post(
+            "/upload/test.bin?id=mediafile",
+            data=data,
+            headers={"content-type": "application/octet-stream"},
+            **kwargs,
+        )
+
+    def stored(self, data):
+        key = f"{hashlib.md5(data).hexdigest()}-test.bin"
+        return s3.Object(bucket, key).get()["Body"].read()
+
+    def test_body_is_streamed(self):
+        data = os.urandom(5000)
+
+        response = self.upload(data)
+
+        self.assertEqual(201, response.status_code)
+        self.assertEqual(data, self.stored(data))
+
+    def test_body_already_read_before_the_resource(self):
+        def read_body():
+            request.get_data()
+
+        data = os.urandom(5000)
+        app.before_request_funcs.setdefault(None, []).insert(0, read_body)
+        self.addCleanup(app.before_request_funcs[None].remove, read_body)
+
+        response = self.upload(data)
+
+        self.assertEqual(201, response.status_code)
+        self.assertEqual(data, self.stored(data))
+
+    def test_large_body_is_read_incrementally(self):
+        data = os.urandom(12 * 1024 * 1024)
+        body = io.BytesIO(data)
+        positions = []
+
+        def record_position(stream, part_size):
+            positions.append(body.tell())
+            return read_part(stream, part_size)
+
+        with patch("storage.multipart.read_part", side_effect=record_position):
+            response = self.upload(None, input_stream=body)
+
+        self.assertEqual(201, response.status_code)
+        self.assertEqual(data, self.stored(data))
+        self.assertEqual(0, positions[0])
+        self.assertLess(positions[1], len(data))
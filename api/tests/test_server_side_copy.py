@@ -0,0 +1,107 @@
+import hashlib
+import os
+
+from tests.base_case import BaseCase, bucket, s3
+from unittest.mock import patch, MagicMock
+
+ticket = {"_id": "ticket", "bucket": bucket, "location": "test.bin"}
+source_bucket = f"{bucket}-source"
+
+
+class UnreadableStream:
+    def read(self, *args):
+        raise AssertionError("The upload body must not be read")
+
+
+@patch("app.rabbit", new=MagicMock())
+@patch("resources.base_resource.start_job", new=MagicMock(return_value="job"))
+@patch("resources.base_resource.finish_job", new=MagicMock())
+@patch("resources.base_resource.fail_job", new=MagicMock())
+@patch(
+    "resources.base_resource.BaseResource._get_ticket",
+    new=MagicMock(return_value=ticket),
+)
+@patch(
+    "storage.s3store.S3StorageManager._get_mediafile", new=MagicMock(return_value=None)
+)
+class ServerSideCopyTest(BaseCase):
+    def setUp(self):
+        super().setUp()
+        s3.create_bucket(Bucket=source_bucket)
+        self.data = os.urandom(5000)
+        self.md5sum = hashlib.md5(self.data).hexdigest()
+        self.source_key = f"{self.md5sum}-source.bin"
+        s3.Bucket(bucket).put_object(
+            Key=self.source_key, Body=self.data, Metadata={"md5": self.md5sum}
+        )
+
+    def tearDown(self):
+        s3.Bucket(source_bucket).objects.all().delete()
+        s3.Bucket(source_bucket).delete()
+        super().tearDown()
+
+    def get_keys(self):
+        return sorted(obj.key for obj in s3.Bucket(bucket).objects.all())
+
+    def upload(self, data, md5sum):
+        return self.app.post(
+            f"/upload-with-ticket/test.bin?ticket_id=ticket&md5={md5sum}",
+            data=data,
+            headers={"content-type": "application/octet-stream"},
+        )
+
+    def test_existing_file_is_copied_without_reading_the_body(self):
+        with patch(
+            "resources.base_resource.BaseResource._BaseResource__get_request_stream",
+            return_value=UnreadableStream(),
+        ):
+            response = self.upload(b"", self.md5sum.upper())
+
+        self.assertEqual(201, response.status_code)
+        stored = s3.Object(bucket, f"{self.md5sum}-test.bin")
+        self.assertEqual(self.data, stored.get()["Body"].read())
+        self.assertEqual({"md5": self.md5sum}, stored.metadata)
+
+    def test_new_file_is_uploaded(self):
+        data = os.urandom(5000)
+
+        response = self.upload(data, hashlib.md5(data).hexdigest())
+
+        self.assertEqual(201, response.status_code)
+        self.assertEqual(
+            sorted([f"{hashlib.md5(data).hexdigest()}-test.bin", self.source_key]),
+            self.get_keys(),
+        )
+
+    def test_files_in_other_buckets_are_not_copied(self):
+        data = os.urandom(5000)
+        md5sum = hashlib.md5(data).hexdigest()
+        s3.Bucket(source_bucket).put_object(Key=f"{md5sum}-source.bin", Body=data)
+
+        response = self.upload(b"", md5sum)
+
+        self.assertEqual(400, response.status_code)
+        self.assertEqual([self.source_key], self.get_keys())
+
+    def test_rewritten_files_are_not_copied(self):
+        s3.Bucket(bucket).put_object(
+            Key=self.source_key, Body=b"rewritten", Metadata={"md5": "0" * 32}
+        )
+
+        response = self.upload(self.data, self.md5sum)
+
+        self.assertEqual(201, response.status_code)
+        stored = s3.Object(bucket, f"{self.md5sum}-test.bin")
+        self.assertEqual(self.data, stored.get()["Body"].read())
+
+    def test_content_must_match_md5(self):
+        response = self.upload(b"", hashlib.md5(b"missing").hexdigest())
+
+        self.assertEqual(400, response.status_code)
+        self.assertEqual([self.source_key], self.get_keys())
+
+    def test_invalid_md5(self):
+        response = self.upload(self.data, self.md5sum[:8])
+
+        self.assertEqual(400, response.status_code)
+        self.assertEqual([self.source_key], self.get_keys())
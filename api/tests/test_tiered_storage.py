@@ -0,0 +1,103 @@
+import hashlib
+import os
+import tempfile
+
+from tests.base_case import BaseCase, bucket, s3
+from io import BytesIO
+from storage.tiered import TieredStorageManager
+from unittest.mock import patch
+
+
+class TieredStorageTest(BaseCase):
+    def setUp(self):
+        super().setUp()
+        self.data = os.urandom(10000)
+        self.md5sum = hashlib.md5(self.data).hexdigest()
+        self.key = f"{self.md5sum}-test.bin"
+        self.root = tempfile.mkdtemp()
+        self.storage = self.create_storage()
+
+    def create_storage(self):
+        with patch.dict(
+            os.environ,
+            {
+                "FILESYSTEM_STORAGE_ROOT": self.root,
+                "TIERED_LOCAL_SIZE": "15000",
+                "TIERED_REPLICATION_WORKER": "false",
+            },
+        ):
+            return TieredStorageManager()
+
+    def upload(self, data=None, name="test.bin"):
+        with patch("storage.engine.StorageEngine._get_mediafile", return_value=None):
+            self.storage.upload_file(BytesIO(data or self.data), None, name, None)
+
+    def get_remote_keys(self):
+        return [item.key for item in s3.Bucket(bucket).objects.all()]
+
+    def test_upload_is_served_locally_before_replication(self):
+        self.upload()
+
+        self.assertEqual([], self.get_remote_keys())
+        self.assertEqual(1, self.storage.get_replication_stats()["pending"])
+        self.assertEqual(
+            self.data, self.storage.download_file(self.key)["stream"].read()
+        )
+        self.assertEqual(
+            {self.md5sum: self.key}, self.storage.find_existing_files([self.md5sum])
+        )
+
+    def test_replicate_pending(self):
+        self.upload()
+
+        self.storage.replicate_pending()
+
+        self.assertEqual([self.key], self.get_remote_keys())
+        self.assertEqual(0, self.storage.get_replication_stats()["pending"])
+        self.assertEqual(1, self.storage.get_replication_stats()["replicated"])
+
+    def test_failed_replication_is_retried(self):
+        self.upload()
+
+        with patch("storage.tiered.stream_to_object", side_effect=Exception("down")):
+            self.storage.replicate_pending()
+        self.assertEqual(1, self.storage.get_replication_stats()["pending"])
+        self.storage.replicate_pending()
+
+        self.assertEqual([self.key], self.get_remote_keys())
+        self.assertEqual(0, self.storage.get_replication_stats()["pending"])
+
+    def test_pending_objects_are_not_demoted(self):
+        data = os.urandom(10000)
+        self.upload()
+        self.storage.replicate_pending()
+        self.upload(data, "other.bin")
+        with patch("storage.tiered.stream_to_object", side_effect=Exception("down")):
+            self.storage.replicate_pending()
+
+        other_key = f"{hashlib.md5(data).hexdigest()}-other.bin"
+        self.assertEqual(1, self.storage.get_replication_stats()["demoted"])
+        self.assertEqual(data, self.storage.download_file(other_key)["stream"].read())
+        self.assertEqual(
+            self.data, self.storage.download_file(self.key)["stream"].read()
+        )
+
+    def test_uploads_of_other_workers_are_demoted(self):
+        replication_worker = self.create_storage()
+        self.upload()
+        self.upload(os.urandom(10000), "other.bin")
+
+        replication_worker.replicate_pending()
+
+        self.assertEqual(1, replication_worker.get_replication_stats()["demoted"])
+        self.assertEqual(10000, self.storage.get_replication_stats()["size"])
+
+    def test_delete_files_removes_both_tiers(self):
+        self.upload()
+        self.storage.replicate_pending()
+
+        result = self.storage.delete_files([self.key])
+
+        self.assertEqual({"deleted": [self.key], "errors": []}, result)
+        self.assertEqual([], self.get_remote_keys())
+        self.assertEqual({}, self.storage.find_existing_files([self.md5sum]))
@@ -0,0 +1,45 @@
+import os
+
+from tests.base_case import BaseCase, bucket, s3
+from unittest.mock import patch
+
+md5sum = "0123456789abcdef0123456789abcdef"
+other_md5sum = "fedcba9876543210fedcba9876543210"
+
+
+class UniqueMultipleTest(BaseCase):
+    def setUp(self):
+        super().setUp()
+        s3.Bucket(bucket).put_object(Key=f"{md5sum}-test.bin", Body=b"data")
+
+    def test_json_md5sums(self):
+        response = self.app.post("/unique", json=[md5sum, other_md5sum, md5sum])
+
+        self.assertEqual(200, response.status_code)
+        self.assertEqual({md5sum: f"{md5sum}-test.bin"}, response.json)
+
+    def test_plain_text_md5sums(self):
+        response = self.app.post(
+            "/unique",
+            data=f"{md5sum.upper()}\n\n{other_md5sum}\n",
+            headers={"content-type": "text/plain"},
+        )
+
+        self.assertEqual(200, response.status_code)
+        self.assertEqual({md5sum: f"{md5sum}-test.bin"}, response.json)
+
+    def test_invalid_input(self):
+        response = self.app.post("/unique", json={"md5sum": md5sum})
+
+        self.assertEqual(405, response.status_code)
+
+    def test_md5sum_prefix_is_rejected(self):
+        response = self.app.post("/unique", json=[md5sum[:1]])
+
+        self.assertEqual(405, response.status_code)
+
+    @patch.dict(os.environ, {"UNIQUE_CHECK_MAX_MD5SUMS": "2"})
+    def test_too_many_md5sums(self):
+        response = self.app.post("/unique", json=[md5sum, other_md5sum, "0" * 32])
+
+        self.assertEqual(405, response.status_code)
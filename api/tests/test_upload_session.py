@@ -0,0 +1,165 @@
+import hashlib
+import os
+
+from datetime import timedelta
+from tests.base_case import BaseCase, bucket, s3
+from storage.storagemanager import StorageManager
+from unittest.mock import patch, MagicMock
+
+ticket = {"_id": "ticket", "bucket": bucket, "location": "test.bin"}
+
+
+@patch("app.rabbit", new=MagicMock())
+@patch("resources.base_resource.start_job", new=MagicMock(return_value="job"))
+@patch("resources.base_resource.finish_job", new=MagicMock())
+@patch("resources.base_resource.fail_job", new=MagicMock())
+@patch(
+    "resources.base_resource.BaseResource._get_ticket",
+    new=MagicMock(return_value=ticket),
+)
+@patch(
+    "storage.s3store.S3StorageManager._get_mediafile", new=MagicMock(return_value=None)
+)
+class UploadSessionTest(BaseCase):
+    def create_session(self):
+        response = self.app.post("/upload-with-ticket/sessions?ticket_id=ticket")
+        self.assertEqual(201, response.status_code)
+        return response.json["id"]
+
+    def upload_part(self, session_id, part_number, data):
+        return self.app.put(
+            f"/upload-with-ticket/sessions/{session_id}/parts/{part_number}?ticket_id=ticket",
+            data=data,
+            headers={"content-type": "application/octet-stream"},
+        )
+
+    def complete_session(self, session_id, md5sum=None):
+        query = f"&md5={md5sum}" if md5sum else ""
+        return self.app.post(
+            f"/upload-with-ticket/sessions/{session_id}?ticket_id=ticket{query}"
+        )
+
+    def get_session(self, session_id):
+        return self.app.get(
+            f"/upload-with-ticket/sessions/{session_id}?ticket_id=ticket"
+        )
+
+    def upload_session(self):
+        data = os.urandom(6 * 1024 * 1024)
+        session_id = self.create_session()
+        self.upload_part(session_id, 1, data[:5242880])
+        self.upload_part(session_id, 2, data[5242880:])
+        return session_id, data
+
+    def test_upload_parts_out_of_order(self):
+        data = os.urandom(11 * 1024 * 1024)
+        session_id = self.create_session()
+
+        self.assertEqual(
+            200, self.upload_part(session_id, 2, data[5242880:]).status_code
+        )
+        self.assertEqual(
+            200, self.upload_part(session_id, 1, data[:5242880]).status_code
+        )
+        response = self.app.get(
+            f"/upload-with-ticket/sessions/{session_id}?ticket_id=ticket"
+        )
+        self.assertEqual(
+            [1, 2], [part["part_number"] for part in response.json["parts"]]
+        )
+
+        response = self.app.post(
+            f"/upload-with-ticket/sessions/{session_id}?ticket_id=ticket"
+        )
+
+        self.assertEqual(201, response.status_code)
+        self.assertEqual(
+            [f"{hashlib.md5(data).hexdigest()}-test.bin"],
+            [obj.key for obj in s3.Bucket(bucket).objects.all()],
+        )
+
+    def test_abort_session(self):
+        session_id = self.create_session()
+
+        response = self.app.delete(
+            f"/upload-with-ticket/sessions/{session_id}?ticket_id=ticket"
+        )
+
+        self.assertEqual(204, response.status_code)
+        self.assertEqual([], list(s3.Bucket(bucket).objects.all()))
+
+    def test_unknown_session(self):
+        response = self.app.get("/upload-with-ticket/sessions/unknown?ticket_id=ticket")
+
+        self.assertEqual(404, response.status_code)
+
+    def test_failed_completion_can_be_retried(self):
+        session_id, data = self.upload_session()
+
+        with patch(
+            "storage.engine.StorageEngine.check_file_exists",
+            side_effect=Exception("Collection API unavailable"),
+        ):
+            self.assertEqual(400, self.complete_session(session_id).status_code)
+        response = self.get_session(session_id)
+        self.assertEqual(200, response.status_code)
+        self.assertTrue(response.json["completed"])
+
+        self.assertEqual(201, self.complete_session(session_id).status_code)
+        self.assertEqual(
+            [f"{hashlib.md5(data).hexdigest()}-test.bin"],
+            [obj.key for obj in s3.Bucket(bucket).objects.all()],
+        )
+
+    def test_complete_with_md5(self):
+        session_id, data = self.upload_session()
+
+        response = self.complete_session(session_id, hashlib.md5(data).hexdigest())
+
+        self.assertEqual(201, response.status_code)
+        self.assertEqual(
+            [f"{hashlib.md5(data).hexdigest()}-test.bin"],
+            [obj.key for obj in s3.Bucket(bucket).objects.all()],
+        )
+
+    def test_complete_with_wrong_md5(self):
+        session_id, _ = self.upload_session()
+
+        response = self.complete_session(session_id, hashlib.md5(b"").hexdigest())
+
+        self.assertEqual(400, response.status_code)
+        self.assertEqual(200, self.get_session(session_id).status_code)
+
+    def test_expired_session(self):
+        session_id = self.create_session()
+
+        with patch.object(
+            StorageManager().get_storage_engine(), "upload_session_ttl", timedelta()
+        ):
+            response = self.get_session(session_id)
+
+        self.assertEqual(404, response.status_code)
+        self.assertEqual([], list(s3.Bucket(bucket).objects.all()))
+
+    def test_expire_upload_sessions(self):
+        storage = StorageManager().get_storage_engine()
+        session_id, _ = self.upload_session()
+        self.create_session()
+
+        with patch.object(storage, "upload_session_ttl", timedelta()):
+            expired = storage.expire_upload_sessions(bucket)
+
+        self.assertEqual(2, len(expired))
+        self.assertIn(session_id, expired)
+        self.assertEqual([], list(s3.Bucket(bucket).objects.all()))
+
+    def test_completion_does_not_read_back_the_upload(self):
+        session_id, _ = self.upload_session()
+
+        with patch(
+            "storage.s3store.S3StorageManager.create_ingest_stream",
+            side_effect=AssertionError("The upload must not be read back"),
+        ):
+            response = self.complete_session(session_id)
+
+        self.assertEqual(201, response.status_code)
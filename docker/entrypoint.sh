@@ -21,6 +21,10 @@ if [ "$APP_ENV" = "dev" ]; then
   export FLASK_DEBUG='1'
   cd ~/api
   exec ~/.local/bin/flask run --host=0.0.0.0
+elif [ "$SERVER_MODE" = "asgi" ]; then
+  echo "Starting gunicorn server with uvicorn workers..."
+  cd ~/api
+  exec ~/.local/bin/gunicorn ${GUNICORN_SSL_CA} -b 0.0.0.0 --timeout 0 -k uvicorn.workers.UvicornWorker "asgi:app"
 else
   echo "Starting gunicorn server..."
   cd ~/api